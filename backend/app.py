@@ -1,13 +1,35 @@
-from flask import Flask, jsonify, request, send_file, send_from_directory
+from flask import Flask, Response, jsonify, request, send_file, send_from_directory, stream_with_context
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, create_refresh_token, jwt_required, get_jwt_identity, get_jwt
 from flask_caching import Cache
-from datetime import datetime, timedelta
+from flask_migrate import Migrate
+from datetime import date, datetime, timedelta
+import csv
+import io
+import json
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from functools import wraps
 import os
+import time
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
 
 from config import Config
-from models import db, init_db, Admin, User, ParkingLot, ParkingSpot, ReserveParkingSpot, ExportJob
+from models import db, init_db, configure_sqlite, Admin, User, ParkingLot, ParkingSpot, ReserveParkingSpot, AdvanceReservation, ExportJob, EmailDelivery, serialize_reservations
+from blocklist import TokenBlocklist
+from lot_cache import INDEX, SEQUENCE, LotCache
+from etags import ChangeVersions, conditional
+from realtime import AvailabilityStream, availability_event, lot_event, lot_deleted_event
+from lot_search import LotSearchIndex
+from reservations import ReservationIndex, parse_time, validate_window
+from tariff import TariffCache, parse_rules
+from instrumentation import Instrumentation
+import exports
+from celery_app import generate_csv_task, reprice_lot_bookings
+import spot_pool
+import stats
+from pagination import encode_cursor, page_args, paginate
 
 app = Flask(__name__, static_folder='../frontend/dist', static_url_path='')
 app.config.from_object(Config)
@@ -16,26 +38,77 @@ CORS(app, resources={r"/api/*": {"origins": "*"}})
 jwt = JWTManager(app)
 cache = Cache(app)
 db.init_app(app)
+migrate = Migrate(app, db, directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'))
 
-import redis
-redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+redis_pool = redis.ConnectionPool.from_url(
+    app.config['REDIS_URL'],
+    max_connections=app.config['REDIS_MAX_CONNECTIONS'],
+    socket_timeout=app.config['REDIS_SOCKET_TIMEOUT'],
+    socket_connect_timeout=app.config['REDIS_SOCKET_TIMEOUT'],
+    # No client-side retries: the blocklist's circuit breaker decides when to try again
+    retry=Retry(NoBackoff(), 0),
+    decode_responses=True
+)
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+token_blocklist = TokenBlocklist(
+    redis_client,
+    cache_size=app.config['JWT_BLOCKLIST_CACHE_SIZE'],
+    cache_ttl=app.config['JWT_BLOCKLIST_CACHE_TTL'],
+    failure_threshold=app.config['JWT_BLOCKLIST_BREAKER_THRESHOLD'],
+    reset_timeout=app.config['JWT_BLOCKLIST_BREAKER_RESET'],
+    fail_closed=app.config['JWT_BLOCKLIST_FAIL_CLOSED']
+)
+
+lot_cache = LotCache(
+    redis_client,
+    channel=app.config['LOT_CACHE_CHANNEL'],
+    local_size=app.config['LOT_CACHE_LOCAL_SIZE'],
+    local_ttl=app.config['LOT_CACHE_LOCAL_TTL'],
+    redis_ttl=app.config['LOT_CACHE_REDIS_TTL']
+)
+change_versions = ChangeVersions(redis_client)
+lot_index = LotSearchIndex(max_age=app.config['LOT_SEARCH_MAX_AGE'])
+reservation_index = ReservationIndex(change_versions, app.config['RESERVATION_WALKIN_BUFFER'])
+tariffs = TariffCache()
+availability_stream = AvailabilityStream(
+    redis_client,
+    channel=app.config['AVAILABILITY_CHANNEL'],
+    heartbeat=app.config['AVAILABILITY_HEARTBEAT']
+)
+
+def bookings_version_key(user_id):
+    return f'users:{user_id}:bookings:version'
 
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload):
-    jti = jwt_payload['jti']
-    try:
-        return redis_client.exists(f"blocklist:{jti}") > 0
-    except:
-        return False
+    return token_blocklist.is_revoked(jwt_payload['jti'], jwt_payload.get('exp'))
 
 def add_token_to_blocklist(jti, expires_in=86400):
-    try:
-        redis_client.setex(f"blocklist:{jti}", expires_in, "revoked")
-    except:
-        pass
+    if not token_blocklist.revoke(jti, expires_in):
+        print(f"Could not record revoked token {jti} in Redis")
 
 with app.app_context():
+    configure_sqlite(
+        db.engine,
+        journal_mode=app.config['SQLITE_JOURNAL_MODE'],
+        synchronous=app.config['SQLITE_SYNCHRONOUS'],
+        busy_timeout_ms=app.config['SQLITE_BUSY_TIMEOUT_MS']
+    )
+
+# Schema changes run once per deploy, not in every worker that imports the app
+@app.cli.command('init-db')
+def init_db_command():
+    """Create or upgrade the database and add the admin user."""
     init_db()
+    print("Database is up to date")
+
+instrumentation = Instrumentation()
+if app.config['INSTRUMENTATION_ENABLED']:
+    instrumentation.add_source('blocklist', token_blocklist.stats)
+    instrumentation.add_source('lot_cache', lot_cache.stats)
+    with app.app_context():
+        instrumentation.init_app(app, db.engine)
 
 def admin_required(fn):
     @wraps(fn)
@@ -57,6 +130,26 @@ def user_required(fn):
         return fn(*args, **kwargs)
     return wrapper
 
+def request_timezone():
+    """?tz= override of Config.APP_TIMEZONE. Raises ValueError for unknown zones."""
+    name = request.args.get('tz') or app.config['APP_TIMEZONE']
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f'Unknown timezone: {name}')
+
+def parse_stats_filters():
+    """Read ?start=&end=&lot_id= filters. Dates are inclusive days in APP_TIMEZONE."""
+    start = request.args.get('start')
+    end = request.args.get('end')
+    try:
+        start_day = date.fromisoformat(start) if start else None
+        end_day = date.fromisoformat(end) if end else None
+    except ValueError:
+        return None, jsonify({'error': 'start and end must be ISO dates (YYYY-MM-DD)'}), 400
+    lot_ids = request.args.getlist('lot_id', type=int) or None
+    return {'start_day': start_day, 'end_day': end_day, 'lot_ids': lot_ids}, None, None
+
 @app.route('/')
 def index():
     return send_from_directory(app.static_folder, 'index.html')
@@ -169,8 +262,9 @@ def register():
 @app.route('/api/auth/logout', methods=['POST'])
 @jwt_required()
 def logout():
-    jti = get_jwt()['jti']
-    add_token_to_blocklist(jti)
+    claims = get_jwt()
+    # Only needs blocking until the token would have expired anyway
+    add_token_to_blocklist(claims['jti'], max(int(claims['exp'] - time.time()), 1))
     return jsonify({'message': 'Successfully logged out'})
 
 @app.route('/api/auth/refresh', methods=['POST'])
@@ -187,35 +281,51 @@ def refresh():
 @app.route('/api/admin/dashboard')
 @admin_required
 def admin_dashboard():
-    total_lots = ParkingLot.query.count()
-    total_spots = ParkingSpot.query.count()
-    available_spots = ParkingSpot.query.filter_by(status='A').count()
-    occupied_spots = ParkingSpot.query.filter_by(status='O').count()
-    total_users = User.query.count()
+    filters, error, status = parse_stats_filters()
+    if error:
+        return error, status
+    try:
+        tz = request_timezone()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    today = datetime.utcnow().date()
-    today_bookings = ReserveParkingSpot.query.filter(
-        db.func.date(ReserveParkingSpot.parking_timestamp) == today
-    ).count()
+    totals = stats.totals(**filters)
+    total_spots = totals['total_spots']
+    occupied_spots = totals['occupied_spots']
+    total_users = User.query.count()
     
-    total_revenue = db.session.query(db.func.sum(ReserveParkingSpot.parking_cost)).scalar() or 0
+    today_start, today_end = stats.today_bounds(tz)
+    today_bookings = stats.booking_count(today_start, today_end, filters['lot_ids'])
     
     return jsonify({
-        'total_lots': total_lots,
+        'total_lots': totals['total_lots'],
         'total_spots': total_spots,
-        'available_spots': available_spots,
+        'available_spots': totals['available_spots'],
         'occupied_spots': occupied_spots,
         'total_users': total_users,
         'today_bookings': today_bookings,
-        'total_revenue': round(total_revenue, 2),
+        'total_bookings': totals['total_bookings'],
+        'total_revenue': totals['total_revenue'],
         'occupancy_rate': round((occupied_spots / total_spots * 100) if total_spots > 0 else 0, 1)
     })
 
 @app.route('/api/admin/users')
 @admin_required
 def get_all_users():
-    users = User.query.all()
-    return jsonify([u.to_dict() for u in users])
+    try:
+        limit, cursor = page_args()
+        after_id = int(cursor[0]) if cursor is not None else None
+    except (ValueError, TypeError, IndexError):
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+    
+    query = User.query.order_by(User.id)
+    if after_id is not None:
+        query = query.filter(User.id > after_id)
+    users, next_cursor = paginate(query, limit, lambda u: (u.id,))
+    return jsonify({
+        'items': [u.to_dict() for u in users],
+        'next_cursor': next_cursor
+    })
 
 @app.route('/api/admin/parking-lots', methods=['GET'])
 @admin_required
@@ -223,34 +333,91 @@ def get_parking_lots_admin():
     lots = ParkingLot.query.all()
     return jsonify([lot.to_dict() for lot in lots])
 
+def lot_from_payload(data):
+    """Build an unsaved ParkingLot from request data. Raises ValueError if invalid."""
+    required = ['prime_location_name', 'price', 'number_of_spots']
+    if not all(data.get(k) not in (None, '') for k in required):
+        raise ValueError('Missing required fields: prime_location_name, price, number_of_spots')
+    try:
+        price = float(data['price'])
+        number_of_spots = int(data['number_of_spots'])
+    except (TypeError, ValueError):
+        raise ValueError('price must be a number and number_of_spots an integer')
+    if price < 0 or number_of_spots < 0:
+        raise ValueError('price and number_of_spots cannot be negative')
+    rules = parse_rules(data.get('tariff'))
+    
+    lot = ParkingLot(
+        prime_location_name=data['prime_location_name'],
+        price=price,
+        address=data.get('address') or 'TBD',
+        pin_code=data.get('pin_code') or 'TBD',
+        number_of_spots=number_of_spots
+    )
+    lot.tariff = json.dumps(rules) if rules else None
+    return lot
+
 @app.route('/api/admin/parking-lots', methods=['POST'])
 @admin_required
 def create_parking_lot():
     data = request.get_json()
     
-    required = ['prime_location_name', 'price', 'number_of_spots']
-    if not all(k in data for k in required):
-        return jsonify({'error': 'Missing required fields: prime_location_name, price, number_of_spots'}), 400
+    try:
+        lot = lot_from_payload(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    lot = ParkingLot(
-        prime_location_name=data['prime_location_name'],
-        price=float(data['price']),
-        address=data.get('address', 'TBD'),
-        pin_code=data.get('pin_code', 'TBD'),
-        number_of_spots=int(data['number_of_spots'])
-    )
     db.session.add(lot)
     db.session.flush()
-    
-    for i in range(int(data['number_of_spots'])):
-        spot = ParkingSpot(lot_id=lot.id, status='A')
-        db.session.add(spot)
+    spot_pool.provision_spots(lot, lot.number_of_spots)
     
     db.session.commit()
-    cache.delete_memoized(get_parking_lots_cached)
+    lot_index.apply(lot_cache.invalidate(index=True), [lot])
+    availability_stream.publish(lot_event(lot))
     
     return jsonify(lot.to_dict()), 201
 
+@app.route('/api/admin/parking-lots/import', methods=['POST'])
+@admin_required
+def import_parking_lots():
+    """Create many lots in one transaction from a JSON body or a CSV/JSON upload."""
+    upload = request.files.get('file')
+    try:
+        if upload is None:
+            rows = request.get_json()
+        elif upload.filename.lower().endswith('.csv'):
+            rows = list(csv.DictReader(io.TextIOWrapper(upload.stream, encoding='utf-8-sig')))
+        else:
+            rows = json.load(upload.stream)
+    except (ValueError, UnicodeDecodeError):
+        return jsonify({'error': 'Could not parse uploaded file'}), 400
+    
+    if isinstance(rows, dict):
+        rows = rows.get('lots')
+    if not isinstance(rows, list) or not rows:
+        return jsonify({'error': 'Expected a non-empty list of parking lots'}), 400
+    
+    lots = []
+    for index, row in enumerate(rows, start=1):
+        try:
+            lots.append(lot_from_payload(row if isinstance(row, dict) else {}))
+        except ValueError as e:
+            return jsonify({'error': f'Row {index}: {e}'}), 400
+    
+    db.session.add_all(lots)
+    db.session.flush()
+    for lot in lots:
+        spot_pool.provision_spots(lot, lot.number_of_spots)
+    
+    db.session.commit()
+    lot_index.apply(lot_cache.invalidate(index=True), lots)
+    availability_stream.publish(*[lot_event(lot) for lot in lots])
+    
+    return jsonify({
+        'message': f'Imported {len(lots)} parking lots',
+        'lots': [lot.to_dict() for lot in lots]
+    }), 201
+
 @app.route('/api/admin/parking-lots/<int:lot_id>', methods=['PUT'])
 @admin_required
 def update_parking_lot(lot_id):
@@ -265,63 +432,104 @@ def update_parking_lot(lot_id):
         lot.address = data['address']
     if 'pin_code' in data:
         lot.pin_code = data['pin_code']
+    if 'tariff' in data:
+        try:
+            rules = parse_rules(data['tariff'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        lot.tariff = json.dumps(rules) if rules else None
     if 'number_of_spots' in data:
         new_count = int(data['number_of_spots'])
-        current_count = len(lot.parking_spots)
+        current_count = lot.available_spots + lot.occupied_spots
         
         if new_count > current_count:
-            for i in range(new_count - current_count):
-                spot = ParkingSpot(lot_id=lot.id, status='A')
-                db.session.add(spot)
+            spot_pool.provision_spots(lot, new_count - current_count)
         elif new_count < current_count:
-            available_spots = ParkingSpot.query.filter_by(lot_id=lot.id, status='A').limit(current_count - new_count).all()
-            if len(available_spots) < current_count - new_count:
-                return jsonify({'error': 'Cannot reduce spots: some are occupied'}), 400
-            for spot in available_spots:
-                db.session.delete(spot)
+            removed = spot_pool.deprovision_spots(lot, current_count - new_count)
+            if removed < current_count - new_count:
+                db.session.rollback()
+                return jsonify({'error': 'Cannot reduce spots: some are occupied or have booking history'}), 400
         
         lot.number_of_spots = new_count
     
     db.session.commit()
-    cache.delete_memoized(get_parking_lots_cached)
+    tariffs.invalidate(lot.id)
+    # Lot names also appear in booking history, which is versioned by the id list
+    lot_index.apply(lot_cache.invalidate([lot.id], index=True), [lot])
+    availability_stream.publish(lot_event(lot))
     
     return jsonify(lot.to_dict())
 
+@app.route('/api/admin/parking-lots/<int:lot_id>/reprice', methods=['POST'])
+@admin_required
+def reprice_parking_lot(lot_id):
+    """Recompute the cost of the lot's closed, unpaid bookings with its current tariff.
+
+    Optional {"since": ISO 8601} limits it to bookings parked from then on.
+    """
+    ParkingLot.query.get_or_404(lot_id)
+    since = (request.get_json(silent=True) or {}).get('since')
+    try:
+        since = parse_time(since).isoformat() if since else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'since must be an ISO 8601 time'}), 400
+    
+    try:
+        task = reprice_lot_bookings.apply_async((lot_id, since), retry=False)
+    except Exception as e:
+        print(f"Reprice dispatch error: {str(e)}")
+        return jsonify({'error': 'Background jobs are unavailable'}), 503
+    
+    return jsonify({'message': 'Repricing started', 'task_id': task.id}), 202
+
 @app.route('/api/admin/parking-lots/<int:lot_id>', methods=['DELETE'])
 @admin_required
 def delete_parking_lot(lot_id):
     lot = ParkingLot.query.get_or_404(lot_id)
     
-    occupied = ParkingSpot.query.filter_by(lot_id=lot_id, status='O').count()
-    if occupied > 0:
+    if lot.occupied_spots > 0:
         return jsonify({'error': 'Cannot delete lot: some spots are occupied'}), 400
+    if AdvanceReservation.query.filter(
+        AdvanceReservation.lot_id == lot_id,
+        AdvanceReservation.status == 'booked',
+        AdvanceReservation.end_time > datetime.utcnow()
+    ).first():
+        return jsonify({'error': 'Cannot delete lot: it has upcoming reservations'}), 400
     
     db.session.delete(lot)
     db.session.commit()
-    cache.delete_memoized(get_parking_lots_cached)
+    lot_index.apply(lot_cache.invalidate([lot_id], index=True), removed_ids=[lot_id])
+    availability_stream.publish(lot_deleted_event(lot_id))
     
     return jsonify({'message': 'Parking lot deleted successfully'})
 
 @app.route('/api/admin/parking-lots/<int:lot_id>/spots')
 @admin_required
+@conditional(lambda lot_id: change_versions.tag('spots', [lot_cache.version_key(lot_id)]), private=True)
 def get_lot_spots_admin(lot_id):
     lot = ParkingLot.query.get_or_404(lot_id)
-    spots = ParkingSpot.query.filter_by(lot_id=lot_id).all()
+    rows = db.session.query(ParkingSpot, ReserveParkingSpot, User).outerjoin(
+        ReserveParkingSpot, db.and_(
+            ReserveParkingSpot.spot_id == ParkingSpot.id,
+            ReserveParkingSpot.leaving_timestamp.is_(None)
+        )
+    ).outerjoin(
+        User, ReserveParkingSpot.user_id == User.id
+    ).filter(ParkingSpot.lot_id == lot_id).order_by(ParkingSpot.id, ReserveParkingSpot.id)
     
     result = []
-    for spot in spots:
+    seen = set()
+    for spot, active_reservation, user in rows:
+        if spot.id in seen:
+            continue
+        seen.add(spot.id)
         spot_data = spot.to_dict()
-        if spot.status == 'O':
-            active_reservation = ReserveParkingSpot.query.filter_by(
-                spot_id=spot.id, leaving_timestamp=None
-            ).first()
-            if active_reservation:
-                user = User.query.get(active_reservation.user_id)
-                spot_data['reservation'] = {
-                    'user': user.full_name or user.username,
-                    'vehicle_number': active_reservation.vehicle_number,
-                    'parking_since': active_reservation.parking_timestamp.isoformat()
-                }
+        if spot.status == 'O' and active_reservation and user:
+            spot_data['reservation'] = {
+                'user': user.full_name or user.username,
+                'vehicle_number': active_reservation.vehicle_number,
+                'parking_since': active_reservation.parking_timestamp.isoformat()
+            }
         result.append(spot_data)
     
     return jsonify({
@@ -332,42 +540,102 @@ def get_lot_spots_admin(lot_id):
 @app.route('/api/admin/stats/summary')
 @admin_required
 def admin_stats_summary():
-    from sqlalchemy import func
-    
-    lots = ParkingLot.query.all()
-    lot_stats = []
-    for lot in lots:
-        bookings = db.session.query(func.count(ReserveParkingSpot.id)).join(
-            ParkingSpot, ReserveParkingSpot.spot_id == ParkingSpot.id
-        ).filter(ParkingSpot.lot_id == lot.id).scalar()
-        
-        revenue = db.session.query(func.sum(ReserveParkingSpot.parking_cost)).join(
-            ParkingSpot, ReserveParkingSpot.spot_id == ParkingSpot.id
-        ).filter(ParkingSpot.lot_id == lot.id).scalar() or 0
-        
-        lot_stats.append({
-            'name': lot.prime_location_name,
-            'total_bookings': bookings,
-            'revenue': round(revenue, 2),
-            'available': ParkingSpot.query.filter_by(lot_id=lot.id, status='A').count(),
-            'occupied': ParkingSpot.query.filter_by(lot_id=lot.id, status='O').count()
-        })
+    filters, error, status = parse_stats_filters()
+    if error:
+        return error, status
     
-    return jsonify({'lot_stats': lot_stats})
+    return jsonify({'lot_stats': stats.lot_summary(**filters)})
 
-@cache.memoize(timeout=60)
-def get_parking_lots_cached():
-    lots = ParkingLot.query.all()
-    return [lot.to_dict() for lot in lots]
+@app.route('/api/admin/metrics/blocklist')
+@admin_required
+def blocklist_metrics():
+    """Token blocklist cache hit/miss, Redis latency and circuit breaker state for this process."""
+    return jsonify(token_blocklist.stats())
+
+@app.route('/api/admin/metrics/lot-cache')
+@admin_required
+def lot_cache_metrics():
+    """Public lot cache hits per tier, database loads and invalidations for this process."""
+    return jsonify(lot_cache.stats())
+
+@cache.memoize(timeout=300)
+def get_user_stats_cached(user_id):
+    return stats.user_summary(user_id)
 
 @app.route('/api/parking-lots')
+@conditional(lambda: change_versions.tag('lots', [lot_cache.version_key(SEQUENCE)]))
 def get_parking_lots():
-    return jsonify(get_parking_lots_cached())
+    return jsonify(lot_cache.list_lots())
+
+@app.route('/api/parking-lots/search')
+def search_parking_lots():
+    """Find lots by ?q= (word prefixes of name and address), ?pin_code= (with
+    ?nearby=1, anywhere in its sorting district), ?min_price=, ?max_price= and
+    ?available=1. Best matches first, paged with ?limit=&cursor=."""
+    try:
+        limit, cursor = page_args()
+        start = int(cursor[0]) if cursor else 0
+        min_price = request.args.get('min_price')
+        max_price = request.args.get('max_price')
+        min_price = float(min_price) if min_price not in (None, '') else None
+        max_price = float(max_price) if max_price not in (None, '') else None
+    except (ValueError, TypeError, IndexError):
+        return jsonify({'error': 'Invalid limit, cursor or price range'}), 400
+    available_only = request.args.get('available', '').lower() in ('1', 'true')
+    
+    lot_index.sync(lot_cache.index_version())
+    ids = lot_index.search(
+        request.args.get('q', ''),
+        pin_code=request.args.get('pin_code') or None,
+        nearby=request.args.get('nearby', '').lower() in ('1', 'true'),
+        min_price=min_price,
+        max_price=max_price
+    )
+    
+    # Availability isn't indexed: check it on the cached lots, a page's worth at a time
+    items = []
+    position = start
+    while position < len(ids) and len(items) < limit:
+        chunk = ids[position:position + limit]
+        lots = lot_cache.get_lots(chunk)
+        for lot_id in chunk:
+            position += 1
+            lot = lots.get(lot_id)
+            if lot and (not available_only or lot['available_spots'] > 0):
+                items.append(lot)
+                if len(items) == limit:
+                    break
+    
+    return jsonify({
+        'items': items,
+        'next_cursor': encode_cursor(position) if position < len(ids) else None
+    })
 
 @app.route('/api/parking-lots/<int:lot_id>')
+@conditional(lambda lot_id: change_versions.tag('lot', [lot_cache.version_key(lot_id)]))
 def get_parking_lot_detail(lot_id):
-    lot = ParkingLot.query.get_or_404(lot_id)
-    return jsonify(lot.to_dict())
+    lot = lot_cache.get_lot(lot_id)
+    if lot is None:
+        return jsonify({'error': 'Parking lot not found'}), 404
+    return jsonify(lot)
+
+def active_lot_ids(user_id):
+    return [lot_id for (lot_id,) in db.session.query(ParkingSpot.lot_id).join(
+        ReserveParkingSpot, ReserveParkingSpot.spot_id == ParkingSpot.id
+    ).filter(
+        ReserveParkingSpot.user_id == user_id,
+        ReserveParkingSpot.leaving_timestamp.is_(None)
+    ).distinct()]
+
+@app.route('/api/stream/availability')
+def stream_availability():
+    """Server-sent lot events; repeat ?lot_id= to only follow some lots."""
+    lot_ids = set(request.args.getlist('lot_id', type=int))
+    return Response(
+        availability_stream.events(lot_ids or None),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/api/user/profile')
 @user_required
@@ -397,6 +665,9 @@ def update_user_profile():
         user.pin_code = data['pin_code']
     
     db.session.commit()
+    if 'full_name' in data:
+        # Shown against the user's spot in the admin spots view
+        lot_cache.invalidate(active_lot_ids(user.id))
     return jsonify(user.to_dict())
 
 @app.route('/api/user/bookings', methods=['GET'])
@@ -406,7 +677,32 @@ def get_user_bookings():
     active = ReserveParkingSpot.query.filter_by(
         user_id=int(user_id), leaving_timestamp=None
     ).all()
-    return jsonify([b.to_dict() for b in active])
+    return jsonify(serialize_reservations(active))
+
+def start_parking(user_id, lot, vehicle_number, now=None, preferred=(), avoid=(), fallback=()):
+    """Claim a spot (see spot_pool.allocate_spot for the options) and open a booking on it.
+
+    Returns (booking, spot), or None when no spot could be claimed. The
+    caller commits and then calls occupancy_changed().
+    """
+    spot = spot_pool.allocate_spot(lot.id, vehicle_number, preferred, avoid, fallback)
+    if not spot:
+        return None
+    booking = ReserveParkingSpot(
+        spot_id=spot.id,
+        user_id=int(user_id),
+        parking_timestamp=now or datetime.utcnow(),
+        vehicle_number=vehicle_number
+    )
+    db.session.add(booking)
+    return booking, spot
+
+def occupancy_changed(user_id, lot):
+    """Refresh caches and notify clients after a committed book or release."""
+    lot_cache.invalidate([lot.id])
+    availability_stream.publish(availability_event(lot))
+    change_versions.bump([bookings_version_key(user_id)])
+    cache.delete_memoized(get_user_stats_cached, int(user_id))
 
 @app.route('/api/user/bookings', methods=['POST'])
 @user_required
@@ -426,32 +722,24 @@ def book_spot():
         return jsonify({'error': 'You already have an active booking'}), 400
     
     lot = ParkingLot.query.get_or_404(lot_id)
-    available_spot = ParkingSpot.query.filter_by(lot_id=lot_id, status='A').first()
-    
-    if not available_spot:
-        return jsonify({'error': 'No available spots in this parking lot'}), 400
     
     user = User.query.get(int(user_id))
     if not vehicle_number:
         vehicle_number = user.vehicle_number
     
-    available_spot.status = 'O'
-    available_spot.vehicle_number = vehicle_number
-    
-    reservation = ReserveParkingSpot(
-        spot_id=available_spot.id,
-        user_id=int(user_id),
-        parking_timestamp=datetime.utcnow(),
-        vehicle_number=vehicle_number
-    )
-    db.session.add(reservation)
+    # Steer clear of spots someone has reserved for the next while
+    now = datetime.utcnow()
+    avoid, fallback = reservation_index.walkin_plan(lot.id, now)
+    parked = start_parking(user_id, lot, vehicle_number, now, avoid=avoid, fallback=fallback)
+    if not parked:
+        return jsonify({'error': 'No available spots in this parking lot'}), 400
+    reservation, available_spot = parked
     db.session.commit()
-    
-    cache.delete_memoized(get_parking_lots_cached)
+    occupancy_changed(user_id, lot)
     
     return jsonify({
         'message': 'Spot booked successfully',
-        'booking': reservation.to_dict(),
+        'booking': reservation.to_dict(available_spot),
         'spot': available_spot.to_dict()
     }), 201
 
@@ -466,152 +754,372 @@ def release_spot(booking_id):
     spot = ParkingSpot.query.get(reservation.spot_id)
     lot = ParkingLot.query.get(spot.lot_id)
     
-    reservation.leaving_timestamp = datetime.utcnow()
-    duration_hours = (reservation.leaving_timestamp - reservation.parking_timestamp).total_seconds() / 3600
-    reservation.parking_cost = round(duration_hours * lot.price, 2)
+    leaving_timestamp = datetime.utcnow()
+    duration_hours = (leaving_timestamp - reservation.parking_timestamp).total_seconds() / 3600
+    cost = tariffs.get(lot).cost(reservation.parking_timestamp, leaving_timestamp, stats.app_timezone())
     
-    spot.status = 'A'
-    spot.vehicle_number = None
+    # A concurrent release of the same booking loses here and changes nothing
+    if not spot_pool.release_spot(reservation, spot, leaving_timestamp, cost):
+        db.session.rollback()
+        return jsonify({'error': 'Booking already released'}), 409
+    stats.record_closed_booking(reservation, lot.id)
     
     db.session.commit()
-    cache.delete_memoized(get_parking_lots_cached)
+    occupancy_changed(user_id, lot)
     
     return jsonify({
         'message': 'Spot released successfully',
-        'booking': reservation.to_dict(),
+        'booking': reservation.to_dict(spot),
         'duration_hours': round(duration_hours, 2),
         'cost': reservation.parking_cost
     })
 
+@app.route('/api/parking-lots/<int:lot_id>/availability')
+def get_lot_availability(lot_id):
+    """How many spots in the lot are free for the whole ?start=&end= window (ISO 8601)."""
+    now = datetime.utcnow()
+    try:
+        start, end = parse_time(request.args['start']), parse_time(request.args['end'])
+    except KeyError:
+        return jsonify({'error': 'start and end are required'}), 400
+    except ValueError:
+        return jsonify({'error': 'start and end must be ISO 8601 date-times'}), 400
+    try:
+        validate_window(start, end, now, app.config['RESERVATION_MAX_DURATION'], app.config['RESERVATION_MAX_AHEAD'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    lot = lot_cache.get_lot(lot_id)
+    if lot is None:
+        return jsonify({'error': 'Parking lot not found'}), 404
+    
+    return jsonify({
+        'lot_id': lot_id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'free_spots': reservation_index.count_free(lot_id, lot['number_of_spots'], start, end, now),
+        'number_of_spots': lot['number_of_spots']
+    })
+
+@app.route('/api/user/reservations')
+@user_required
+def get_user_reservations():
+    """The user's upcoming advance reservations, soonest first."""
+    reservations = AdvanceReservation.query.filter(
+        AdvanceReservation.user_id == int(get_jwt_identity()),
+        AdvanceReservation.status == 'booked',
+        AdvanceReservation.end_time > datetime.utcnow()
+    ).order_by(AdvanceReservation.start_time).all()
+    return jsonify([r.to_dict() for r in reservations])
+
+@app.route('/api/user/reservations', methods=['POST'])
+@user_required
+def create_reservation():
+    """Reserve a spot in a lot for a future start_time/end_time window."""
+    user_id = int(get_jwt_identity())
+    data = request.get_json() or {}
+    now = datetime.utcnow()
+    if any(data.get(field) in (None, '') for field in ('lot_id', 'start_time', 'end_time')):
+        return jsonify({'error': 'lot_id, start_time and end_time are required'}), 400
+    try:
+        lot_id = int(data['lot_id'])
+    except (ValueError, TypeError):
+        return jsonify({'error': 'lot_id must be an integer'}), 400
+    try:
+        start, end = parse_time(data['start_time']), parse_time(data['end_time'])
+    except (ValueError, TypeError):
+        return jsonify({'error': 'start_time and end_time must be ISO 8601 date-times'}), 400
+    try:
+        validate_window(start, end, now, app.config['RESERVATION_MAX_DURATION'], app.config['RESERVATION_MAX_AHEAD'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    lot = ParkingLot.query.get_or_404(lot_id)
+    overlapping = AdvanceReservation.query.filter(
+        AdvanceReservation.user_id == user_id,
+        AdvanceReservation.status == 'booked',
+        AdvanceReservation.start_time < end,
+        AdvanceReservation.end_time > start
+    ).first()
+    if overlapping:
+        return jsonify({'error': 'You already have a reservation during that time'}), 400
+    
+    vehicle_number = data.get('vehicle_number') or User.query.get(user_id).vehicle_number
+    reservation = reservation_index.create(user_id, lot.id, start, end, vehicle_number, now)
+    if not reservation:
+        db.session.rollback()
+        return jsonify({'error': 'No spot in this parking lot is free for that whole window'}), 409
+    db.session.commit()
+    reservation_index.changed(lot.id)
+    
+    return jsonify(reservation.to_dict()), 201
+
+@app.route('/api/user/reservations/<int:reservation_id>/cancel', methods=['POST'])
+@user_required
+def cancel_reservation(reservation_id):
+    reservation = AdvanceReservation.query.filter_by(
+        id=reservation_id, user_id=int(get_jwt_identity()), status='booked'
+    ).first_or_404()
+    reservation.status = 'cancelled'
+    db.session.commit()
+    reservation_index.changed(reservation.lot_id)
+    
+    return jsonify(reservation.to_dict())
+
+@app.route('/api/user/reservations/<int:reservation_id>/check-in', methods=['POST'])
+@user_required
+def check_in_reservation(reservation_id):
+    """Start parking on a reservation, on its reserved spot if that is free."""
+    user_id = int(get_jwt_identity())
+    advance = AdvanceReservation.query.filter_by(
+        id=reservation_id, user_id=user_id, status='booked'
+    ).first_or_404()
+    
+    now = datetime.utcnow()
+    if not advance.start_time - app.config['RESERVATION_CHECKIN_EARLY'] <= now < advance.end_time:
+        return jsonify({'error': 'Check-in is only possible during the reserved window'}), 400
+    if ReserveParkingSpot.query.filter_by(user_id=user_id, leaving_timestamp=None).first():
+        return jsonify({'error': 'You already have an active booking'}), 400
+    
+    # If whoever parked there before hasn't left, any spot not promised to someone else will do
+    lot = ParkingLot.query.get_or_404(advance.lot_id)
+    avoid, fallback = reservation_index.walkin_plan(lot.id, now)
+    parked = start_parking(
+        user_id, lot, advance.vehicle_number, now,
+        preferred=[advance.spot_id], avoid=avoid, fallback=fallback
+    )
+    if not parked:
+        return jsonify({'error': 'No spot is free in this parking lot right now'}), 409
+    booking, spot = parked
+    db.session.flush()
+    advance.status = 'checked_in'
+    advance.booking_id = booking.id
+    db.session.commit()
+    occupancy_changed(user_id, lot)
+    reservation_index.changed(lot.id)
+    
+    return jsonify({
+        'message': 'Checked in successfully',
+        'reservation': advance.to_dict(),
+        'booking': booking.to_dict(spot),
+        'spot': spot.to_dict()
+    }), 201
+
 @app.route('/api/user/bookings/history')
 @user_required
+@conditional(lambda: change_versions.tag('history', [
+    bookings_version_key(get_jwt_identity()), lot_cache.version_key(INDEX)
+]), private=True)
 def get_booking_history():
     user_id = get_jwt_identity()
-    bookings = ReserveParkingSpot.query.filter_by(user_id=int(user_id)).order_by(
-        ReserveParkingSpot.parking_timestamp.desc()
-    ).all()
-    return jsonify([b.to_dict() for b in bookings])
+    try:
+        limit, cursor = page_args()
+        if cursor:
+            cursor_ts, cursor_id = datetime.fromisoformat(cursor[0]), int(cursor[1])
+    except (ValueError, TypeError, IndexError):
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+    
+    query = ReserveParkingSpot.query.filter_by(user_id=int(user_id)).order_by(
+        ReserveParkingSpot.parking_timestamp.desc(), ReserveParkingSpot.id.desc()
+    )
+    if cursor:
+        query = query.filter(db.or_(
+            ReserveParkingSpot.parking_timestamp < cursor_ts,
+            db.and_(ReserveParkingSpot.parking_timestamp == cursor_ts, ReserveParkingSpot.id < cursor_id)
+        ))
+    bookings, next_cursor = paginate(
+        query, limit, lambda b: (b.parking_timestamp.isoformat(), b.id)
+    )
+    return jsonify({
+        'items': serialize_reservations(bookings),
+        'next_cursor': next_cursor
+    })
 
 @app.route('/api/user/stats/summary')
 @user_required
 def user_stats_summary():
     user_id = get_jwt_identity()
-    from sqlalchemy import func
-    
-    bookings = ReserveParkingSpot.query.filter_by(user_id=int(user_id)).all()
-    
-    total_bookings = len(bookings)
-    total_spent = sum(b.parking_cost or 0 for b in bookings)
-    total_hours = 0
-    lot_usage = {}
-    
-    for b in bookings:
-        if b.leaving_timestamp:
-            hours = (b.leaving_timestamp - b.parking_timestamp).total_seconds() / 3600
-        else:
-            hours = (datetime.utcnow() - b.parking_timestamp).total_seconds() / 3600
-        total_hours += hours
-        
-        spot = ParkingSpot.query.get(b.spot_id)
-        if spot:
-            lot = ParkingLot.query.get(spot.lot_id)
-            if lot:
-                lot_usage[lot.prime_location_name] = lot_usage.get(lot.prime_location_name, 0) + 1
+    summary = get_user_stats_cached(int(user_id))
     
-    active_bookings = len([b for b in bookings if not b.leaving_timestamp])
+    now = datetime.utcnow()
+    active_hours = sum((now - ts).total_seconds() / 3600 for ts in summary['active_since'])
     
     return jsonify({
-        'total_bookings': total_bookings,
-        'active_bookings': active_bookings,
-        'completed_bookings': total_bookings - active_bookings,
-        'total_spent': round(total_spent, 2),
-        'total_hours': round(total_hours, 2),
-        'lot_usage': lot_usage
+        'total_bookings': summary['total_bookings'],
+        'active_bookings': len(summary['active_since']),
+        'completed_bookings': summary['completed_bookings'],
+        'total_spent': round(summary['total_spent'], 2),
+        'total_hours': round(summary['closed_hours'] + active_hours, 2),
+        'lot_usage': summary['lot_usage']
     })
 
-@app.route('/api/user/export', methods=['POST'])
-@user_required
-def trigger_export():
-    import csv
+def export_format(formats=None):
+    """Requested export format from the JSON body or ?format=. Raises ValueError."""
+    formats = formats or exports.available_formats()
+    data = request.get_json(silent=True) or {}
+    fmt = data.get('format') or request.args.get('format') or 'csv'
+    if fmt not in formats:
+        raise ValueError(f"Unsupported format '{fmt}'. Choose one of: {', '.join(formats)}")
+    return fmt
+
+def export_fingerprint(user_id, scope):
+    """exports.history_fingerprint plus the counters lot renames and booking edits bump.
+
+    None when Redis can't give the counters; such jobs are never reused.
+    """
+    keys = [lot_cache.version_key(INDEX)]
+    if scope == 'user':
+        keys.append(bookings_version_key(user_id))
+    versions = change_versions.tag('export', keys)
+    if versions is None:
+        return None
+    return exports.history_fingerprint(user_id if scope == 'user' else None, versions)
+
+def queue_export(user_id, scope):
+    """Create and dispatch an export job, or return the matching one already in flight."""
+    try:
+        fmt = export_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    user_id = get_jwt_identity()
+    owned = ExportJob.query.filter_by(user_id=user_id, scope=scope)
+    active = owned.filter(ExportJob.status.in_(ExportJob.ACTIVE_STATUSES))
     
-    # Clear old pending/failed jobs for this user
-    ExportJob.query.filter_by(user_id=int(user_id), status='pending').delete()
-    ExportJob.query.filter_by(user_id=int(user_id), status='failed').delete()
+    exports.fail_stale_jobs(owned)
+    owned.filter_by(status='failed').delete(synchronize_session=False)
     db.session.commit()
     
-    # Create job record
-    job = ExportJob(user_id=int(user_id), status='pending')
+    # Nothing changed since the last export: hand back the same file
+    fingerprint = export_fingerprint(user_id, scope)
+    job = exports.reusable_job(user_id, scope, fmt, fingerprint)
+    if job:
+        return jsonify({'message': 'Export is up to date', 'job': job.to_dict()}), 200
+    
+    # Repeated clicks reuse the job that is already queued or running
+    job = active.filter_by(format=fmt).order_by(ExportJob.id.desc()).first()
+    if job:
+        return jsonify({'message': 'Export already in progress', 'job': job.to_dict()}), 202
+    
+    if active.count() >= app.config['EXPORT_MAX_ACTIVE_PER_USER']:
+        return jsonify({'error': 'Too many exports in progress'}), 429
+    
+    job = ExportJob(user_id=user_id, scope=scope, format=fmt, fingerprint=fingerprint, status='pending')
     db.session.add(job)
     db.session.commit()
     
     try:
-        # Generate CSV synchronously (immediately)
-        bookings = ReserveParkingSpot.query.filter_by(user_id=int(user_id)).all()
-        
-        export_dir = os.path.join(os.path.dirname(__file__), '..', 'exports')
-        export_dir = os.path.abspath(export_dir)
-        os.makedirs(export_dir, exist_ok=True)
-        
-        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        filename = os.path.join(export_dir, f'parking_history_{user_id}_{timestamp}.csv')
-        
-        with open(filename, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['Booking ID', 'Spot ID', 'Lot Name', 'Vehicle Number', 
-                           'Parking Time', 'Leaving Time', 'Duration (Hours)', 'Cost', 'Remarks'])
-            
-            for b in bookings:
-                spot = ParkingSpot.query.get(b.spot_id)
-                lot = ParkingLot.query.get(spot.lot_id) if spot else None
-                
-                if b.leaving_timestamp:
-                    duration = (b.leaving_timestamp - b.parking_timestamp).total_seconds() / 3600
-                else:
-                    duration = (datetime.utcnow() - b.parking_timestamp).total_seconds() / 3600
-                
-                writer.writerow([
-                    b.id, b.spot_id, lot.prime_location_name if lot else 'N/A',
-                    b.vehicle_number, b.parking_timestamp, b.leaving_timestamp,
-                    round(duration, 2), b.parking_cost, b.remarks
-                ])
-        
-        job.status = 'completed'
-        job.file_path = filename
-        job.completed_at = datetime.utcnow()
-        db.session.add(job)
-        db.session.commit()
-        
-        return jsonify({
-            'message': 'Export completed successfully',
-            'job': job.to_dict()
-        }), 200
-        
+        # Fail fast instead of holding the request while the broker is down
+        generate_csv_task.apply_async((job.id,), retry=False)
     except Exception as e:
+        print(f"Export dispatch error: {str(e)}")
         job.status = 'failed'
-        db.session.add(job)
         db.session.commit()
-        print(f"Export error: {str(e)}")
-        return jsonify({'error': 'Export failed'}), 500
+        return jsonify({'error': 'Export service unavailable'}), 503
+    
+    return jsonify({
+        'message': 'Export started',
+        'job': job.to_dict()
+    }), 202
+
+def export_status(job):
+    """Job status, optionally long-polled.
+
+    With ?wait=N the response is held for up to N seconds (capped at
+    EXPORT_STATUS_MAX_WAIT) until the job's status or progress_rows differs
+    from the ?status=/&rows= the client last saw, or the job finishes.
+    """
+    wait = min(request.args.get('wait', 0, type=float) or 0, app.config['EXPORT_STATUS_MAX_WAIT'])
+    seen = (request.args.get('status', job.status), request.args.get('rows', job.progress_rows, type=int))
+    deadline = time.monotonic() + wait
+    while (job.status in ExportJob.ACTIVE_STATUSES
+           and (job.status, job.progress_rows) == seen
+           and time.monotonic() < deadline):
+        # Ending the transaction hands the connection back to the pool while
+        # we sleep and lets the next read see the worker's commits
+        job_id = job.id
+        db.session.rollback()
+        time.sleep(0.5)
+        job = db.session.get(ExportJob, job_id)
+    
+    return jsonify(job.to_dict())
+
+def send_export(job):
+    if job.completed_at < exports.retention_cutoff():
+        return jsonify({'error': 'Export has expired'}), 410
+    if not job.file_path or not os.path.exists(job.file_path):
+        return jsonify({'error': 'Export file not found'}), 404
+    
+    return send_file(
+        job.file_path,
+        mimetype=exports.FORMATS[job.format][1],
+        as_attachment=True,
+        download_name=exports.download_name(job)
+    )
+
+@app.route('/api/export/formats')
+def get_export_formats():
+    """Export formats this server can write; Parquet only with pyarrow installed."""
+    return jsonify({'formats': exports.available_formats()})
+
+@app.route('/api/user/export', methods=['POST'])
+@user_required
+def trigger_export():
+    return queue_export(int(get_jwt_identity()), 'user')
+
+@app.route('/api/user/export/stream')
+@user_required
+def stream_export():
+    """Stream the booking history straight to the client, batch by batch.
+
+    Supports the row-oriented formats only (?format=csv|csv.gz|jsonl).
+    """
+    try:
+        fmt = export_format(exports.STREAM_FORMATS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    user_id = int(get_jwt_identity())
+    rows = exports.iter_booking_rows(user_id)
+    extension, mimetype = exports.FORMATS[fmt]
+    return Response(
+        stream_with_context(exports.iter_export(fmt, rows)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=parking_history{extension}'}
+    )
 
 @app.route('/api/user/export/<int:job_id>')
 @user_required
 def get_export_status(job_id):
-    user_id = get_jwt_identity()
-    job = ExportJob.query.filter_by(id=job_id, user_id=int(user_id)).first_or_404()
-    return jsonify(job.to_dict())
+    user_id = int(get_jwt_identity())
+    job = ExportJob.query.filter_by(id=job_id, user_id=user_id, scope='user').first_or_404()
+    return export_status(job)
 
 @app.route('/api/user/export/<int:job_id>/download')
 @user_required
 def download_export(job_id):
     user_id = get_jwt_identity()
-    job = ExportJob.query.filter_by(id=job_id, user_id=int(user_id), status='completed').first_or_404()
-    
-    if not job.file_path or not os.path.exists(job.file_path):
-        return jsonify({'error': 'Export file not found'}), 404
-    
-    return send_file(job.file_path, as_attachment=True, download_name=f'parking_history.csv')
+    job = ExportJob.query.filter_by(
+        id=job_id, user_id=int(user_id), scope='user', status='completed'
+    ).first_or_404()
+    return send_export(job)
+
+@app.route('/api/admin/export', methods=['POST'])
+@admin_required
+def trigger_admin_export():
+    """Export every reservation, with user and lot ids, for offline analysis."""
+    return queue_export(None, 'all')
+
+@app.route('/api/admin/export/<int:job_id>')
+@admin_required
+def get_admin_export_status(job_id):
+    job = ExportJob.query.filter_by(id=job_id, scope='all').first_or_404()
+    return export_status(job)
+
+@app.route('/api/admin/export/<int:job_id>/download')
+@admin_required
+def download_admin_export(job_id):
+    job = ExportJob.query.filter_by(id=job_id, scope='all', status='completed').first_or_404()
+    return send_export(job)
 
 @app.route('/api/user/payments', methods=['POST'])
 @user_required
@@ -679,12 +1187,22 @@ def delete_user(user_id):
     if user.id == 1:
         return jsonify({'error': 'Cannot delete admin user'}), 400
     
+    lot_ids = active_lot_ids(user_id)
+    reserved_lot_ids = [lot_id for (lot_id,) in db.session.query(AdvanceReservation.lot_id).filter(
+        AdvanceReservation.user_id == user_id, AdvanceReservation.status == 'booked'
+    ).distinct()]
+    
     # Delete user's bookings first
+    AdvanceReservation.query.filter_by(user_id=user_id).delete()
     ReserveParkingSpot.query.filter_by(user_id=user_id).delete()
+    EmailDelivery.query.filter_by(user_id=user_id).delete()
     
     # Delete user
     db.session.delete(user)
     db.session.commit()
+    lot_cache.invalidate(lot_ids)
+    for lot_id in reserved_lot_ids:
+        reservation_index.changed(lot_id)
     
     return jsonify({'message': 'User deleted successfully'})
 @app.route('/<path:path>')
@@ -695,4 +1213,6 @@ def serve_spa(path):
     return send_from_directory(app.static_folder, 'index.html')
 
 if __name__ == '__main__':
+    with app.app_context():
+        init_db()
     app.run(host='0.0.0.0', port=5001, debug=True)
@@ -0,0 +1,173 @@
+"""Concurrent booking throughput under different database settings.
+
+Each mode gets a fresh database and several worker processes, like
+gunicorn workers sharing one database. Every worker thread loops over
+list lots -> book -> release as its own user, so readers and writers
+contend for the same lot rows. Modes:
+
+    delete  SQLite, rollback journal, synchronous=FULL (the old defaults)
+    wal     SQLite, WAL journal, synchronous=NORMAL (Config defaults)
+    url     whatever DATABASE_URL points at, e.g. PostgreSQL with the
+            DB_POOL_* settings; its tables are dropped and recreated
+
+Usage, from backend/:
+
+    python benchmarks/booking_throughput.py [--modes delete wal url]
+        [--workers 4] [--threads 8] [--seconds 10]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SQLITE_MODES = {
+    'delete': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL'},
+    'wal': {'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL'},
+}
+
+
+def load_app():
+    sys.path.insert(0, BACKEND)
+    # The benchmark measures the database, not Redis-backed caches
+    os.environ.setdefault('CACHE_TYPE', 'SimpleCache')
+    from app import app
+    return app
+
+
+def setup(users, spots):
+    """Create one lot and `users` users; print their access tokens as JSON."""
+    app = load_app()
+    from flask_jwt_extended import create_access_token
+    from sqlalchemy import insert
+    from models import db, init_db, ParkingLot, User
+    import spot_pool
+
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            db.drop_all()
+            db.session.execute(db.text('DROP TABLE IF EXISTS alembic_version'))
+            db.session.commit()
+        init_db()
+        lot = ParkingLot('Benchmark Lot', 10, 'Benchmark Road', '000000', spots)
+        db.session.add(lot)
+        db.session.flush()
+        spot_pool.provision_spots(lot, spots)
+        # One password hash for everyone; hashing is deliberately slow
+        password_hash = User('bench', 'bench').password_hash
+        db.session.execute(insert(User), [
+            {'username': f'bench{index}', 'password_hash': password_hash, 'vehicle_number': f'BENCH{index}'}
+            for index in range(users)
+        ])
+        db.session.commit()
+        ids = [user_id for (user_id,) in db.session.query(User.id).filter(User.username.like('bench%')).order_by(User.id)]
+        tokens = [create_access_token(identity=str(user_id), additional_claims={'role': 'user'}) for user_id in ids]
+        print(json.dumps({'lot_id': lot.id, 'tokens': tokens}))
+
+
+def work(lot_id, tokens, seconds):
+    """Run one thread per token for `seconds`; print request counts as JSON."""
+    app = load_app()
+    deadline = time.perf_counter() + seconds
+    results = []
+
+    def loop(token):
+        client = app.test_client()
+        headers = {'Authorization': 'Bearer ' + token}
+        done = failed = 0
+        while time.perf_counter() < deadline:
+            listed = client.get('/api/parking-lots', headers=headers)
+            # 400 means the lot was full, which is expected with more users than spots
+            booked = client.post('/api/user/bookings', headers=headers, json={'lot_id': lot_id})
+            done += 2
+            failed += (listed.status_code >= 500) + (booked.status_code >= 500)
+            if booked.status_code != 201:
+                continue
+            booking_id = booked.get_json()['booking']['id']
+            released = client.post(f'/api/user/bookings/{booking_id}/release', headers=headers)
+            done += 1
+            failed += released.status_code != 200
+        results.append((done, failed))
+
+    threads = [threading.Thread(target=loop, args=(token,)) for token in tokens]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(json.dumps({
+        'requests': sum(done for done, _ in results),
+        'failed': sum(failed for _, failed in results),
+        'seconds': time.perf_counter() - started
+    }))
+
+
+def child(args, env):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__)] + args,
+        cwd=BACKEND, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    # The app prints while it starts up; the result is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_mode(mode, workers, threads, seconds, spots):
+    env = dict(os.environ)
+    if mode in SQLITE_MODES:
+        path = os.path.join(tempfile.mkdtemp(prefix=f'bench-{mode}-'), 'bench.db')
+        env.update(SQLITE_MODES[mode], DATABASE_URL='sqlite:///' + path)
+    elif not env.get('DATABASE_URL'):
+        print('url: DATABASE_URL is not set, skipping')
+        return None
+
+    setup_result = child(['--setup', '--users', str(workers * threads), '--spots', str(spots)], env)
+    tokens = setup_result['tokens']
+    processes = []
+    for index in range(workers):
+        chunk = tokens[index * threads:(index + 1) * threads]
+        processes.append(subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--work', '--lot', str(setup_result['lot_id']),
+             '--seconds', str(seconds), '--tokens', ','.join(chunk)],
+            cwd=BACKEND, env=env, stdout=subprocess.PIPE, text=True
+        ))
+    results = [json.loads(process.communicate()[0].strip().splitlines()[-1]) for process in processes]
+    requests = sum(result['requests'] for result in results)
+    failed = sum(result['failed'] for result in results)
+    elapsed = max(result['seconds'] for result in results)
+    return requests / elapsed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', default=['delete', 'wal', 'url'], choices=['delete', 'wal', 'url'])
+    parser.add_argument('--workers', type=int, default=4, help='processes sharing the database')
+    parser.add_argument('--threads', type=int, default=8, help='concurrent users per process')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--spots', type=int, default=20, help='spots in the lot; fewer than users means contention')
+    parser.add_argument('--setup', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--work', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--users', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--lot', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--tokens', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.setup:
+        return setup(args.users, args.spots)
+    if args.work:
+        return work(args.lot, args.tokens.split(','), args.seconds)
+
+    print(f'{args.workers} processes x {args.threads} users, {args.seconds:g}s per mode, {args.spots} spots')
+    for mode in args.modes:
+        result = run_mode(mode, args.workers, args.threads, args.seconds, args.spots)
+        if result is not None:
+            rate, failed = result
+            print(f'{mode:>6}: {rate:8.1f} req/s, {failed} failed requests')
+
+
+if __name__ == '__main__':
+    main()
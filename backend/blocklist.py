@@ -0,0 +1,210 @@
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU map whose entries also expire after a per-entry TTL."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CircuitBreaker:
+    """Stop calling a dependency after repeated failures.
+
+    After `threshold` consecutive failures the breaker opens and calls are
+    skipped for `reset_timeout` seconds. Then one trial call is let
+    through (half-open): success closes the breaker, failure opens it
+    again.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+    def abandon(self):
+        """End a call that raised something other than the dependency's own errors.
+
+        It counts as neither success nor failure, but a half-open trial
+        must still end or the breaker would never let another one through.
+        """
+        with self._lock:
+            self._trial_running = False
+
+
+class TokenBlocklist:
+    """Revoked-JWT lookups backed by Redis with a local cache and circuit breaker.
+
+    Answers are cached in-process: "not revoked" for `cache_ttl` seconds
+    (so a logout on another server takes at most that long to apply here)
+    and "revoked" until the token would have expired anyway. While Redis
+    is failing, lookups that miss the cache return `fail_closed` straight
+    away instead of waiting on a socket timeout per request.
+    """
+
+    def __init__(self, client, prefix='blocklist:', cache_size=10000, cache_ttl=30,
+                 failure_threshold=5, reset_timeout=30, fail_closed=False):
+        self.client = client
+        self.prefix = prefix
+        self.fail_closed = fail_closed
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._counters = dict.fromkeys(
+            ('hits', 'misses', 'errors', 'short_circuited', 'redis_calls'), 0
+        )
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _call(self, fn, *args):
+        """Run one Redis command through the breaker; raises redis.RedisError."""
+        start = time.perf_counter()
+        try:
+            result = fn(*args)
+        except redis.RedisError:
+            self.breaker.failure()
+            self._count('errors')
+            raise
+        except BaseException:
+            self.breaker.abandon()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._counters['redis_calls'] += 1
+                self._latency_total += elapsed
+                self._latency_max = max(self._latency_max, elapsed)
+        self.breaker.success()
+        return result
+
+    def is_revoked(self, jti, expires_at=None):
+        cached = self.cache.get(jti, _MISSING)
+        if cached is not _MISSING:
+            self._count('hits')
+            return cached
+        self._count('misses')
+
+        key = self.prefix + jti
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            return self.fail_closed
+        try:
+            revoked = self._call(self.client.exists, key) > 0
+        except redis.RedisError:
+            return self.fail_closed
+
+        ttl = None
+        if revoked and expires_at:
+            ttl = max(expires_at - time.time(), 0)
+        self.cache.set(jti, revoked, ttl)
+        return revoked
+
+    def revoke(self, jti, expires_in):
+        """Block `jti` for `expires_in` seconds. Returns False if Redis didn't take it.
+
+        The local cache is updated either way so this process honours the
+        revocation immediately. While the breaker is open Redis isn't tried.
+        """
+        key = self.prefix + jti
+        self.cache.set(jti, True, expires_in)
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            return False
+        try:
+            self._call(self.client.setex, key, expires_in, 'revoked')
+        except redis.RedisError:
+            return False
+        return True
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            latency_total = self._latency_total
+            latency_max = self._latency_max
+        lookups = counters['hits'] + counters['misses']
+        return {
+            **counters,
+            'hit_ratio': round(counters['hits'] / lookups, 4) if lookups else None,
+            'redis_latency_avg_ms': round(latency_total / counters['redis_calls'] * 1000, 3) if counters['redis_calls'] else None,
+            'redis_latency_max_ms': round(latency_max * 1000, 3),
+            'cache_size': len(self.cache),
+            'breaker_state': self.breaker.state,
+            'fail_closed': self.fail_closed,
+        }
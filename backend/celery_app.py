@@ -24,6 +24,18 @@ def make_celery(app=None):
                 'task': 'celery_app.send_monthly_reports',
                 'schedule': crontab(day_of_month=1, hour=8, minute=0),
             },
+            'reconcile-occupancy': {
+                'task': 'celery_app.reconcile_occupancy_task',
+                'schedule': crontab(hour=3, minute=0),
+            },
+            'rebuild-daily-lot-stats': {
+                'task': 'celery_app.backfill_daily_lot_stats',
+                'schedule': crontab(day_of_week=0, hour=3, minute=30),
+            },
+            'cleanup-exports': {
+                'task': 'celery_app.cleanup_exports_task',
+                'schedule': crontab(minute=15),
+            },
         }
     )
     
@@ -31,216 +43,201 @@ def make_celery(app=None):
 
 celery = make_celery()
 
+REMINDER_KIND = 'daily_reminder'
+
 @celery.task
 def send_daily_reminders():
+    """Queue reminder batches for users who haven't visited in a day.
+
+    Recipients are streamed by id and handed to send_reminder_batch in
+    MAIL_BATCH_SIZE chunks. Users already reminded today are skipped, so a
+    re-run only picks up what is left.
+    """
     import sys
     import os
     sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
     
     from app import app
-    from models import db, User, ParkingLot, ReserveParkingSpot
+    from models import db, User, ParkingLot, EmailDelivery
+    from mailer import mail_configured, iter_chunks
     from datetime import datetime, timedelta
-    import smtplib
-    from email.mime.text import MIMEText
-    from email.mime.multipart import MIMEMultipart
     
     with app.app_context():
-        yesterday = datetime.utcnow() - timedelta(days=1)
+        if not mail_configured():
+            return "Mail credentials not configured"
         
-        users = User.query.filter(
-            (User.last_visit < yesterday) | (User.last_visit == None)
-        ).all()
+        now = datetime.utcnow()
+        yesterday = now - timedelta(days=1)
+        period = now.date().isoformat()
         
-        new_lots = ParkingLot.query.filter(
-            ParkingLot.created_at >= yesterday
-        ).all()
+        new_lots = [
+            (name, price) for name, price in db.session.query(
+                ParkingLot.prime_location_name, ParkingLot.price
+            ).filter(ParkingLot.created_at >= yesterday)
+        ]
         
-        gmail_email = os.environ.get('GMAIL_EMAIL')
-        gmail_password = os.environ.get('GMAIL_PASSWORD')
+        already_sent = db.session.query(EmailDelivery.user_id).filter(
+            EmailDelivery.kind == REMINDER_KIND,
+            EmailDelivery.period == period,
+            EmailDelivery.status == 'sent'
+        )
+        recipients = db.session.query(User.id).filter(
+            (User.last_visit < yesterday) | (User.last_visit == None),
+            User.email.isnot(None),
+            User.email != '',
+            User.id.notin_(already_sent)
+        ).order_by(User.id).yield_per(1000)
         
-        if not gmail_email or not gmail_password:
-            return "Gmail credentials not configured"
+        queued = batches = 0
+        for chunk in iter_chunks((user_id for (user_id,) in recipients), app.config['MAIL_BATCH_SIZE']):
+            send_reminder_batch.delay(chunk, period, new_lots)
+            queued += len(chunk)
+            batches += 1
+        
+        return f"Queued reminders for {queued} users in {batches} batches"
+
+@celery.task
+def send_reminder_batch(user_ids, period, new_lots):
+    """Send one batch of reminders over pooled SMTP sessions.
+
+    A failed recipient is retried on its own with backoff instead of
+    failing the batch.
+    """
+    import sys
+    import os
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    
+    from app import app
+    from models import User
+    from mailer import ensure_deliveries, deliver, reminder_message
+    
+    with app.app_context():
+        ensure_deliveries(user_ids, REMINDER_KIND, period)
+        build = lambda user: reminder_message(user, new_lots)
         
         sent_count = 0
-        try:
-            server = smtplib.SMTP('smtp.gmail.com', 587)
-            server.starttls()
-            server.login(gmail_email, gmail_password)
-            
-            for user in users:
-                if not user.email:
-                    continue
-                
-                message = f"Hello {user.full_name or user.username}!\n\n"
-                message += "We noticed you haven't visited our parking app recently. "
-                
-                if new_lots:
-                    message += f"We have {len(new_lots)} new parking lots available!\n\n"
-                    for lot in new_lots:
-                        message += f"- {lot.prime_location_name}: Rs. {lot.price}/day\n"
-                
-                message += "\nBook a parking spot today at our app!"
-                
-                msg = MIMEMultipart()
-                msg['From'] = gmail_email
-                msg['To'] = user.email
-                msg['Subject'] = 'Daily Parking Reminder - Book Your Spot!'
-                msg.attach(MIMEText(message, 'plain'))
-                
-                server.send_message(msg)
-                sent_count += 1
-                print(f"Reminder sent to {user.email}")
-            
-            server.quit()
-        except Exception as e:
-            print(f"Error sending reminders: {str(e)}")
-            return f"Error: {str(e)}"
+        for user in User.query.filter(User.id.in_(user_ids)).order_by(User.id):
+            sent, retry_in = deliver(user, REMINDER_KIND, period, build)
+            sent_count += sent
+            if retry_in is not None:
+                send_reminder.apply_async((user.id, period, new_lots), countdown=retry_in)
         
-        return f"Sent reminders to {sent_count} users"
+        return f"Sent reminders to {sent_count} of {len(user_ids)} users"
 
 @celery.task
-def send_monthly_reports():
+def send_reminder(user_id, period, new_lots):
     import sys
     import os
     sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
     
     from app import app
-    from models import db, User, ReserveParkingSpot, ParkingSpot, ParkingLot
-    from datetime import datetime
-    import smtplib
-    from email.mime.text import MIMEText
-    from email.mime.multipart import MIMEMultipart
-    from email.mime.base import MIMEBase
-    from email import encoders
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib import colors
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from io import BytesIO
+    from models import db, User
+    from mailer import deliver, reminder_message
     
     with app.app_context():
-        users = User.query.all()
+        user = db.session.get(User, user_id)
+        if not user or not user.email:
+            return
+        sent, retry_in = deliver(user, REMINDER_KIND, period, lambda u: reminder_message(u, new_lots))
+        if retry_in is not None:
+            send_reminder.apply_async((user_id, period, new_lots), countdown=retry_in)
+        print(f"Reminder to {user.email}: {'sent' if sent else 'not sent'}")
+
+@celery.task
+def send_monthly_reports(period=None, after_user=0, sent=0):
+    """Render and email last month's activity reports in parallel.
+
+    Per-user totals are streamed from one grouped query and split into
+    MAIL_BATCH_SIZE batches that run as a chord across the workers. Only
+    MAIL_BATCHES_PER_WAVE batches are read and queued at a time; the
+    chord's callback queues the next wave after the last user covered.
+    Progress is tracked per user in email_deliveries, so running it
+    again for the same period only covers users not yet sent.
+    """
+    import sys
+    import os
+    from itertools import islice
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    
+    from celery import chord
+    from app import app
+    from mailer import mail_configured, iter_chunks
+    from reports import iter_monthly_summaries, previous_month
+    
+    with app.app_context():
+        if not mail_configured():
+            return "Mail credentials not configured"
         
-        gmail_email = os.environ.get('GMAIL_EMAIL')
-        gmail_password = os.environ.get('GMAIL_PASSWORD')
+        period = period or previous_month()
+        summaries = iter_monthly_summaries(period, after_user)
+        try:
+            chunks = list(islice(
+                iter_chunks(summaries, app.config['MAIL_BATCH_SIZE']),
+                app.config['MAIL_BATCHES_PER_WAVE']
+            ))
+        finally:
+            summaries.close()
+        if not chunks:
+            return f"Sent {sent} monthly reports for {period}" if after_user else f"No reports to send for {period}"
         
-        if not gmail_email or not gmail_password:
-            return "Gmail credentials not configured"
+        last_user = chunks[-1][-1]['user_id']
+        chord([send_report_batch.s(period, chunk) for chunk in chunks])(
+            finish_monthly_reports.s(period, last_user, sent)
+        )
+        return f"Queued {len(chunks)} report batches for {period} up to user {last_user}"
+
+@celery.task
+def send_report_batch(period, summaries):
+    import sys
+    import os
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    
+    from app import app
+    from models import User
+    from mailer import ensure_deliveries, deliver
+    from reports import REPORT_KIND, report_message
+    
+    with app.app_context():
+        by_user = {summary['user_id']: summary for summary in summaries}
+        ensure_deliveries(list(by_user), REPORT_KIND, period)
         
         sent_count = 0
-        try:
-            server = smtplib.SMTP('smtp.gmail.com', 587)
-            server.starttls()
-            server.login(gmail_email, gmail_password)
-            
-            for user in users:
-                if not user.email:
-                    continue
-                
-                now = datetime.utcnow()
-                first_of_month = datetime(now.year, now.month, 1)
-                
-                bookings = ReserveParkingSpot.query.filter(
-                    ReserveParkingSpot.user_id == user.id,
-                    ReserveParkingSpot.parking_timestamp >= first_of_month
-                ).all()
-                
-                if not bookings:
-                    continue
-                
-                total_spent = sum(b.parking_cost or 0 for b in bookings)
-                total_bookings = len(bookings)
-                total_hours = 0
-                
-                lot_usage = {}
-                for b in bookings:
-                    spot = ParkingSpot.query.get(b.spot_id)
-                    if spot:
-                        lot = ParkingLot.query.get(spot.lot_id)
-                        if lot:
-                            lot_usage[lot.prime_location_name] = lot_usage.get(lot.prime_location_name, 0) + 1
-                    if b.leaving_timestamp:
-                        hours = (b.leaving_timestamp - b.parking_timestamp).total_seconds() / 3600
-                    else:
-                        hours = (now - b.parking_timestamp).total_seconds() / 3600
-                    total_hours += hours
-                
-                most_used_lot = max(lot_usage, key=lot_usage.get) if lot_usage else 'N/A'
-                
-                pdf_buffer = BytesIO()
-                doc = SimpleDocTemplate(pdf_buffer, pagesize=letter)
-                story = []
-                styles = getSampleStyleSheet()
-                
-                title_style = ParagraphStyle(
-                    'CustomTitle',
-                    parent=styles['Heading1'],
-                    fontSize=24,
-                    textColor=colors.HexColor('#667eea'),
-                    spaceAfter=10,
-                    alignment=1
-                )
-                
-                story.append(Paragraph("Monthly Parking Activity Report", title_style))
-                story.append(Paragraph(now.strftime('%B %Y'), styles['Heading3']))
-                story.append(Spacer(1, 0.3*inch))
-                
-                story.append(Paragraph(f"Dear {user.full_name or user.username},", styles['Normal']))
-                story.append(Spacer(1, 0.2*inch))
-                story.append(Paragraph("Here's your parking activity summary for this month:", styles['Normal']))
-                story.append(Spacer(1, 0.3*inch))
-                
-                data = [
-                    ['Metric', 'Value'],
-                    ['Total Bookings', str(total_bookings)],
-                    ['Total Hours Parked', f'{round(total_hours, 2)}h'],
-                    ['Total Amount Spent', f'Rs. {total_spent:.2f}'],
-                    ['Most Used Parking Lot', str(most_used_lot)]
-                ]
-                
-                table = Table(data, colWidths=[3*inch, 2*inch])
-                table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#667eea')),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 12),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black)
-                ]))
-                
-                story.append(table)
-                story.append(Spacer(1, 0.3*inch))
-                story.append(Paragraph("Thank you for using our Vehicle Parking App!", styles['Normal']))
-                
-                doc.build(story)
-                pdf_buffer.seek(0)
-                
-                msg = MIMEMultipart()
-                msg['From'] = gmail_email
-                msg['To'] = user.email
-                msg['Subject'] = f"Monthly Parking Report - {now.strftime('%B %Y')}"
-                
-                msg.attach(MIMEText(f"Hello {user.full_name or user.username},\n\nPlease find attached your monthly parking activity report.\n\nBest regards,\nParking App Team", 'plain'))
-                
-                attachment = MIMEBase('application', 'octet-stream')
-                attachment.set_payload(pdf_buffer.getvalue())
-                encoders.encode_base64(attachment)
-                attachment.add_header('Content-Disposition', f'attachment; filename= parking_report_{now.strftime("%B_%Y")}.pdf')
-                msg.attach(attachment)
-                
-                server.send_message(msg)
-                sent_count += 1
-                print(f"Monthly PDF report sent to {user.email}")
-            
-            server.quit()
-        except Exception as e:
-            print(f"Error sending reports: {str(e)}")
-            return f"Error: {str(e)}"
+        for user in User.query.filter(User.id.in_(by_user)).order_by(User.id):
+            summary = by_user[user.id]
+            sent, retry_in = deliver(user, REPORT_KIND, period, lambda u: report_message(u, summary, period))
+            sent_count += sent
+            if retry_in is not None:
+                send_report.apply_async((user.id, period, summary), countdown=retry_in)
         
-        return f"Sent reports to {sent_count} users"
+        return sent_count
+
+@celery.task
+def send_report(user_id, period, summary):
+    import sys
+    import os
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    
+    from app import app
+    from models import db, User
+    from mailer import deliver
+    from reports import REPORT_KIND, report_message
+    
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        if not user or not user.email:
+            return
+        sent, retry_in = deliver(user, REPORT_KIND, period, lambda u: report_message(u, summary, period))
+        if retry_in is not None:
+            send_report.apply_async((user_id, period, summary), countdown=retry_in)
+        print(f"Monthly report to {user.email}: {'sent' if sent else 'not sent'}")
+
+@celery.task
+def finish_monthly_reports(sent_counts, period, after_user=None, sent=0):
+    sent += sum(sent_counts)
+    if after_user is None:
+        return f"Sent {sent} monthly reports for {period}"
+    send_monthly_reports.delay(period, after_user, sent)
+    return f"Sent {sent} monthly reports for {period} so far"
 
 @celery.task
 def generate_csv_task(job_id):
@@ -249,66 +246,97 @@ def generate_csv_task(job_id):
     sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
     
     from app import app
-    from models import db, ExportJob, ReserveParkingSpot, ParkingSpot, ParkingLot
-    from datetime import datetime
-    import csv
+    from models import db, ExportJob
+    from exports import run_export_job
     
     with app.app_context():
+        job = db.session.get(ExportJob, job_id)
+        if not job:
+            print(f"Job {job_id} not found")
+            return
+        if job.status != 'pending':
+            # Redelivered or already picked up by another worker
+            print(f"Job {job_id} is {job.status}, skipping")
+            return
+        
+        # Kept under its original name so queued messages still resolve;
+        # it runs every export format and scope
+        print(f"Starting {job.format} export for job {job_id} ({job.scope})")
         try:
-            job = ExportJob.query.get(job_id)
-            if not job:
-                print(f"Job {job_id} not found")
-                return
-            
-            print(f"Starting export for job {job_id}")
-            bookings = ReserveParkingSpot.query.filter_by(user_id=job.user_id).all()
-            
-            # Use absolute path
-            export_dir = os.path.join(os.path.dirname(__file__), '..', 'exports')
-            export_dir = os.path.abspath(export_dir)
-            os.makedirs(export_dir, exist_ok=True)
-            
-            timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-            filename = os.path.join(export_dir, f'parking_history_{job.user_id}_{timestamp}.csv')
-            
-            with open(filename, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['Booking ID', 'Spot ID', 'Lot Name', 'Vehicle Number', 
-                               'Parking Time', 'Leaving Time', 'Duration (Hours)', 'Cost', 'Remarks'])
-                
-                for b in bookings:
-                    spot = ParkingSpot.query.get(b.spot_id)
-                    lot = ParkingLot.query.get(spot.lot_id) if spot else None
-                    
-                    if b.leaving_timestamp:
-                        duration = (b.leaving_timestamp - b.parking_timestamp).total_seconds() / 3600
-                    else:
-                        duration = (datetime.utcnow() - b.parking_timestamp).total_seconds() / 3600
-                    
-                    writer.writerow([
-                        b.id, b.spot_id, lot.prime_location_name if lot else 'N/A',
-                        b.vehicle_number, b.parking_timestamp, b.leaving_timestamp,
-                        round(duration, 2), b.parking_cost, b.remarks
-                    ])
-            
-            job.status = 'completed'
-            job.file_path = filename
-            job.completed_at = datetime.utcnow()
-            db.session.add(job)
-            db.session.commit()
-            
-            print(f"✅ Export completed for job {job_id}: {filename}")
-            
+            job = run_export_job(job)
         except Exception as e:
             print(f"❌ Export error for job {job_id}: {str(e)}")
             import traceback
             traceback.print_exc()
-            
-            try:
-                job.status = 'failed'
-                db.session.add(job)
-                db.session.commit()
-            except:
-                pass
-            
-            raise e
+            raise
+        
+        print(f"✅ Export completed for job {job_id}: {job.file_path}")
+
+@celery.task
+def reconcile_occupancy_task():
+    import sys
+    import os
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    
+    from app import app, lot_cache, availability_stream
+    from models import db, ParkingLot, reconcile_occupancy
+    
+    with app.app_context():
+        fixed = reconcile_occupancy()
+        if fixed:
+            lot_cache.invalidate([lot_id for (lot_id,) in db.session.query(ParkingLot.id)])
+            availability_stream.publish({'type': 'resync'})
+        return f"Reconciled occupancy counters for {fixed} lots"
+
+@celery.task
+def backfill_daily_lot_stats(lot_ids=None):
+    import sys
+    import os
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    
+    from app import app
+    from stats import rebuild_daily_stats
+    
+    with app.app_context():
+        rows = rebuild_daily_stats(lot_ids)
+        return f"Rebuilt {rows} daily lot stat rows"
+
+@celery.task
+def reprice_lot_bookings(lot_id, since=None):
+    import sys
+    import os
+    import json
+    from datetime import datetime
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    
+    from app import app, cache, change_versions, bookings_version_key, get_user_stats_cached
+    from models import db, ParkingLot
+    from stats import app_timezone, rebuild_daily_stats
+    from tariff import Tariff, reprice_bookings
+    
+    with app.app_context():
+        lot = db.session.get(ParkingLot, lot_id)
+        if lot is None:
+            return f"Parking lot {lot_id} no longer exists"
+        tariff = Tariff(json.loads(lot.tariff) if lot.tariff else None, lot.price)
+        since = datetime.fromisoformat(since) if since else None
+        users = reprice_bookings(tariff, lot_id, app_timezone(), since)
+        # Commits the new costs together with the rollup of the days they touch
+        rebuild_daily_stats([lot_id], since)
+        change_versions.bump([bookings_version_key(user_id) for user_id in users])
+        for user_id in users:
+            cache.delete_memoized(get_user_stats_cached, user_id)
+        return f"Repriced bookings of {len(users)} users in lot {lot_id}"
+
+@celery.task
+def cleanup_exports_task():
+    import sys
+    import os
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    
+    from app import app
+    from exports import cleanup_exports
+    
+    with app.app_context():
+        jobs, files = cleanup_exports()
+        return f"Removed {jobs} expired export jobs and {files} files"
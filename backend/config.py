@@ -1,28 +1,128 @@
 import os
 from datetime import timedelta
 
+def database_url():
+    url = os.environ.get('DATABASE_URL', 'sqlite:///parking.db')
+    # Heroku-style URLs use a scheme SQLAlchemy no longer accepts
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+def engine_options(url):
+    if url.startswith('sqlite'):
+        # SQLite has no server-side pool; WAL and busy_timeout are set per
+        # connection in models.configure_sqlite
+        return {}
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///parking.db'
+    SQLALCHEMY_DATABASE_URI = database_url()
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 15000))
+    
+    # Zone that defines calendar days for dashboard/stat buckets
+    APP_TIMEZONE = os.environ.get('APP_TIMEZONE', 'UTC')
+    
+    PAGE_SIZE_DEFAULT = 50
+    PAGE_SIZE_MAX = 200
+    
+    # Advance reservations: a walk-in is guaranteed a spot this long before its
+    # next reservation, and near-term reservations skip currently occupied spots
+    RESERVATION_WALKIN_BUFFER = timedelta(hours=2)
+    RESERVATION_MAX_DURATION = timedelta(hours=24)
+    RESERVATION_MAX_AHEAD = timedelta(days=30)
+    # How early before its start a reservation can be checked in
+    RESERVATION_CHECKIN_EARLY = timedelta(minutes=15)
+    
+    # Exports run on the Celery worker; these bound what one user can queue
+    EXPORT_MAX_ACTIVE_PER_USER = int(os.environ.get('EXPORT_MAX_ACTIVE_PER_USER', 2))
+    # Pending/running jobs older than this are assumed lost and marked failed
+    EXPORT_JOB_TIMEOUT = timedelta(minutes=int(os.environ.get('EXPORT_JOB_TIMEOUT_MINUTES', 30)))
+    # Completed exports are reused and downloadable for this long, then deleted
+    EXPORT_RETENTION = timedelta(hours=int(os.environ.get('EXPORT_RETENTION_HOURS', 24)))
+    # Upper bound in seconds for ?wait= on the export status endpoint
+    EXPORT_STATUS_MAX_WAIT = 25
+    
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-key-change-in-production')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
     
+    REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 50))
+    # Seconds; short so a dead Redis fails requests fast instead of hanging them
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 0.5))
+    
+    # Seconds a "not revoked" answer is trusted locally before asking Redis again
+    JWT_BLOCKLIST_CACHE_TTL = int(os.environ.get('JWT_BLOCKLIST_CACHE_TTL', 30))
+    JWT_BLOCKLIST_CACHE_SIZE = 10000
+    # Consecutive Redis errors before lookups stop hitting Redis, and for how long
+    JWT_BLOCKLIST_BREAKER_THRESHOLD = 5
+    JWT_BLOCKLIST_BREAKER_RESET = 30
+    # While Redis is unavailable, treat unknown tokens as revoked (True) or valid (False)
+    JWT_BLOCKLIST_FAIL_CLOSED = os.environ.get('JWT_BLOCKLIST_FAIL_CLOSED', 'false').lower() == 'true'
+    
+    # Public lot cache: per-process LRU (entries, seconds) in front of Redis (seconds)
+    LOT_CACHE_LOCAL_SIZE = 1024
+    LOT_CACHE_LOCAL_TTL = int(os.environ.get('LOT_CACHE_LOCAL_TTL', 5))
+    LOT_CACHE_REDIS_TTL = 300
+    LOT_CACHE_CHANNEL = 'lots:invalidate'
+    
+    # Seconds the lot search index is trusted when Redis can't tell whether lots changed
+    LOT_SEARCH_MAX_AGE = 60
+    
+    # Server-sent lot events: Redis channel and seconds between keepalive comments
+    AVAILABILITY_CHANNEL = 'lots:events'
+    AVAILABILITY_HEARTBEAT = 15
+    
+    # Opt-in request instrumentation: Server-Timing headers, per-route latency and
+    # query-count histograms at /api/metrics, and sampled profiles of slow requests.
+    # When off, no hooks are installed at all.
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', 'false').lower() == 'true'
+    # If set, /api/metrics requires "Authorization: Bearer <token>"
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # Requests slower than this are logged, and their profile kept if sampled
+    INSTRUMENTATION_SLOW_MS = int(os.environ.get('INSTRUMENTATION_SLOW_MS', 500))
+    # Fraction of requests run under the profiler (0 disables profiling)
+    INSTRUMENTATION_PROFILE_RATE = float(os.environ.get('INSTRUMENTATION_PROFILE_RATE', 0))
+    # 'cprofile' writes .prof files; 'pyinstrument' writes HTML if it is installed
+    INSTRUMENTATION_PROFILER = os.environ.get('INSTRUMENTATION_PROFILER', 'cprofile')
+    INSTRUMENTATION_PROFILE_DIR = os.environ.get('INSTRUMENTATION_PROFILE_DIR', 'profiles')
+    
     CACHE_TYPE = os.environ.get('CACHE_TYPE', 'RedisCache')
     CACHE_REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
     CACHE_DEFAULT_TIMEOUT = 300
-    CACHE_OPTIONS = {'socket_connect_timeout': 5}
+    CACHE_OPTIONS = {'socket_connect_timeout': 5} if CACHE_TYPE == 'RedisCache' else {}
     
     CELERY_BROKER_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
     CELERY_RESULT_BACKEND = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
     
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
     MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
-    MAIL_USE_TLS = True
-    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
-    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() == 'true'
+    # Set to false to send through an unauthenticated local relay or test server
+    MAIL_REQUIRE_AUTH = os.environ.get('MAIL_REQUIRE_AUTH', 'true').lower() == 'true'
+    MAIL_USERNAME = os.environ.get('MAIL_USERNAME') or os.environ.get('GMAIL_EMAIL')
+    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD') or os.environ.get('GMAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', 'noreply@parkingapp.com')
+    # SMTP sessions kept open per worker process
+    MAIL_POOL_SIZE = int(os.environ.get('MAIL_POOL_SIZE', 4))
+    # Recipients handled by one fan-out subtask
+    MAIL_BATCH_SIZE = int(os.environ.get('MAIL_BATCH_SIZE', 100))
+    # Batches queued per chord; the next wave is read once this one finishes
+    MAIL_BATCHES_PER_WAVE = int(os.environ.get('MAIL_BATCHES_PER_WAVE', 20))
+    # Per-recipient retries back off from MAIL_RETRY_BACKOFF seconds, doubling each time
+    MAIL_MAX_ATTEMPTS = int(os.environ.get('MAIL_MAX_ATTEMPTS', 5))
+    MAIL_RETRY_BACKOFF = int(os.environ.get('MAIL_RETRY_BACKOFF', 60))
     
     GOOGLE_CHAT_WEBHOOK_URL = os.environ.get('GOOGLE_CHAT_WEBHOOK_URL')
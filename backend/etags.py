@@ -0,0 +1,103 @@
+import hashlib
+import uuid
+from functools import wraps
+from urllib.parse import urlencode
+
+import redis
+from flask import current_app, make_response, request
+
+from blocklist import CircuitBreaker
+
+
+class ChangeVersions:
+    """Change counters in Redis that weak ETags are built from.
+
+    Every tag also carries a random epoch stored alongside the counters, so
+    if Redis is flushed and the counters start again from zero, tags
+    handed out before can't match new content.
+    """
+
+    def __init__(self, client, epoch_key='versions:epoch', failure_threshold=5, reset_timeout=30):
+        self.client = client
+        self.epoch_key = epoch_key
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    def _call(self, fn, *args, **kwargs):
+        if not self.breaker.allow():
+            return None
+        try:
+            result = fn(*args, **kwargs)
+        except redis.RedisError:
+            self.breaker.failure()
+            return None
+        except BaseException:
+            self.breaker.abandon()
+            raise
+        self.breaker.success()
+        return result
+
+    def _read(self, keys):
+        epoch, *versions = self.client.mget([self.epoch_key, *keys])
+        if epoch is None:
+            self.client.set(self.epoch_key, uuid.uuid4().hex[:8], nx=True)
+            epoch = self.client.get(self.epoch_key)
+        return epoch, versions
+
+    def tag(self, kind, keys):
+        """ETag value for the counters at `keys`, or None if Redis can't say."""
+        result = self._call(self._read, keys)
+        if result is None:
+            return None
+        epoch, versions = result
+        return f"{kind}-{epoch}-{'.'.join(str(version or 0) for version in versions)}"
+
+    def bump(self, keys):
+        def incr_all():
+            pipe = self.client.pipeline(transaction=False)
+            for key in keys:
+                pipe.incr(key)
+            return pipe.execute()
+        return self._call(incr_all) is not None
+
+
+def query_tag():
+    """Short digest of the request's query string, '' when there is none.
+
+    Arguments are sorted first, so the same query in another order gets
+    the same tag.
+    """
+    if not request.args:
+        return ''
+    query = urlencode(sorted(request.args.items(multi=True)))
+    return '-' + hashlib.sha1(query.encode()).hexdigest()[:12]
+
+
+def conditional(tag_for, private=False):
+    """Serve the view with a weak ETag and answer If-None-Match with 304.
+
+    `tag_for` gets the view's arguments and must be cheap (counters only,
+    no ORM); it is read before the view runs, so a change that lands
+    while the body is built just costs the client one more full response.
+    When it returns None the view runs normally without an ETag. The query
+    string is part of the tag, so each page or filter of a listing has
+    its own.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            tag = tag_for(*args, **kwargs)
+            if tag is None:
+                return view(*args, **kwargs)
+            tag += query_tag()
+
+            if request.if_none_match.contains_weak(tag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(tag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache' if private else 'no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,404 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import and_, func, or_, update
+
+from models import db, ExportJob, ParkingLot, ParkingSpot, ReserveParkingSpot
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet exports are only offered when pyarrow is installed
+    pa = pq = None
+
+# (CSV header, JSON/Parquet field, Parquet type) per exported column
+COLUMNS = [
+    ('Booking ID', 'booking_id', 'int64'),
+    ('Spot ID', 'spot_id', 'int64'),
+    ('Lot Name', 'lot_name', 'string'),
+    ('Vehicle Number', 'vehicle_number', 'string'),
+    ('Parking Time', 'parking_time', 'timestamp'),
+    ('Leaving Time', 'leaving_time', 'timestamp'),
+    ('Duration (Hours)', 'duration_hours', 'float64'),
+    ('Cost', 'cost', 'float64'),
+    ('Remarks', 'remarks', 'string'),
+]
+# Admin-wide exports also identify who booked and where
+ALL_COLUMNS = COLUMNS[:1] + [
+    ('User ID', 'user_id', 'int64'),
+    ('Lot ID', 'lot_id', 'int64'),
+] + COLUMNS[1:]
+
+CSV_HEADER = [header for header, _, _ in COLUMNS]
+
+# format -> (file extension, mimetype)
+FORMATS = {
+    'csv': ('.csv', 'text/csv'),
+    'csv.gz': ('.csv.gz', 'application/gzip'),
+    'jsonl': ('.jsonl', 'application/x-ndjson'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+# Parquet needs its footer written last, so it can only be produced as a file
+STREAM_FORMATS = ('csv', 'csv.gz', 'jsonl')
+
+# Rows fetched per round trip and written per flush
+BATCH_SIZE = 1000
+
+
+def available_formats():
+    return [fmt for fmt in FORMATS if fmt != 'parquet' or pq is not None]
+
+
+def columns_for(scope):
+    return ALL_COLUMNS if scope == 'all' else COLUMNS
+
+
+def export_dir():
+    path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'exports'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def download_name(job):
+    prefix = 'all_reservations' if job.scope == 'all' else 'parking_history'
+    return prefix + FORMATS[job.format][0]
+
+
+def count_booking_rows(user_id=None):
+    query = db.session.query(func.count(ReserveParkingSpot.id))
+    if user_id is not None:
+        query = query.filter(ReserveParkingSpot.user_id == user_id)
+    return query.scalar()
+
+
+def _booking_rows_query(user_id=None):
+    """The columns an export reads, one row per booking in id order."""
+    query = db.session.query(
+        ReserveParkingSpot.id,
+        ReserveParkingSpot.user_id,
+        ParkingSpot.lot_id,
+        ReserveParkingSpot.spot_id,
+        ParkingLot.prime_location_name,
+        ReserveParkingSpot.vehicle_number,
+        ReserveParkingSpot.parking_timestamp,
+        ReserveParkingSpot.leaving_timestamp,
+        ReserveParkingSpot.parking_cost,
+        ReserveParkingSpot.remarks
+    ).outerjoin(
+        ParkingSpot, ReserveParkingSpot.spot_id == ParkingSpot.id
+    ).outerjoin(
+        ParkingLot, ParkingSpot.lot_id == ParkingLot.id
+    )
+    if user_id is not None:
+        query = query.filter(ReserveParkingSpot.user_id == user_id)
+    return query.order_by(ReserveParkingSpot.id)
+
+
+def history_fingerprint(user_id=None, versions=''):
+    """Digest of aggregates that change whenever the exported rows do.
+
+    A new booking moves the count and max id, a release moves the max
+    leaving time and closed count, and repricing moves the cost sum.
+    Edits the aggregates can't see, such as lot renames, come in through
+    `versions`, the caller's change-version tag. One aggregate over the
+    user's (indexed) reservations, so it is cheap enough for every export
+    request.
+    """
+    query = db.session.query(
+        func.count(ReserveParkingSpot.id),
+        func.max(ReserveParkingSpot.id),
+        func.count(ReserveParkingSpot.leaving_timestamp),
+        func.max(ReserveParkingSpot.leaving_timestamp),
+        func.sum(ReserveParkingSpot.parking_cost)
+    )
+    if user_id is not None:
+        query = query.filter(ReserveParkingSpot.user_id == user_id)
+    values = list(query.one()) + [versions]
+    return hashlib.sha256(json.dumps(values, default=str).encode()).hexdigest()
+
+
+def iter_booking_rows(user_id=None, batch_size=BATCH_SIZE):
+    """Yield one export row per booking without loading the history into memory.
+
+    With no `user_id` every reservation is exported in the ALL_COLUMNS
+    layout. Spot and lot names come from the same joined query. Rows are
+    read in keyset batches on the booking id, each fetched in full, so no
+    cursor is left open while they are yielded: the caller may commit the
+    session in between, and a long export never holds a read lock.
+    """
+    query = _booking_rows_query(user_id)
+    now = datetime.utcnow()
+    after = 0
+    while True:
+        batch = query.filter(ReserveParkingSpot.id > after).limit(batch_size).all()
+        for booking_id, owner, lot_id, spot_id, lot_name, vehicle, parked, left, cost, remarks in batch:
+            duration = ((left or now) - parked).total_seconds() / 3600
+            ids = [owner, lot_id] if user_id is None else []
+            yield [booking_id, *ids, spot_id, lot_name or 'N/A', vehicle, parked, left,
+                   round(duration, 2), cost, remarks]
+        if len(batch) < batch_size:
+            return
+        after = batch[-1][0]
+
+
+def iter_csv(rows, header=CSV_HEADER, batch_size=BATCH_SIZE):
+    """Encode rows as CSV text, yielding one chunk per batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def iter_jsonl(rows, keys, batch_size=BATCH_SIZE):
+    """Encode rows as JSON Lines, yielding one chunk per batch."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(keys, row)), separators=(',', ':'), default=_json_value))
+        if len(lines) == batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def iter_gzip(chunks):
+    """Gzip a stream of text chunks incrementally."""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_export(fmt, rows, columns=COLUMNS):
+    """Encoded chunks (str or bytes) of `rows` in one of STREAM_FORMATS."""
+    if fmt == 'jsonl':
+        return iter_jsonl(rows, [key for _, key, _ in columns])
+    chunks = iter_csv(rows, [header for header, _, _ in columns])
+    return iter_gzip(chunks) if fmt == 'csv.gz' else chunks
+
+
+def _report_progress(job_id, rows_written):
+    # On the session itself: iter_booking_rows has no cursor open between
+    # rows. A second connection would wait on the export's own read lock
+    # under SQLite's rollback journal and fail with "database is locked".
+    db.session.execute(
+        update(ExportJob)
+        .where(ExportJob.id == job_id)
+        .values(progress_rows=rows_written)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def track_progress(rows, job_id, every=BATCH_SIZE):
+    """Pass rows through, recording the running count on the job every `every` rows."""
+    count = 0
+    for count, row in enumerate(rows, start=1):
+        yield row
+        if count % every == 0:
+            _report_progress(job_id, count)
+    _report_progress(job_id, count)
+
+
+@contextmanager
+def _replacing(path):
+    """Yield a temp path that is renamed to `path` on success and removed on failure."""
+    tmp_path = f'{path}.part'
+    try:
+        yield tmp_path
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+def write_chunks(chunks, path):
+    """Stream encoded chunks into `path` so readers never see a partial export."""
+    with _replacing(path) as tmp_path, open(tmp_path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk.encode() if isinstance(chunk, str) else chunk)
+
+
+def _arrow_tables(rows, schema, batch_size):
+    def to_table(batch):
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)]
+        return pa.Table.from_arrays(arrays, schema=schema)
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield to_table(batch)
+            batch = []
+    if batch:
+        yield to_table(batch)
+
+
+def write_parquet(rows, path, columns=COLUMNS, batch_size=BATCH_SIZE):
+    """Write rows as Parquet, one row group per batch so memory stays bounded."""
+    if pq is None:
+        raise RuntimeError('Parquet export requires pyarrow')
+    types = {
+        'int64': pa.int64(),
+        'float64': pa.float64(),
+        'string': pa.string(),
+        'timestamp': pa.timestamp('us'),
+    }
+    schema = pa.schema([(key, types[kind]) for _, key, kind in columns])
+    with _replacing(path) as tmp_path:
+        with pq.ParquetWriter(tmp_path, schema, compression='zstd') as writer:
+            for table in _arrow_tables(rows, schema, batch_size):
+                writer.write_table(table)
+
+
+def write_export(fmt, rows, path, columns=COLUMNS):
+    if fmt == 'parquet':
+        write_parquet(rows, path, columns)
+    else:
+        write_chunks(iter_export(fmt, rows, columns), path)
+
+
+def run_export_job(job):
+    """Generate the file for `job` and mark it completed (or failed, re-raising).
+
+    The job moves pending -> running -> completed/failed, and its
+    progress_rows/total_rows are updated as batches are written so the
+    status endpoint can report how far along it is.
+    """
+    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    prefix = 'all_reservations' if job.scope == 'all' else f'parking_history_{job.user_id}'
+    filename = os.path.join(export_dir(), f'{prefix}_{timestamp}_{job.id}{FORMATS[job.format][0]}')
+    user_id = None if job.scope == 'all' else job.user_id
+
+    job.status = 'running'
+    job.progress_rows = 0
+    job.total_rows = count_booking_rows(user_id)
+    db.session.commit()
+    try:
+        rows = track_progress(iter_booking_rows(user_id), job.id)
+        write_export(job.format, rows, filename, columns_for(job.scope))
+    except Exception:
+        db.session.rollback()
+        job = db.session.get(ExportJob, job.id)
+        job.status = 'failed'
+        db.session.commit()
+        raise
+
+    db.session.refresh(job)
+    job.status = 'completed'
+    job.file_path = filename
+    job.completed_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+
+def retention_cutoff():
+    return datetime.utcnow() - current_app.config['EXPORT_RETENTION']
+
+
+def fail_stale_jobs(query=None):
+    """Mark pending/running jobs older than EXPORT_JOB_TIMEOUT as failed.
+
+    A worker that died mid-job would otherwise leave them active forever.
+    The caller commits.
+    """
+    query = query if query is not None else ExportJob.query
+    stale_before = datetime.utcnow() - current_app.config['EXPORT_JOB_TIMEOUT']
+    return query.filter(
+        ExportJob.status.in_(ExportJob.ACTIVE_STATUSES),
+        ExportJob.created_at < stale_before
+    ).update({'status': 'failed'}, synchronize_session=False)
+
+
+def reusable_job(user_id, scope, fmt, fingerprint):
+    """A completed, unexpired export of identical content whose file still exists."""
+    if fingerprint is None:
+        return None
+    jobs = ExportJob.query.filter(
+        ExportJob.fingerprint == fingerprint,
+        ExportJob.user_id == user_id,
+        ExportJob.scope == scope,
+        ExportJob.format == fmt,
+        ExportJob.status == 'completed',
+        ExportJob.completed_at >= retention_cutoff()
+    ).order_by(ExportJob.id.desc())
+    for job in jobs.limit(3):
+        if job.file_path and os.path.exists(job.file_path):
+            return job
+    return None
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def cleanup_exports(batch_size=500):
+    """Delete expired jobs with their files, then files no job refers to.
+
+    Completed jobs expire EXPORT_RETENTION after completion and failed
+    ones that long after creation. Unreferenced files (including .part
+    leftovers from killed workers) are only removed once they are older
+    than EXPORT_JOB_TIMEOUT so an export being written is never touched.
+    Returns (jobs deleted, files deleted).
+    """
+    fail_stale_jobs()
+    db.session.commit()
+
+    cutoff = retention_cutoff()
+    expired = ExportJob.query.filter(or_(
+        and_(ExportJob.status == 'completed', ExportJob.completed_at < cutoff),
+        and_(ExportJob.status == 'failed', ExportJob.created_at < cutoff)
+    ))
+    jobs_deleted = files_deleted = 0
+    while True:
+        batch = expired.with_entities(ExportJob.id, ExportJob.file_path).limit(batch_size).all()
+        if not batch:
+            break
+        for _, path in batch:
+            if path and _remove(path):
+                files_deleted += 1
+        ExportJob.query.filter(ExportJob.id.in_([job_id for job_id, _ in batch])).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+        jobs_deleted += len(batch)
+
+    directory = export_dir()
+    referenced = {
+        os.path.abspath(path) for (path,) in
+        db.session.query(ExportJob.file_path).filter(ExportJob.file_path.isnot(None))
+    }
+    grace_before = (datetime.utcnow() - current_app.config['EXPORT_JOB_TIMEOUT']).timestamp()
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if (entry.is_file() and entry.path not in referenced
+                    and entry.stat().st_mtime < grace_before and _remove(entry.path)):
+                files_deleted += 1
+    return jobs_deleted, files_deleted
@@ -0,0 +1,217 @@
+import cProfile
+import hmac
+import os
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+
+from flask import Response, g, request
+from sqlalchemy import event
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:  # cProfile dumps are always available
+    PyinstrumentProfiler = None
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Upper bounds of the per-request query count buckets; high counts usually mean N+1
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+
+# [query count, seconds in the database] for the request being served
+_request_queries = ContextVar('request_queries', default=None)
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Instrumentation:
+    """Opt-in per-request query counts, latency histograms and profiling.
+
+    Nothing is hooked until init_app() runs, so a disabled app pays
+    nothing. Once enabled, every request gets a Server-Timing header with
+    its total and database time, per-route histograms are served in
+    Prometheus text format at /api/metrics, and a sample of requests runs
+    under a profiler whose output is kept when the request turns out slow.
+    Figures are per process, like the other metrics endpoints.
+    """
+
+    def __init__(self):
+        self.sources = {}
+        self._latency = {}
+        self._queries = {}
+        self._lock = threading.Lock()
+        # Only one profiler can be active per interpreter
+        self._profiling = threading.Lock()
+
+    def add_source(self, name, stats):
+        """Export the numeric fields of `stats()` as parking_<name>_<field> gauges."""
+        self.sources[name] = stats
+
+    def init_app(self, app, engine):
+        self.slow = app.config['INSTRUMENTATION_SLOW_MS'] / 1000
+        self.profile_rate = app.config['INSTRUMENTATION_PROFILE_RATE']
+        self.profiler = app.config['INSTRUMENTATION_PROFILER']
+        self.profile_dir = app.config['INSTRUMENTATION_PROFILE_DIR']
+        self.token = app.config['METRICS_TOKEN']
+        if self.profiler == 'pyinstrument' and PyinstrumentProfiler is None:
+            print("pyinstrument is not installed, profiling with cProfile instead")
+            self.profiler = 'cprofile'
+
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/api/metrics', 'metrics', self.metrics_view)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if _request_queries.get() is not None:
+            conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        counters = _request_queries.get()
+        started = conn.info.get('query_started')
+        if counters is None or not started:
+            return
+        counters[0] += 1
+        counters[1] += time.perf_counter() - started.pop()
+
+    def _before_request(self):
+        g.instrumentation_started = time.perf_counter()
+        g.instrumentation_token = _request_queries.set([0, 0.0])
+        g.instrumentation_profiler = None
+        if self.profile_rate and random.random() < self.profile_rate and self._profiling.acquire(blocking=False):
+            profiler = PyinstrumentProfiler() if self.profiler == 'pyinstrument' else cProfile.Profile()
+            try:
+                profiler.start() if self.profiler == 'pyinstrument' else profiler.enable()
+            except (RuntimeError, ValueError):
+                # Another tool (a debugger, coverage) already owns the profiling hook
+                self._profiling.release()
+            else:
+                g.instrumentation_profiler = profiler
+
+    def _after_request(self, response):
+        started = g.pop('instrumentation_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        queries, db_time = _request_queries.get() or (0, 0.0)
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+
+        with self._lock:
+            key = (request.method, route)
+            latency = self._latency.get(key)
+            if latency is None:
+                latency = self._latency[key] = _Histogram(LATENCY_BUCKETS)
+                self._queries[key] = _Histogram(QUERY_BUCKETS)
+            latency.observe(elapsed)
+            self._queries[key].observe(queries)
+
+        response.headers.add(
+            'Server-Timing',
+            f'app;dur={elapsed * 1000:.1f}, db;dur={db_time * 1000:.1f};desc="{queries} queries"'
+        )
+        profiler = g.pop('instrumentation_profiler', None)
+        if profiler is not None:
+            self._finish_profile(profiler, route, elapsed)
+        if elapsed >= self.slow:
+            print(f"Slow request: {request.method} {request.path} took {elapsed * 1000:.0f}ms "
+                  f"with {queries} queries ({db_time * 1000:.0f}ms in the database)")
+        return response
+
+    def _teardown_request(self, exc):
+        token = g.pop('instrumentation_token', None)
+        if token is not None:
+            try:
+                _request_queries.reset(token)
+            except ValueError:
+                # Streamed responses can finish in a different context
+                _request_queries.set(None)
+        # after_request doesn't run when a view raises
+        profiler = g.pop('instrumentation_profiler', None)
+        if profiler is not None:
+            self._finish_profile(profiler, None, 0)
+
+    def _finish_profile(self, profiler, route, elapsed):
+        try:
+            if self.profiler == 'pyinstrument':
+                profiler.stop()
+            else:
+                profiler.disable()
+            if route is None or elapsed < self.slow:
+                return
+            os.makedirs(self.profile_dir, exist_ok=True)
+            route_part = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+            name = f"{time.strftime('%Y%m%dT%H%M%S')}-{request.method}-{route_part}-{elapsed * 1000:.0f}ms"
+            if self.profiler == 'pyinstrument':
+                with open(os.path.join(self.profile_dir, name + '.html'), 'w') as f:
+                    f.write(profiler.output_html())
+            else:
+                profiler.dump_stats(os.path.join(self.profile_dir, name + '.prof'))
+        except OSError as e:
+            print(f"Could not write profile: {str(e)}")
+        finally:
+            self._profiling.release()
+
+    def metrics_view(self):
+        if self.token:
+            supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+            if not hmac.compare_digest(supplied, self.token):
+                return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response('\n'.join(self.render()) + '\n', mimetype='text/plain; version=0.0.4')
+
+    def render(self):
+        """Prometheus text exposition lines."""
+        with self._lock:
+            routes = [(key, self._latency[key], self._queries[key]) for key in sorted(self._latency)]
+            yield '# HELP parking_http_request_duration_seconds Request latency by route.'
+            yield '# TYPE parking_http_request_duration_seconds histogram'
+            for (method, route), latency, _ in routes:
+                yield from latency.lines('parking_http_request_duration_seconds', f'method="{method}",route="{_label(route)}"')
+            yield '# HELP parking_http_request_db_queries Database queries per request by route.'
+            yield '# TYPE parking_http_request_db_queries histogram'
+            for (method, route), _, queries in routes:
+                yield from queries.lines('parking_http_request_db_queries', f'method="{method}",route="{_label(route)}"')
+
+        for source, stats in self.sources.items():
+            for field, value in stats().items():
+                name = f'parking_{source}_{field}'.replace('-', '_')
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    yield f'# TYPE {name} gauge'
+                    yield f'{name} {value}'
+                elif isinstance(value, str):
+                    yield f'# TYPE {name} gauge'
+                    yield f'{name}{{value="{_label(value)}"}} 1'
@@ -0,0 +1,241 @@
+import json
+import os
+import threading
+import time
+
+import redis
+
+from blocklist import CircuitBreaker, TTLCache
+from models import db, ParkingLot
+
+INDEX = 'index'
+# Bumped on every change to any lot; versions the listing as a whole
+SEQUENCE = 'sequence'
+
+
+class LotCache:
+    """Public lot listing and detail cache: in-process LRU in front of Redis.
+
+    Each lot is cached on its own, under a key carrying that lot's version
+    number; the listing is the cached, versioned list of lot ids plus the
+    per-lot entries. Writers bump the version of just what changed after
+    committing (a booking bumps one lot, creating a lot bumps the id list),
+    so a reader that loaded a lot before the change can only store it under
+    a key nobody reads any more.
+
+    Every bump is published on `channel`; each process runs a listener
+    thread that drops its local copies, keeping gunicorn workers coherent.
+    Should a message be missed, local entries still expire after
+    `local_ttl` seconds. While Redis is failing the cache falls back to
+    the database and the local tier alone.
+    """
+
+    def __init__(self, client, prefix='lots:', channel='lots:invalidate', local_size=1024,
+                 local_ttl=5, redis_ttl=300, failure_threshold=5, reset_timeout=30):
+        self.client = client
+        self.prefix = prefix
+        self.channel = channel
+        self.redis_ttl = redis_ttl
+        self.local = TTLCache(local_size, local_ttl)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        # Lowest version a local entry may have been loaded under, per name,
+        # so a slow reader can't put back what an invalidation just dropped
+        self._floors = {}
+        self._listener_pid = None
+        self._counters = dict.fromkeys(
+            ('local_hits', 'redis_hits', 'db_loads', 'invalidations', 'errors', 'short_circuited'), 0
+        )
+        self._lock = threading.Lock()
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def version_key(self, name):
+        return f'{self.prefix}{name}:version'
+
+    def _key(self, name, version):
+        return f'{self.prefix}{name}:v{version}'
+
+    def _redis(self, fn, *args, **kwargs):
+        """Run one Redis call through the breaker; None when skipped or failed."""
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            return None
+        try:
+            result = fn(*args, **kwargs)
+        except redis.RedisError:
+            self.breaker.failure()
+            self._count('errors')
+            return None
+        except BaseException:
+            self.breaker.abandon()
+            raise
+        self.breaker.success()
+        return result
+
+    def _versions(self, names):
+        versions = self._redis(self.client.mget, [self.version_key(name) for name in names])
+        if versions is None:
+            return [None] * len(names)
+        return [int(version or 0) for version in versions]
+
+    def _store_local(self, name, version, value):
+        if version is not None and version < self._floors.get(name, 0):
+            return
+        self.local.set(name, value)
+
+    def _load_index(self):
+        (version,) = self._versions([INDEX])
+        if version is not None:
+            raw = self._redis(self.client.get, self._key(INDEX, version))
+            if raw is not None:
+                ids = json.loads(raw)
+                self._count('redis_hits')
+                self._store_local(INDEX, version, ids)
+                return ids
+
+        ids = [lot_id for (lot_id,) in db.session.query(ParkingLot.id).order_by(ParkingLot.id)]
+        self._count('db_loads')
+        if version is not None:
+            self._redis(self.client.set, self._key(INDEX, version), json.dumps(ids), ex=self.redis_ttl)
+        self._store_local(INDEX, version, ids)
+        return ids
+
+    def get_lots(self, lot_ids):
+        """{lot_id: lot dict} for those of `lot_ids` that exist."""
+        self._ensure_listener()
+        found = {}
+        missing = []
+        for lot_id in lot_ids:
+            lot = self.local.get(lot_id)
+            if lot is None:
+                missing.append(lot_id)
+            else:
+                found[lot_id] = lot
+        self._count('local_hits', len(found))
+        if not missing:
+            return found
+
+        versions = dict(zip(missing, self._versions(missing)))
+        known = [lot_id for lot_id in missing if versions[lot_id] is not None]
+        if known:
+            raw = self._redis(self.client.mget, [self._key(lot_id, versions[lot_id]) for lot_id in known])
+            for lot_id, value in zip(known, raw or ()):
+                if value is not None:
+                    found[lot_id] = json.loads(value)
+                    self._store_local(lot_id, versions[lot_id], found[lot_id])
+                    self._count('redis_hits')
+
+        to_load = [lot_id for lot_id in missing if lot_id not in found]
+        if to_load:
+            loaded = {lot.id: lot.to_dict() for lot in ParkingLot.query.filter(ParkingLot.id.in_(to_load))}
+            self._count('db_loads', len(to_load))
+            writes = {
+                self._key(lot_id, versions[lot_id]): json.dumps(lot)
+                for lot_id, lot in loaded.items() if versions[lot_id] is not None
+            }
+            if writes:
+                self._redis(self._set_many, writes)
+            for lot_id, lot in loaded.items():
+                self._store_local(lot_id, versions[lot_id], lot)
+            found.update(loaded)
+        return found
+
+    def _set_many(self, values):
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in values.items():
+            pipe.set(key, value, ex=self.redis_ttl)
+        return pipe.execute()
+
+    def get_lot(self, lot_id):
+        return self.get_lots([lot_id]).get(lot_id)
+
+    def list_lots(self):
+        self._ensure_listener()
+        ids = self.local.get(INDEX)
+        if ids is None:
+            ids = self._load_index()
+        lots = self.get_lots(ids)
+        return [lots[lot_id] for lot_id in ids if lot_id in lots]
+
+    def index_version(self):
+        """Current version of the lot id list, or None if Redis can't say."""
+        return self._versions([INDEX])[0]
+
+    def invalidate(self, lot_ids=(), index=False):
+        """Drop cached copies of `lot_ids` (and the id list) everywhere.
+
+        Call after the change is committed. Locally the entries go at once;
+        other processes drop theirs when the message reaches them. Returns
+        the new {name: version}, or None if Redis couldn't be updated.
+        """
+        names = list(lot_ids) + ([INDEX] if index else [])
+        if not names:
+            return None
+        self._count('invalidations')
+        for name in names:
+            self.local.delete(name)
+        versions = self._redis(self._bump, names)
+        if versions is None:
+            return None
+        versions = dict(zip(names, versions))
+        self._apply(versions)
+        return versions
+
+    def _bump(self, names):
+        pipe = self.client.pipeline(transaction=False)
+        for name in names:
+            pipe.incr(self.version_key(name))
+        pipe.incr(self.version_key(SEQUENCE))
+        versions = pipe.execute()[:-1]
+        self.client.publish(self.channel, json.dumps(dict(zip(map(str, names), versions))))
+        return versions
+
+    def _apply(self, versions):
+        with self._lock:
+            for name, version in versions.items():
+                self._floors[name] = max(self._floors.get(name, 0), version)
+        for name in versions:
+            self.local.delete(name)
+
+    def _ensure_listener(self):
+        # Started lazily and per process: threads don't survive gunicorn's fork
+        if self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self._floors = {}
+        self.local.clear()
+        threading.Thread(target=self._listen, name='lot-cache-invalidation', daemon=True).start()
+
+    def _listen(self):
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                # Whatever changed while we weren't subscribed is unknown
+                self.local.clear()
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self._apply({
+                            name if name == INDEX else int(name): version
+                            for name, version in json.loads(message['data']).items()
+                        })
+            except (redis.RedisError, ValueError):
+                time.sleep(1)
+            finally:
+                pubsub.close()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            **counters,
+            'local_size': len(self.local),
+            'breaker_state': self.breaker.state,
+            'listener_running': self._listener_pid == os.getpid(),
+        }
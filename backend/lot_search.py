@@ -0,0 +1,187 @@
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+from lot_cache import INDEX
+from models import db, ParkingLot
+
+WORD_RE = re.compile(r'[0-9a-z]+')
+# PIN codes sharing their first three digits are in the same sorting district
+PIN_DISTRICT_DIGITS = 3
+
+
+def words(text):
+    return WORD_RE.findall((text or '').lower())
+
+
+def _prefix_range(sorted_values, prefix):
+    """Slice bounds of the values in `sorted_values` that start with `prefix`."""
+    start = bisect_left(sorted_values, prefix)
+    end = start
+    while end < len(sorted_values) and sorted_values[end].startswith(prefix):
+        end += 1
+    return start, end
+
+
+def _pin_number(pin_code):
+    return int(pin_code) if pin_code and pin_code.isdigit() else None
+
+
+class LotSearchIndex:
+    """In-memory search over lot names, addresses, PIN codes and prices.
+
+    Terms of every lot's name and address are kept in one sorted list, so
+    the lots matching a word prefix are a bisect plus a short scan; PIN
+    codes and prices are sorted the same way for prefix and range lookups.
+    Only these static fields are indexed, availability is read from the
+    lot cache at query time.
+
+    The index is tagged with the version of the lot id list in LotCache,
+    which every lot create, edit and delete bumps. The process making the
+    change patches its index in place; the others see a newer version on
+    their next search and rebuild. If the version can't be read, the index
+    is rebuilt once it is older than `max_age` seconds.
+    """
+
+    def __init__(self, max_age=60):
+        self.max_age = max_age
+        self.version = None
+        self.built_at = None
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._lots = {}          # id -> (name terms, address terms, pin_code, price)
+        self._terms = []         # sorted distinct terms
+        self._postings = {}      # term -> set of lot ids
+        self._pins = []          # sorted (pin_code, id)
+        self._prices = []        # sorted (price, id)
+
+    def _add(self, lot_id, name, address, pin_code, price):
+        name_terms = set(words(name))
+        address_terms = set(words(address))
+        for term in name_terms | address_terms:
+            ids = self._postings.get(term)
+            if ids is None:
+                ids = self._postings[term] = set()
+                insort(self._terms, term)
+            ids.add(lot_id)
+        pin_code = (pin_code or '').strip()
+        insort(self._pins, (pin_code, lot_id))
+        insort(self._prices, (price, lot_id))
+        self._lots[lot_id] = (name_terms, address_terms, pin_code, price)
+
+    def _remove(self, lot_id):
+        entry = self._lots.pop(lot_id, None)
+        if entry is None:
+            return
+        name_terms, address_terms, pin_code, price = entry
+        for term in name_terms | address_terms:
+            ids = self._postings[term]
+            ids.discard(lot_id)
+            if not ids:
+                del self._postings[term]
+                del self._terms[bisect_left(self._terms, term)]
+        del self._pins[bisect_left(self._pins, (pin_code, lot_id))]
+        del self._prices[bisect_left(self._prices, (price, lot_id))]
+
+    def rebuild(self, version):
+        rows = db.session.query(
+            ParkingLot.id, ParkingLot.prime_location_name, ParkingLot.address,
+            ParkingLot.pin_code, ParkingLot.price
+        ).order_by(ParkingLot.id).all()
+        with self._lock:
+            self._reset()
+            for row in rows:
+                self._add(*row)
+            self.version = version
+            self.built_at = time.monotonic()
+
+    def sync(self, version):
+        """Rebuild if lots changed since the index was built."""
+        if self.built_at is None:
+            stale = True
+        elif version is None:
+            stale = time.monotonic() - self.built_at > self.max_age
+        else:
+            stale = version != self.version
+        if stale:
+            self.rebuild(version)
+
+    def apply(self, versions, lots=(), removed_ids=()):
+        """Patch in lots this process just created, edited or deleted.
+
+        `versions` is what LotCache.invalidate returned for the change. If
+        other changes landed in between, the index is left stale for the
+        next search to rebuild instead.
+        """
+        version = (versions or {}).get(INDEX)
+        with self._lock:
+            if self.built_at is None or version is None or self.version is None or version != self.version + 1:
+                self.version = None
+                return
+            for lot_id in removed_ids:
+                self._remove(lot_id)
+            for lot in lots:
+                self._remove(lot.id)
+                self._add(lot.id, lot.prime_location_name, lot.address, lot.pin_code, lot.price)
+            self.version = version
+
+    def _matching(self, word):
+        start, end = _prefix_range(self._terms, word)
+        ids = set()
+        for term in self._terms[start:end]:
+            ids |= self._postings[term]
+        return ids
+
+    def search(self, query='', pin_code=None, nearby=False, min_price=None, max_price=None):
+        """Ids of matching lots, best first.
+
+        Every word of `query` must prefix-match a word of the name or
+        address; lots matching more words in the name rank higher. With
+        `nearby`, `pin_code` matches its whole sorting district, closest
+        PIN first.
+        """
+        query_words = words(query)
+        with self._lock:
+            candidates = None
+            for word in query_words:
+                ids = self._matching(word)
+                candidates = ids if candidates is None else candidates & ids
+                if not candidates:
+                    return []
+
+            pin_number = None
+            if pin_code:
+                pin_code = pin_code.strip()
+                prefix = pin_code[:PIN_DISTRICT_DIGITS] if nearby else pin_code
+                ids = set()
+                index = bisect_left(self._pins, (prefix,))
+                while index < len(self._pins) and self._pins[index][0].startswith(prefix):
+                    pin, lot_id = self._pins[index]
+                    if nearby or pin == pin_code:
+                        ids.add(lot_id)
+                    index += 1
+                candidates = ids if candidates is None else candidates & ids
+                pin_number = _pin_number(pin_code)
+
+            if min_price is not None or max_price is not None:
+                start = 0 if min_price is None else bisect_left(self._prices, (min_price,))
+                end = len(self._prices) if max_price is None else bisect_left(self._prices, (max_price, float('inf')))
+                ids = {lot_id for _, lot_id in self._prices[start:end]}
+                candidates = ids if candidates is None else candidates & ids
+
+            if candidates is None:
+                candidates = set(self._lots)
+
+            def rank(lot_id):
+                name_terms, _, pin, _ = self._lots[lot_id]
+                name_hits = sum(any(term.startswith(word) for term in name_terms) for word in query_words)
+                distance = 0
+                if pin_number is not None:
+                    number = _pin_number(pin)
+                    distance = abs(number - pin_number) if number is not None else float('inf')
+                return (-name_hits, distance, lot_id)
+
+            return sorted(candidates, key=rank)
@@ -0,0 +1,262 @@
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from queue import Empty, LifoQueue
+
+from flask import current_app
+from sqlalchemy import and_, or_, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, EmailDelivery
+
+# A delivery stuck in 'sending' this long (worker killed mid-send) can be claimed again
+CLAIM_TIMEOUT = timedelta(minutes=15)
+# Idle pooled sessions are checked with NOOP before reuse after this many seconds
+IDLE_CHECK_SECONDS = 30
+
+
+def _close(server):
+    try:
+        server.quit()
+    except (smtplib.SMTPException, OSError):
+        server.close()
+
+
+def _reusable_after(error):
+    # The server answered and smtplib already sent RSET, so the session is fine
+    return isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError))
+
+
+class SMTPPool:
+    """Reusable SMTP sessions for one server and login.
+
+    At most `size` sessions are open at once; they are opened lazily,
+    checked with NOOP after sitting idle, and dropped when the server has
+    closed them or a send fails at the connection level.
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_tls=True, size=4, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self._idle = LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _open(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            server.starttls()
+        if self.username:
+            server.login(self.username, self.password)
+        return server
+
+    def _checkout(self):
+        while True:
+            try:
+                server, idle_since = self._idle.get_nowait()
+            except Empty:
+                return self._open()
+            if time.monotonic() - idle_since < IDLE_CHECK_SECONDS:
+                return server
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except (smtplib.SMTPException, OSError):
+                pass
+            _close(server)
+
+    @contextmanager
+    def connection(self):
+        with self._slots:
+            server = self._checkout()
+            try:
+                yield server
+            except Exception as e:
+                if _reusable_after(e):
+                    self._idle.put((server, time.monotonic()))
+                else:
+                    _close(server)
+                raise
+            self._idle.put((server, time.monotonic()))
+
+    def close_all(self):
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except Empty:
+                return
+            _close(server)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def smtp_pool():
+    """The calling process's pool for the configured server, created on first use."""
+    config = current_app.config
+    key = (config['MAIL_SERVER'], config['MAIL_PORT'], config['MAIL_USERNAME'], config['MAIL_USE_TLS'])
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = SMTPPool(
+                config['MAIL_SERVER'],
+                config['MAIL_PORT'],
+                config['MAIL_USERNAME'],
+                config['MAIL_PASSWORD'],
+                use_tls=config['MAIL_USE_TLS'],
+                size=config['MAIL_POOL_SIZE']
+            )
+        return pool
+
+
+def mail_configured():
+    config = current_app.config
+    return not config['MAIL_REQUIRE_AUTH'] or bool(config['MAIL_USERNAME'] and config['MAIL_PASSWORD'])
+
+
+def sender():
+    return current_app.config['MAIL_USERNAME'] or current_app.config['MAIL_DEFAULT_SENDER']
+
+
+def send_message(msg):
+    with smtp_pool().connection() as server:
+        server.send_message(msg)
+
+
+def iter_chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ensure_deliveries(user_ids, kind, period):
+    """Create 'pending' delivery rows for any of `user_ids` that have none yet."""
+    now = datetime.utcnow()
+    rows = [
+        {'user_id': user_id, 'kind': kind, 'period': period, 'status': 'pending', 'attempts': 0, 'created_at': now}
+        for user_id in user_ids
+    ]
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        db.session.execute(
+            insert(EmailDelivery).on_conflict_do_nothing(index_elements=['user_id', 'kind', 'period']),
+            rows
+        )
+    else:
+        existing = {user_id for (user_id,) in db.session.query(EmailDelivery.user_id).filter(
+            EmailDelivery.user_id.in_(user_ids),
+            EmailDelivery.kind == kind,
+            EmailDelivery.period == period
+        )}
+        rows = [row for row in rows if row['user_id'] not in existing]
+        if rows:
+            db.session.execute(db.insert(EmailDelivery), rows)
+    db.session.commit()
+
+
+def _delivery(user_id, kind, period):
+    return and_(EmailDelivery.user_id == user_id, EmailDelivery.kind == kind, EmailDelivery.period == period)
+
+
+def claim_delivery(user_id, kind, period):
+    """Mark a delivery as being sent by this worker.
+
+    A conditional UPDATE, so two workers re-running the same period never
+    both send. False when it was already sent, is being sent elsewhere, or
+    has used up MAIL_MAX_ATTEMPTS.
+    """
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        update(EmailDelivery)
+        .where(
+            _delivery(user_id, kind, period),
+            EmailDelivery.attempts < current_app.config['MAIL_MAX_ATTEMPTS'],
+            or_(
+                EmailDelivery.status.in_(('pending', 'failed')),
+                and_(EmailDelivery.status == 'sending', EmailDelivery.claimed_at < now - CLAIM_TIMEOUT)
+            )
+        )
+        .values(status='sending', claimed_at=now, attempts=EmailDelivery.attempts + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
+
+
+def finish_delivery(user_id, kind, period, error=None):
+    """Record the outcome of a claimed delivery; returns its attempt count."""
+    if error is None:
+        values = {'status': 'sent', 'sent_at': datetime.utcnow(), 'last_error': None}
+    else:
+        values = {'status': 'failed', 'last_error': str(error)[:1000]}
+    db.session.execute(
+        update(EmailDelivery)
+        .where(_delivery(user_id, kind, period))
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return db.session.query(EmailDelivery.attempts).filter(_delivery(user_id, kind, period)).scalar()
+
+
+def retry_delay(attempts):
+    """Seconds before the next attempt, or None once MAIL_MAX_ATTEMPTS is reached."""
+    config = current_app.config
+    if attempts >= config['MAIL_MAX_ATTEMPTS']:
+        return None
+    return min(config['MAIL_RETRY_BACKOFF'] * 2 ** (attempts - 1), 3600)
+
+
+def deliver(user, kind, period, build_message):
+    """Claim, send and record one notification.
+
+    Returns (sent, retry_in): retry_in is the backoff in seconds when the
+    send failed and may be retried, otherwise None.
+    """
+    if not claim_delivery(user.id, kind, period):
+        return False, None
+    try:
+        send_message(build_message(user))
+    except Exception as e:
+        attempts = finish_delivery(user.id, kind, period, error=e)
+        print(f"Sending {kind} to {user.email} failed (attempt {attempts}): {str(e)}")
+        return False, retry_delay(attempts)
+    finish_delivery(user.id, kind, period)
+    return True, None
+
+
+def reminder_message(user, new_lots):
+    """Daily reminder for `user`; `new_lots` is a list of (name, price) pairs."""
+    message = f"Hello {user.full_name or user.username}!\n\n"
+    message += "We noticed you haven't visited our parking app recently. "
+
+    if new_lots:
+        message += f"We have {len(new_lots)} new parking lots available!\n\n"
+        for name, price in new_lots:
+            message += f"- {name}: Rs. {price}/day\n"
+
+    message += "\nBook a parking spot today at our app!"
+
+    msg = MIMEMultipart()
+    msg['From'] = sender()
+    msg['To'] = user.email
+    msg['Subject'] = 'Daily Parking Reminder - Book Your Spot!'
+    msg.attach(MIMEText(message, 'plain'))
+    return msg
@@ -0,0 +1,66 @@
+"""occupancy counters and indexes on hot filter columns
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-18 09:40:00.000000
+
+Brings a database created by the old `db.create_all()` bootstrap up to
+the current schema. Every step checks what already exists so it is safe
+to run against databases created at any point before migrations existed.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_parking_spots_lot_status', 'parking_spots', ['lot_id', 'status']),
+    ('ix_reserve_user_parking_ts', 'reserve_parking_spots', ['user_id', 'parking_timestamp']),
+    ('ix_reserve_user_leaving_ts', 'reserve_parking_spots', ['user_id', 'leaving_timestamp']),
+    ('ix_reserve_spot_leaving_ts', 'reserve_parking_spots', ['spot_id', 'leaving_timestamp']),
+    ('ix_users_email', 'users', ['email']),
+    ('ix_payments_user_id', 'payments', ['user_id']),
+    ('ix_export_jobs_user_status', 'export_jobs', ['user_id', 'status']),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    lot_columns = {c['name'] for c in inspector.get_columns('parking_lots')}
+    added = [name for name in ('available_spots', 'occupied_spots') if name not in lot_columns]
+    with op.batch_alter_table('parking_lots') as batch_op:
+        for name in added:
+            batch_op.add_column(sa.Column(name, sa.Integer(), nullable=False, server_default='0'))
+    if added:
+        # New counters start at zero: fill them from the spots table
+        op.execute(
+            "UPDATE parking_lots SET "
+            "available_spots = (SELECT COUNT(*) FROM parking_spots "
+            "WHERE parking_spots.lot_id = parking_lots.id AND parking_spots.status = 'A'), "
+            "occupied_spots = (SELECT COUNT(*) FROM parking_spots "
+            "WHERE parking_spots.lot_id = parking_lots.id AND parking_spots.status = 'O')"
+        )
+
+    for name, table, columns in INDEXES:
+        if not inspector.has_table(table):
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table)}
+        if name not in existing:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
+
+    with op.batch_alter_table('parking_lots') as batch_op:
+        batch_op.drop_column('occupied_spots')
+        batch_op.drop_column('available_spots')
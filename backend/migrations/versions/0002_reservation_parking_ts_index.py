@@ -0,0 +1,24 @@
+"""index reserve_parking_spots.parking_timestamp for date-range filters
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 09:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_reserve_parking_ts', 'reserve_parking_spots', ['parking_timestamp'])
+
+
+def downgrade():
+    op.drop_index('ix_reserve_parking_ts', table_name='reserve_parking_spots')
@@ -0,0 +1,43 @@
+"""daily_lot_stats rollup table
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 10:00:00.000000
+
+The table is created empty. `flask --app app init-db` fills it from existing
+reservations on the first deploy after upgrading; after a bare `flask db upgrade`,
+run that or the backfill_daily_lot_stats Celery task before serving.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'daily_lot_stats',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('lot_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('bookings', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Float(), nullable=False),
+        sa.Column('occupied_hours', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['lot_id'], ['parking_lots.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('lot_id', 'day', name='uq_daily_lot_stats_lot_day')
+    )
+    op.create_index('ix_daily_lot_stats_day', 'daily_lot_stats', ['day'])
+    op.create_index('ix_reserve_leaving_ts', 'reserve_parking_spots', ['leaving_timestamp'])
+
+
+def downgrade():
+    op.drop_index('ix_reserve_leaving_ts', table_name='reserve_parking_spots')
+    op.drop_index('ix_daily_lot_stats_day', table_name='daily_lot_stats')
+    op.drop_table('daily_lot_stats')
@@ -0,0 +1,28 @@
+"""export job progress columns
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 10:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('export_jobs') as batch_op:
+        batch_op.add_column(sa.Column('progress_rows', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('total_rows', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('export_jobs') as batch_op:
+        batch_op.drop_column('total_rows')
+        batch_op.drop_column('progress_rows')
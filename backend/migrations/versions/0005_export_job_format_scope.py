@@ -0,0 +1,31 @@
+"""export job format and scope
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 11:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('export_jobs') as batch_op:
+        batch_op.add_column(sa.Column('scope', sa.String(length=10), nullable=False, server_default='user'))
+        batch_op.add_column(sa.Column('format', sa.String(length=10), nullable=False, server_default='csv'))
+        batch_op.alter_column('user_id', existing_type=sa.Integer(), nullable=True)
+
+
+def downgrade():
+    op.execute("DELETE FROM export_jobs WHERE user_id IS NULL")
+    with op.batch_alter_table('export_jobs') as batch_op:
+        batch_op.alter_column('user_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.drop_column('format')
+        batch_op.drop_column('scope')
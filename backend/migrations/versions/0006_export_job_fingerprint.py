@@ -0,0 +1,30 @@
+"""export job fingerprint and retention indexes
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 12:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('export_jobs') as batch_op:
+        batch_op.add_column(sa.Column('fingerprint', sa.String(length=64), nullable=True))
+        batch_op.create_index('ix_export_jobs_fingerprint', ['fingerprint'])
+        batch_op.create_index('ix_export_jobs_completed_at', ['completed_at'])
+
+
+def downgrade():
+    with op.batch_alter_table('export_jobs') as batch_op:
+        batch_op.drop_index('ix_export_jobs_completed_at')
+        batch_op.drop_index('ix_export_jobs_fingerprint')
+        batch_op.drop_column('fingerprint')
@@ -0,0 +1,47 @@
+"""advance reservations
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'advance_reservations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('lot_id', sa.Integer(), nullable=False),
+        sa.Column('spot_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('vehicle_number', sa.String(length=50), nullable=True),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.Column('end_time', sa.DateTime(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('booking_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['lot_id'], ['parking_lots.id']),
+        sa.ForeignKeyConstraint(['spot_id'], ['parking_spots.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['booking_id'], ['reserve_parking_spots.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_advance_reservations_spot_window', 'advance_reservations', ['spot_id', 'start_time', 'end_time'])
+    op.create_index('ix_advance_reservations_lot_end', 'advance_reservations', ['lot_id', 'end_time'])
+    op.create_index('ix_advance_reservations_user_start', 'advance_reservations', ['user_id', 'start_time'])
+
+
+def downgrade():
+    op.drop_index('ix_advance_reservations_user_start', table_name='advance_reservations')
+    op.drop_index('ix_advance_reservations_lot_end', table_name='advance_reservations')
+    op.drop_index('ix_advance_reservations_spot_window', table_name='advance_reservations')
+    op.drop_table('advance_reservations')
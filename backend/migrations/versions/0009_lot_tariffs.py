@@ -0,0 +1,26 @@
+"""lot tariffs
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('parking_lots') as batch_op:
+        batch_op.add_column(sa.Column('tariff', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('parking_lots') as batch_op:
+        batch_op.drop_column('tariff')
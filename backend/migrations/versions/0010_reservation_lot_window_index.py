@@ -0,0 +1,30 @@
+"""index advance_reservations by lot and window for overlap checks
+
+Leading with end_time keeps the range to reservations not yet over, and
+start_time lets the overlap be checked in the index. It replaces the
+(lot_id, end_time) index, which it is a prefix extension of.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 18:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_advance_reservations_lot_window', 'advance_reservations', ['lot_id', 'end_time', 'start_time'])
+    op.drop_index('ix_advance_reservations_lot_end', table_name='advance_reservations')
+
+
+def downgrade():
+    op.create_index('ix_advance_reservations_lot_end', 'advance_reservations', ['lot_id', 'end_time'])
+    op.drop_index('ix_advance_reservations_lot_window', table_name='advance_reservations')
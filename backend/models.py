@@ -1,4 +1,6 @@
+import json
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 
@@ -30,6 +32,9 @@ class Admin(db.Model):
 
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_email', 'email'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
@@ -81,6 +86,10 @@ class ParkingLot(db.Model):
     address = db.Column(db.String(200), nullable=False)
     pin_code = db.Column(db.String(10), nullable=False)
     number_of_spots = db.Column(db.Integer, nullable=False)
+    available_spots = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    occupied_spots = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Pricing rules as JSON (see tariff.Tariff); NULL means a flat hourly price
+    tariff = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     parking_spots = db.relationship('ParkingSpot', backref='parking_lot', lazy=True, cascade='all, delete-orphan')
@@ -91,10 +100,18 @@ class ParkingLot(db.Model):
         self.address = address
         self.pin_code = pin_code
         self.number_of_spots = number_of_spots
+        self.available_spots = 0
+        self.occupied_spots = 0
+
+    def adjust_occupancy(self, available=0, occupied=0):
+        """Shift the stored counters by a delta. Emitted as `col = col + n` so
+        concurrent bookings in the same lot don't overwrite each other."""
+        if available:
+            self.available_spots = ParkingLot.available_spots + available
+        if occupied:
+            self.occupied_spots = ParkingLot.occupied_spots + occupied
 
     def to_dict(self):
-        available_count = ParkingSpot.query.filter_by(lot_id=self.id, status='A').count()
-        occupied_count = ParkingSpot.query.filter_by(lot_id=self.id, status='O').count()
         return {
             'id': self.id,
             'prime_location_name': self.prime_location_name,
@@ -102,13 +119,17 @@ class ParkingLot(db.Model):
             'address': self.address,
             'pin_code': self.pin_code,
             'number_of_spots': self.number_of_spots,
-            'available_spots': available_count,
-            'occupied_spots': occupied_count,
+            'available_spots': self.available_spots,
+            'occupied_spots': self.occupied_spots,
+            'tariff': json.loads(self.tariff) if self.tariff else None,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
 class ParkingSpot(db.Model):
     __tablename__ = 'parking_spots'
+    __table_args__ = (
+        db.Index('ix_parking_spots_lot_status', 'lot_id', 'status'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     lot_id = db.Column(db.Integer, db.ForeignKey('parking_lots.id'), nullable=False)
     status = db.Column(db.String(1), nullable=False, default='A')
@@ -132,6 +153,13 @@ class ParkingSpot(db.Model):
 
 class ReserveParkingSpot(db.Model):
     __tablename__ = 'reserve_parking_spots'
+    __table_args__ = (
+        db.Index('ix_reserve_parking_ts', 'parking_timestamp'),
+        db.Index('ix_reserve_user_parking_ts', 'user_id', 'parking_timestamp'),
+        db.Index('ix_reserve_user_leaving_ts', 'user_id', 'leaving_timestamp'),
+        db.Index('ix_reserve_spot_leaving_ts', 'spot_id', 'leaving_timestamp'),
+        db.Index('ix_reserve_leaving_ts', 'leaving_timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     spot_id = db.Column(db.Integer, db.ForeignKey('parking_spots.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -147,9 +175,10 @@ class ReserveParkingSpot(db.Model):
         self.parking_timestamp = parking_timestamp
         self.vehicle_number = vehicle_number
 
-    def to_dict(self):
-        spot = ParkingSpot.query.get(self.spot_id)
-        lot = ParkingLot.query.get(spot.lot_id) if spot else None
+    def to_dict(self, spot=None):
+        if spot is None:
+            spot = self.spot
+        lot = spot.parking_lot if spot else None
         return {
             'id': self.id,
             'spot_id': self.spot_id,
@@ -165,27 +194,132 @@ class ReserveParkingSpot(db.Model):
             'is_active': self.leaving_timestamp is None
         }
 
+class DailyLotStats(db.Model):
+    """Completed-booking totals per lot per local calendar day.
+
+    Maintained incrementally by release_spot and rebuilt by the
+    backfill_daily_lot_stats Celery task.
+    """
+    __tablename__ = 'daily_lot_stats'
+    __table_args__ = (
+        db.UniqueConstraint('lot_id', 'day', name='uq_daily_lot_stats_lot_day'),
+        db.Index('ix_daily_lot_stats_day', 'day'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lots.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    occupied_hours = db.Column(db.Float, nullable=False, default=0)
+    
+    lot = db.relationship('ParkingLot', backref=db.backref('daily_stats', lazy=True, cascade='all, delete-orphan'))
+    
+    def to_dict(self):
+        return {
+            'lot_id': self.lot_id,
+            'day': self.day.isoformat(),
+            'bookings': self.bookings,
+            'revenue': round(self.revenue, 2),
+            'occupied_hours': round(self.occupied_hours, 2)
+        }
+
+class AdvanceReservation(db.Model):
+    """A spot held for a future [start_time, end_time) window.
+
+    Reservations on one spot never overlap; that is checked under a lock on
+    the spot row when one is made. Checking in turns it into an ordinary
+    ReserveParkingSpot booking.
+    """
+    __tablename__ = 'advance_reservations'
+    __table_args__ = (
+        db.Index('ix_advance_reservations_spot_window', 'spot_id', 'start_time', 'end_time'),
+        db.Index('ix_advance_reservations_lot_window', 'lot_id', 'end_time', 'start_time'),
+        db.Index('ix_advance_reservations_user_start', 'user_id', 'start_time'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lots.id'), nullable=False)
+    spot_id = db.Column(db.Integer, db.ForeignKey('parking_spots.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    vehicle_number = db.Column(db.String(50), nullable=True)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='booked')  # booked, cancelled, checked_in
+    # The booking created on check-in
+    booking_id = db.Column(db.Integer, db.ForeignKey('reserve_parking_spots.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    lot = db.relationship('ParkingLot', backref=db.backref('advance_reservations', lazy=True, cascade='all, delete-orphan'))
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'lot_id': self.lot_id,
+            'lot_name': self.lot.prime_location_name if self.lot else None,
+            'spot_id': self.spot_id,
+            'user_id': self.user_id,
+            'vehicle_number': self.vehicle_number,
+            'start_time': self.start_time.isoformat(),
+            'end_time': self.end_time.isoformat(),
+            'status': self.status,
+            'booking_id': self.booking_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+def serialize_reservations(reservations):
+    """to_dict() for a batch of reservations, loading their spots and lots in one query."""
+    spot_ids = {r.spot_id for r in reservations}
+    spots = {}
+    if spot_ids:
+        spots = {
+            spot.id: spot for spot in ParkingSpot.query.options(
+                db.joinedload(ParkingSpot.parking_lot)
+            ).filter(ParkingSpot.id.in_(spot_ids))
+        }
+    return [r.to_dict(spots.get(r.spot_id)) for r in reservations]
+
 class ExportJob(db.Model):
     __tablename__ = 'export_jobs'
+    __table_args__ = (
+        db.Index('ix_export_jobs_user_status', 'user_id', 'status'),
+        db.Index('ix_export_jobs_fingerprint', 'fingerprint'),
+        db.Index('ix_export_jobs_completed_at', 'completed_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # NULL for admin-wide (scope='all') exports
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    scope = db.Column(db.String(10), nullable=False, default='user', server_default='user')
+    format = db.Column(db.String(10), nullable=False, default='csv', server_default='csv')
+    # exports.history_fingerprint() of the data when the job was queued
+    fingerprint = db.Column(db.String(64), nullable=True)
     status = db.Column(db.String(20), default='pending')
     file_path = db.Column(db.String(500), nullable=True)
+    progress_rows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_rows = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime, nullable=True)
     
+    ACTIVE_STATUSES = ('pending', 'running')
+    
     def to_dict(self):
         return {
             'id': self.id,
             'user_id': self.user_id,
+            'scope': self.scope,
+            'format': self.format,
             'status': self.status,
             'file_path': self.file_path,
+            'progress_rows': self.progress_rows,
+            'total_rows': self.total_rows,
+            'progress': round(self.progress_rows / self.total_rows * 100, 1) if self.total_rows else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'completed_at': self.completed_at.isoformat() if self.completed_at else None
         }
 
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (
+        db.Index('ix_payments_user_id', 'user_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     booking_id = db.Column(db.Integer, db.ForeignKey('reserve_parking_spots.id'), nullable=True)
@@ -212,9 +346,80 @@ class Payment(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+class EmailDelivery(db.Model):
+    """One notification email per user per period (e.g. day or month).
+
+    The unique key makes re-running a fan-out idempotent: recipients whose
+    row is already 'sent' are skipped, and 'failed' ones are retried until
+    MAIL_MAX_ATTEMPTS.
+    """
+    __tablename__ = 'email_deliveries'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'kind', 'period', name='uq_email_deliveries_user_kind_period'),
+        db.Index('ix_email_deliveries_kind_period_status', 'kind', 'period', 'status'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    kind = db.Column(db.String(30), nullable=False)
+    period = db.Column(db.String(20), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+def configure_sqlite(engine, journal_mode='WAL', synchronous='NORMAL', busy_timeout_ms=15000):
+    """Apply per-connection pragmas so readers don't block the writer."""
+    if engine.dialect.name != 'sqlite':
+        return
+    
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+        cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.close()
+
+def reconcile_occupancy(lot_ids=None):
+    """Rebuild ParkingLot.available_spots/occupied_spots from parking_spots.
+
+    Counting and writing happen in one UPDATE, so a booking or release
+    committed while it runs can't be overwritten with a stale count.
+    Returns the number of lots whose counters were wrong.
+    """
+    def count(status):
+        return db.select(db.func.count(ParkingSpot.id)).where(
+            ParkingSpot.lot_id == ParkingLot.id, ParkingSpot.status == status
+        ).scalar_subquery()
+    available, occupied = count('A'), count('O')
+    stmt = db.update(ParkingLot).where(
+        db.or_(ParkingLot.available_spots != available, ParkingLot.occupied_spots != occupied)
+    ).values(available_spots=available, occupied_spots=occupied).execution_options(synchronize_session=False)
+    if lot_ids is not None:
+        stmt = stmt.where(ParkingLot.id.in_(lot_ids))
+    fixed = db.session.execute(stmt).rowcount
+    db.session.commit()
+    return fixed
+
 def init_db():
-    """Initialize database with only admin user. No hardcoded sample data."""
-    db.create_all()
+    """Initialize database with only admin user. No hardcoded sample data.
+
+    A new database is created from the models and stamped at the latest
+    migration; an existing one is brought up to date with `flask db upgrade`.
+    """
+    from flask_migrate import stamp, upgrade
+    
+    if db.inspect(db.engine).has_table('parking_lots'):
+        upgrade()
+        # 0003 adds the daily rollup empty; fill it from existing bookings
+        from stats import backfill_daily_stats
+        if backfill_daily_stats():
+            print("Backfilled daily_lot_stats from existing bookings")
+    else:
+        db.create_all()
+        stamp()
     
     # Create admin user if not exists
     if not Admin.query.first():
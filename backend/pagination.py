@@ -0,0 +1,46 @@
+import base64
+import json
+
+from flask import current_app, request
+
+
+def encode_cursor(*values):
+    """Opaque cursor for the sort key of the last row on a page."""
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def page_args():
+    """Read ?limit=&cursor= from the request. Raises ValueError on bad input."""
+    default = current_app.config['PAGE_SIZE_DEFAULT']
+    maximum = current_app.config['PAGE_SIZE_MAX']
+    limit = request.args.get('limit', default, type=int)
+    if limit is None or limit < 1:
+        raise ValueError('limit must be a positive integer')
+    cursor = request.args.get('cursor')
+    return min(limit, maximum), decode_cursor(cursor) if cursor else None
+
+
+def paginate(query, limit, cursor_for):
+    """Fetch one page from an already keyset-filtered, ordered query.
+
+    One extra row is read to learn whether another page exists, so no
+    COUNT(*) is needed.
+    """
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*cursor_for(rows[-1]))
+    return rows, next_cursor
@@ -0,0 +1,136 @@
+import json
+import os
+import threading
+import time
+from queue import Empty, Full, Queue
+
+import redis
+
+from blocklist import CircuitBreaker
+
+
+def availability_event(lot):
+    """Delta sent when a booking or release changes a lot's counters."""
+    return {
+        'type': 'availability',
+        'lot_id': lot.id,
+        'available_spots': lot.available_spots,
+        'occupied_spots': lot.occupied_spots,
+        'number_of_spots': lot.number_of_spots
+    }
+
+
+def lot_event(lot):
+    """Created or edited lot, in full."""
+    return {'type': 'lot', 'lot_id': lot.id, 'lot': lot.to_dict()}
+
+
+def lot_deleted_event(lot_id):
+    return {'type': 'lot-deleted', 'lot_id': lot_id}
+
+
+class AvailabilityStream:
+    """Lot events published on a Redis channel and fanned out to SSE clients.
+
+    Each process holds one subscription, read by a listener thread that
+    copies every event into the queue of each connected client, so idle
+    clients cost a queue apiece rather than a Redis connection. Under
+    gevent workers the thread and queues are cooperative and a stream
+    only occupies a greenlet while it waits.
+
+    There is no replay: a client that falls behind, or any client while
+    the subscription was down, gets a 'resync' event and should refetch
+    the lot list.
+    """
+
+    def __init__(self, client, channel='lots:events', heartbeat=15, queue_size=100,
+                 failure_threshold=5, reset_timeout=30):
+        self.client = client
+        self.channel = channel
+        self.heartbeat = heartbeat
+        self.queue_size = queue_size
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._clients = set()
+        self._listener_pid = None
+        self._lock = threading.Lock()
+
+    def publish(self, *events):
+        """Send `events` to every process's clients. Call after committing."""
+        if not events or not self.breaker.allow():
+            return False
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for event in events:
+                pipe.publish(self.channel, json.dumps(event))
+            pipe.execute()
+        except redis.RedisError as e:
+            self.breaker.failure()
+            print(f"Could not publish lot events: {str(e)}")
+            return False
+        except BaseException:
+            self.breaker.abandon()
+            raise
+        self.breaker.success()
+        return True
+
+    def _broadcast(self, event):
+        with self._lock:
+            clients = list(self._clients)
+        for queue in clients:
+            try:
+                queue.put_nowait(event)
+            except Full:
+                # Too slow to keep up: swap the backlog for a single resync
+                with queue.mutex:
+                    queue.queue.clear()
+                queue.put_nowait({'type': 'resync'})
+
+    def _ensure_listener(self):
+        # Started lazily and per process: threads don't survive gunicorn's fork
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self._clients = set()
+        threading.Thread(target=self._listen, name='availability-stream', daemon=True).start()
+
+    def _listen(self):
+        reconnecting = False
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                if reconnecting:
+                    # Events published while we weren't subscribed are lost
+                    self._broadcast({'type': 'resync'})
+                reconnecting = True
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self._broadcast(json.loads(message['data']))
+            except (redis.RedisError, ValueError):
+                time.sleep(1)
+            finally:
+                pubsub.close()
+
+    def events(self, lot_ids=None):
+        """Server-sent event lines for one client, optionally only for `lot_ids`."""
+        self._ensure_listener()
+        queue = Queue(self.queue_size)
+        with self._lock:
+            self._clients.add(queue)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = queue.get(timeout=self.heartbeat)
+                except Empty:
+                    # Keeps proxies from timing out and notices closed connections
+                    yield ': keepalive\n\n'
+                    continue
+                if lot_ids and event['type'] != 'resync' and event.get('lot_id') not in lot_ids:
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            with self._lock:
+                self._clients.discard(queue)
@@ -0,0 +1,180 @@
+from datetime import date, datetime
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from functools import lru_cache
+from io import BytesIO
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from sqlalchemy import func
+
+from mailer import sender
+from models import db, EmailDelivery, ParkingLot, ParkingSpot, ReserveParkingSpot, User
+from stats import app_timezone, duration_hours, local_day_bounds
+
+REPORT_KIND = 'monthly_report'
+
+
+def month_bounds(period, tz):
+    """Naive-UTC [start, end) covering the 'YYYY-MM' period in `tz`.
+
+    Like stats.local_day_bounds, so a booking counts towards the month it
+    was made in locally and the parking_timestamp index can be used.
+    """
+    first = datetime.strptime(period, '%Y-%m').date()
+    next_first = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+    return local_day_bounds(first, tz)[0], local_day_bounds(next_first, tz)[0]
+
+
+def previous_month(now=None):
+    """The 'YYYY-MM' period before the current month in the app's timezone."""
+    now = now or datetime.now(app_timezone())
+    return f'{now.year - 1}-12' if now.month == 1 else f'{now.year}-{now.month - 1:02d}'
+
+
+def iter_monthly_summaries(period, after_user=0, batch_size=1000):
+    """Yield one report summary per user who booked during `period`.
+
+    A single query grouped by (user, lot) covers every user; rows arrive
+    ordered by user so each summary is emitted as soon as its last row is
+    read, keeping memory flat. Users with no email or whose report for
+    the period is already sent are left out, which is what makes a run
+    resumable. `after_user` skips user ids up to and including it.
+    """
+    start, end = month_bounds(period, app_timezone())
+    now = datetime.utcnow()
+    already_sent = db.session.query(EmailDelivery.user_id).filter(
+        EmailDelivery.kind == REPORT_KIND,
+        EmailDelivery.period == period,
+        EmailDelivery.status == 'sent'
+    )
+    hours = duration_hours(
+        ReserveParkingSpot.parking_timestamp,
+        func.coalesce(ReserveParkingSpot.leaving_timestamp, now)
+    )
+    rows = db.session.query(
+        ReserveParkingSpot.user_id,
+        ParkingLot.prime_location_name,
+        func.count(ReserveParkingSpot.id),
+        func.coalesce(func.sum(ReserveParkingSpot.parking_cost), 0),
+        func.coalesce(func.sum(hours), 0)
+    ).join(
+        User, ReserveParkingSpot.user_id == User.id
+    ).outerjoin(
+        ParkingSpot, ReserveParkingSpot.spot_id == ParkingSpot.id
+    ).outerjoin(
+        ParkingLot, ParkingSpot.lot_id == ParkingLot.id
+    ).filter(
+        ReserveParkingSpot.parking_timestamp >= start,
+        ReserveParkingSpot.parking_timestamp < end,
+        User.email.isnot(None),
+        User.email != '',
+        User.id.notin_(already_sent),
+        ReserveParkingSpot.user_id > after_user
+    ).group_by(
+        ReserveParkingSpot.user_id, ParkingLot.id, ParkingLot.prime_location_name
+    ).order_by(ReserveParkingSpot.user_id).yield_per(batch_size)
+
+    summary = None
+    lot_usage = {}
+    for user_id, lot_name, bookings, spent, lot_hours in rows:
+        if summary is None or summary['user_id'] != user_id:
+            if summary is not None:
+                yield _finish(summary, lot_usage)
+            summary = {'user_id': user_id, 'total_bookings': 0, 'total_spent': 0.0, 'total_hours': 0.0}
+            lot_usage = {}
+        summary['total_bookings'] += bookings
+        summary['total_spent'] += float(spent)
+        summary['total_hours'] += float(lot_hours)
+        if lot_name:
+            lot_usage[lot_name] = lot_usage.get(lot_name, 0) + bookings
+    if summary is not None:
+        yield _finish(summary, lot_usage)
+
+
+def _finish(summary, lot_usage):
+    summary['most_used_lot'] = max(lot_usage, key=lot_usage.get) if lot_usage else 'N/A'
+    return summary
+
+
+@lru_cache(maxsize=None)
+def report_styles():
+    """Stylesheet and table style, built once per worker process."""
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        textColor=colors.HexColor('#667eea'),
+        spaceAfter=10,
+        alignment=1
+    )
+    table_style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#667eea')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ])
+    return styles, title_style, table_style
+
+
+def render_report(user, summary, period):
+    """PDF bytes of one user's monthly report."""
+    styles, title_style, table_style = report_styles()
+    month_label = datetime.strptime(period, '%Y-%m').strftime('%B %Y')
+
+    pdf_buffer = BytesIO()
+    doc = SimpleDocTemplate(pdf_buffer, pagesize=letter)
+    story = [
+        Paragraph("Monthly Parking Activity Report", title_style),
+        Paragraph(month_label, styles['Heading3']),
+        Spacer(1, 0.3*inch),
+        Paragraph(f"Dear {user.full_name or user.username},", styles['Normal']),
+        Spacer(1, 0.2*inch),
+        Paragraph(f"Here's your parking activity summary for {month_label}:", styles['Normal']),
+        Spacer(1, 0.3*inch),
+    ]
+
+    data = [
+        ['Metric', 'Value'],
+        ['Total Bookings', str(summary['total_bookings'])],
+        ['Total Hours Parked', f"{round(summary['total_hours'], 2)}h"],
+        ['Total Amount Spent', f"Rs. {summary['total_spent']:.2f}"],
+        ['Most Used Parking Lot', str(summary['most_used_lot'])]
+    ]
+    table = Table(data, colWidths=[3*inch, 2*inch])
+    table.setStyle(table_style)
+
+    story.append(table)
+    story.append(Spacer(1, 0.3*inch))
+    story.append(Paragraph("Thank you for using our Vehicle Parking App!", styles['Normal']))
+
+    doc.build(story)
+    return pdf_buffer.getvalue()
+
+
+def report_message(user, summary, period):
+    month = datetime.strptime(period, '%Y-%m')
+
+    msg = MIMEMultipart()
+    msg['From'] = sender()
+    msg['To'] = user.email
+    msg['Subject'] = f"Monthly Parking Report - {month.strftime('%B %Y')}"
+
+    msg.attach(MIMEText(f"Hello {user.full_name or user.username},\n\nPlease find attached your monthly parking activity report.\n\nBest regards,\nParking App Team", 'plain'))
+
+    attachment = MIMEBase('application', 'octet-stream')
+    attachment.set_payload(render_report(user, summary, period))
+    encoders.encode_base64(attachment)
+    attachment.add_header('Content-Disposition', f'attachment; filename= parking_report_{month.strftime("%B_%Y")}.pdf')
+    msg.attach(attachment)
+    return msg
@@ -0,0 +1,231 @@
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import update
+
+from blocklist import TTLCache
+from models import db, AdvanceReservation, ParkingSpot
+
+# Reservations tried before giving up when others grab the same spots first
+CLAIM_ATTEMPTS = 5
+# A window may start this far in the past, to allow for client clock skew
+CLOCK_SKEW = timedelta(minutes=1)
+
+
+def parse_time(value):
+    """ISO 8601 string as a naive UTC datetime. Raises ValueError."""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def validate_window(start, end, now, max_duration, max_ahead):
+    """Raise ValueError unless [start, end) is a window that may be reserved."""
+    if end <= start:
+        raise ValueError('end_time must be after start_time')
+    if start < now - CLOCK_SKEW:
+        raise ValueError('start_time is in the past')
+    if end - start > max_duration:
+        raise ValueError(f'Reservations can be at most {max_duration.total_seconds() / 3600:g} hours long')
+    if start > now + max_ahead:
+        raise ValueError(f'Reservations can start at most {max_ahead.days} days ahead')
+
+
+class SpotIntervals:
+    """One spot's reserved [start, end) windows, sorted and non-overlapping.
+
+    Because the windows don't overlap, sorting them by start also sorts
+    them by end, so the windows around any moment are found with a single
+    bisect.
+    """
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def add(self, start, end):
+        index = bisect_left(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+
+    def gap(self, start, end):
+        """(free_from, free_until) around [start, end), None if it overlaps a window.
+
+        Either bound is None when the spot is free indefinitely that way.
+        """
+        index = bisect_left(self.starts, end)
+        if index and self.ends[index - 1] > start:
+            return None
+        return (
+            self.ends[index - 1] if index else None,
+            self.starts[index] if index < len(self.starts) else None
+        )
+
+
+def _fit(gap, start, end):
+    """Sort key for best fit: fewest unbounded sides, then least slack."""
+    free_from, free_until = gap
+    unbounded = (free_from is None) + (free_until is None)
+    slack = 0.0
+    if free_from is not None:
+        slack += (start - free_from).total_seconds()
+    if free_until is not None:
+        slack += (free_until - end).total_seconds()
+    return unbounded, slack
+
+
+class ReservationIndex:
+    """Per-lot SpotIntervals of upcoming reservations, cached per process.
+
+    A lot's intervals are loaded in one query on the (lot_id, end_time,
+    start_time) index and kept until its change counter in Redis moves,
+    which every reservation, cancellation and check-in bumps. When Redis
+    can't be read the lot is reloaded on each use. The database stays the
+    authority: create() re-checks overlaps under a lock on the spot row.
+    """
+
+    def __init__(self, versions, walkin_buffer, max_lots=256, ttl=300):
+        self.versions = versions
+        self.walkin_buffer = walkin_buffer
+        self._lots = TTLCache(max_lots, ttl)
+
+    def version_key(self, lot_id):
+        return f'reservations:lots:{lot_id}:version'
+
+    def intervals(self, lot_id, now):
+        """{spot_id: SpotIntervals} for reservations in `lot_id` not yet over."""
+        tag = self.versions.tag('reservations', [self.version_key(lot_id)])
+        cached = self._lots.get(lot_id)
+        if cached is not None and tag is not None and cached[0] == tag:
+            return cached[1]
+
+        spots = {}
+        rows = db.session.query(
+            AdvanceReservation.spot_id, AdvanceReservation.start_time, AdvanceReservation.end_time
+        ).filter(
+            AdvanceReservation.lot_id == lot_id,
+            AdvanceReservation.end_time > now,
+            AdvanceReservation.status == 'booked'
+        )
+        for spot_id, start, end in rows:
+            spots.setdefault(spot_id, SpotIntervals()).add(start, end)
+        if tag is not None:
+            self._lots.set(lot_id, (tag, spots))
+        return spots
+
+    def changed(self, lot_id):
+        """Call after committing a change to `lot_id`'s reservations."""
+        self._lots.delete(lot_id)
+        self.versions.bump([self.version_key(lot_id)])
+
+    def taken_spots(self, lot_id, start, end, now):
+        """Ids of the spots in `lot_id` that can't be reserved for [start, end).
+
+        Those with a booked reservation overlapping the window, found on the
+        (lot_id, end_time, start_time) index, and, when the window starts
+        less than `walkin_buffer` from now, those with someone parked.
+        """
+        taken = {spot_id for (spot_id,) in db.session.query(AdvanceReservation.spot_id).filter(
+            AdvanceReservation.lot_id == lot_id,
+            AdvanceReservation.start_time < end,
+            AdvanceReservation.end_time > start,
+            AdvanceReservation.status == 'booked'
+        )}
+        if start < now + self.walkin_buffer:
+            taken.update(spot_id for (spot_id,) in db.session.query(ParkingSpot.id).filter(
+                ParkingSpot.lot_id == lot_id,
+                ParkingSpot.status == 'O'
+            ))
+        return taken
+
+    def count_free(self, lot_id, number_of_spots, start, end, now):
+        """How many of the lot's `number_of_spots` are free for [start, end)."""
+        return max(number_of_spots - len(self.taken_spots(lot_id, start, end, now)), 0)
+
+    def free_spots(self, lot_id, start, end, now, limit=CLAIM_ATTEMPTS):
+        """Up to `limit` spot ids free for [start, end), best fit first.
+
+        The best fit is the spot whose free stretch around the window is
+        tightest, which keeps long free stretches whole for later requests.
+        Spots with upcoming reservations are ranked from the cached
+        intervals; spots with none are the loosest fit and only read from
+        the database, in id order, when too few of the others are free.
+        """
+        taken = self.taken_spots(lot_id, start, end, now)
+        intervals = self.intervals(lot_id, now)
+        ranked = []
+        for spot_id, spans in intervals.items():
+            if spot_id in taken:
+                continue
+            gap = spans.gap(start, end)
+            if gap is not None:
+                ranked.append((_fit(gap, start, end), spot_id))
+        ranked.sort()
+        spots = [spot_id for _, spot_id in ranked[:limit]]
+        if len(spots) < limit:
+            query = db.session.query(ParkingSpot.id).filter(ParkingSpot.lot_id == lot_id)
+            skip = taken | set(intervals)
+            if skip:
+                query = query.filter(ParkingSpot.id.notin_(skip))
+            spots += [spot_id for (spot_id,) in query.order_by(ParkingSpot.id).limit(limit - len(spots))]
+        return spots
+
+    def walkin_plan(self, lot_id, now):
+        """(avoid, fallback) spot ids for someone parking now; see spot_pool.allocate_spot.
+
+        A walk-in has no end time, so it goes to a spot with no upcoming
+        reservation if there is one: every reserved spot is in `avoid`.
+        Failing that, `fallback` has the reserved spots that stay free for
+        at least `walkin_buffer`, longest free first. Only the cached
+        intervals are read; the allocator checks which spots are free.
+        """
+        intervals = self.intervals(lot_id, now)
+        fallback = []
+        for spot_id, spans in intervals.items():
+            gap = spans.gap(now, now + self.walkin_buffer)
+            if gap is not None:
+                fallback.append((-gap[1].timestamp(), spot_id))
+        fallback.sort()
+        return list(intervals), [spot_id for _, spot_id in fallback]
+
+    def create(self, user_id, lot_id, start, end, vehicle_number=None, now=None):
+        """Reserve the best-fitting free spot in `lot_id`; None if there is none.
+
+        Each candidate spot row is locked with a no-op UPDATE before its
+        reservations are checked, so two requests can't both take the same
+        window. The caller commits and then calls changed().
+        """
+        now = now or datetime.utcnow()
+        for spot_id in self.free_spots(lot_id, start, end, now):
+            db.session.execute(
+                update(ParkingSpot)
+                .where(ParkingSpot.id == spot_id)
+                .values(lot_id=ParkingSpot.lot_id)
+                .execution_options(synchronize_session=False)
+            )
+            status = db.session.query(ParkingSpot.status).filter(ParkingSpot.id == spot_id).scalar()
+            if status is None or (status == 'O' and start < now + self.walkin_buffer):
+                continue
+            clash = db.session.query(AdvanceReservation.id).filter(
+                AdvanceReservation.spot_id == spot_id,
+                AdvanceReservation.status == 'booked',
+                AdvanceReservation.start_time < end,
+                AdvanceReservation.end_time > start
+            ).first()
+            if clash:
+                continue
+            reservation = AdvanceReservation(
+                lot_id=lot_id,
+                spot_id=spot_id,
+                user_id=user_id,
+                vehicle_number=vehicle_number,
+                start_time=start,
+                end_time=end,
+                status='booked'
+            )
+            db.session.add(reservation)
+            db.session.flush()
+            return reservation
+        return None
@@ -0,0 +1,171 @@
+from sqlalchemy import delete, insert, select, update
+
+from models import db, AdvanceReservation, ParkingLot, ParkingSpot, ReserveParkingSpot, reconcile_occupancy
+
+# Spots that lose a race to another booking are retried this many times
+# before the request gives up.
+CLAIM_ATTEMPTS = 5
+# Candidate spot ids whose status is read in one query
+CANDIDATE_CHUNK = 50
+
+
+def _reserve_capacity(lot_id):
+    """Take one unit off the lot's available counter if any is left.
+
+    This single-row conditional UPDATE is the admission gate: once it
+    succeeds the caller is guaranteed a free spot exists for it.
+    """
+    result = db.session.execute(
+        update(ParkingLot)
+        .where(ParkingLot.id == lot_id, ParkingLot.available_spots > 0)
+        .values(
+            available_spots=ParkingLot.available_spots - 1,
+            occupied_spots=ParkingLot.occupied_spots + 1
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def _next_free_spot_id(lot_id, avoid=()):
+    candidate = select(ParkingSpot.id).where(
+        ParkingSpot.lot_id == lot_id, ParkingSpot.status == 'A'
+    ).limit(1)
+    if avoid:
+        candidate = candidate.where(ParkingSpot.id.notin_(avoid))
+    if db.session.get_bind().dialect.name == 'postgresql':
+        candidate = candidate.with_for_update(skip_locked=True)
+    return db.session.execute(candidate).scalar()
+
+
+def _claim(spot_id, vehicle_number):
+    return db.session.execute(
+        update(ParkingSpot)
+        .where(ParkingSpot.id == spot_id, ParkingSpot.status == 'A')
+        .values(status='O', vehicle_number=vehicle_number)
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+
+
+def _claim_first(spot_ids, vehicle_number):
+    """Claim the first spot of `spot_ids` that is still free, or None.
+
+    Statuses are read a chunk at a time, so taken spots cost nothing and
+    the whole list is tried without a query per id.
+    """
+    for start in range(0, len(spot_ids), CANDIDATE_CHUNK):
+        chunk = spot_ids[start:start + CANDIDATE_CHUNK]
+        free = set(db.session.execute(
+            select(ParkingSpot.id).where(ParkingSpot.id.in_(chunk), ParkingSpot.status == 'A')
+        ).scalars())
+        for spot_id in chunk:
+            if spot_id in free and _claim(spot_id, vehicle_number):
+                return spot_id
+    return None
+
+
+def allocate_spot(lot_id, vehicle_number=None, preferred=(), avoid=(), fallback=()):
+    """Atomically claim a free spot in `lot_id`.
+
+    Returns the claimed ParkingSpot (status already 'O'), or None if no
+    allowed spot is free. Spots in `preferred` are tried first, in order;
+    then any free spot not in `avoid`; then `fallback`, in order. Advance
+    reservations use these to steer walk-ins around reserved spots. The
+    caller commits, which also publishes the counter change.
+    """
+    if not _reserve_capacity(lot_id):
+        return None
+
+    spot_id = _claim_first(list(preferred), vehicle_number) if preferred else None
+
+    if spot_id is None:
+        avoid = list(avoid)
+        for _ in range(CLAIM_ATTEMPTS):
+            candidate = _next_free_spot_id(lot_id, avoid)
+            if candidate is None:
+                break
+            if _claim(candidate, vehicle_number):
+                spot_id = candidate
+                break
+
+    if spot_id is None and fallback:
+        spot_id = _claim_first(list(fallback), vehicle_number)
+
+    if spot_id is not None:
+        return db.session.get(ParkingSpot, spot_id, populate_existing=True)
+
+    db.session.rollback()
+    if not preferred and not avoid:
+        # The counter promised a spot the table doesn't have: resync.
+        reconcile_occupancy([lot_id])
+    return None
+
+
+def release_spot(booking, spot, leaving_timestamp, parking_cost):
+    """Close `booking` and return its spot to the lot's free pool.
+
+    The booking row is the gate: only the release that moves its
+    leaving_timestamp off NULL frees the spot, so a duplicate release that
+    arrives late can't free a spot someone has booked since. Returns False,
+    changing nothing, if the booking was already closed.
+    """
+    closed = db.session.execute(
+        update(ReserveParkingSpot)
+        .where(ReserveParkingSpot.id == booking.id, ReserveParkingSpot.leaving_timestamp.is_(None))
+        .values(leaving_timestamp=leaving_timestamp, parking_cost=parking_cost)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if closed != 1:
+        return False
+
+    released = db.session.execute(
+        update(ParkingSpot)
+        .where(ParkingSpot.id == spot.id, ParkingSpot.status == 'O')
+        .values(status='A', vehicle_number=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if released:
+        db.session.execute(
+            update(ParkingLot)
+            .where(ParkingLot.id == spot.lot_id)
+            .values(
+                available_spots=ParkingLot.available_spots + 1,
+                occupied_spots=ParkingLot.occupied_spots - 1
+            )
+            .execution_options(synchronize_session=False)
+        )
+    db.session.refresh(booking)
+    db.session.refresh(spot)
+    return True
+
+
+def provision_spots(lot, count):
+    """Add `count` free spots to `lot` with a single executemany INSERT."""
+    if count <= 0:
+        return
+    db.session.execute(insert(ParkingSpot), [{'lot_id': lot.id, 'status': 'A'}] * count)
+    lot.adjust_occupancy(available=count)
+
+
+def deprovision_spots(lot, count):
+    """Delete up to `count` free spots from `lot` in one DELETE.
+
+    Only spots that have never been booked or reserved are removed so
+    reservation history keeps pointing at a real spot. Returns how many were deleted;
+    the caller decides whether a partial result is acceptable.
+    """
+    if count <= 0:
+        return 0
+    removable = select(ParkingSpot.id).where(
+        ParkingSpot.lot_id == lot.id,
+        ParkingSpot.status == 'A',
+        ~select(ReserveParkingSpot.id).where(ReserveParkingSpot.spot_id == ParkingSpot.id).exists(),
+        ~select(AdvanceReservation.id).where(AdvanceReservation.spot_id == ParkingSpot.id).exists()
+    ).order_by(ParkingSpot.id.desc()).limit(count)
+    deleted = db.session.execute(
+        delete(ParkingSpot)
+        .where(ParkingSpot.id.in_(removable.scalar_subquery()))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    lot.adjust_occupancy(available=-deleted)
+    return deleted
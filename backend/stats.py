@@ -0,0 +1,348 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, DailyLotStats, ParkingLot, ParkingSpot, ReserveParkingSpot
+
+# Releases stamp leaving_timestamp before they commit. One older than this is
+# assumed committed, so rebuilds read it without holding the rollup lock.
+SETTLE_MARGIN = timedelta(minutes=10)
+
+
+def app_timezone():
+    return ZoneInfo(current_app.config['APP_TIMEZONE'])
+
+
+def local_day_bounds(day, tz):
+    """Naive-UTC half-open range [start, end) covering calendar `day` in `tz`.
+
+    Timestamps are stored as naive UTC, so comparing the raw column against
+    these bounds lets the parking_timestamp index do the work instead of
+    wrapping every row in DATE().
+    """
+    start = datetime.combine(day, time.min, tzinfo=tz)
+    end = datetime.combine(day + timedelta(days=1), time.min, tzinfo=tz)
+    return (
+        start.astimezone(timezone.utc).replace(tzinfo=None),
+        end.astimezone(timezone.utc).replace(tzinfo=None)
+    )
+
+
+def today_bounds(tz):
+    return local_day_bounds(datetime.now(tz).date(), tz)
+
+
+def local_day(timestamp, tz):
+    """Calendar day in `tz` of a naive-UTC timestamp."""
+    return timestamp.replace(tzinfo=timezone.utc).astimezone(tz).date()
+
+
+def _booking_filters(query, start=None, end=None, lot_ids=None):
+    if start is not None:
+        query = query.filter(ReserveParkingSpot.parking_timestamp >= start)
+    if end is not None:
+        query = query.filter(ReserveParkingSpot.parking_timestamp < end)
+    if lot_ids:
+        query = query.filter(ParkingSpot.lot_id.in_(lot_ids))
+    return query
+
+
+def _rollup_filters(query, start_day=None, end_day=None, lot_ids=None):
+    if start_day is not None:
+        query = query.filter(DailyLotStats.day >= start_day)
+    if end_day is not None:
+        query = query.filter(DailyLotStats.day <= end_day)
+    if lot_ids:
+        query = query.filter(DailyLotStats.lot_id.in_(lot_ids))
+    return query
+
+
+def _active_filters(query, start_day=None, end_day=None, lot_ids=None):
+    """Restrict to open bookings; there are at most as many as occupied spots."""
+    tz = app_timezone()
+    start = local_day_bounds(start_day, tz)[0] if start_day else None
+    end = local_day_bounds(end_day, tz)[1] if end_day else None
+    query = query.join(ParkingSpot, ReserveParkingSpot.spot_id == ParkingSpot.id)
+    query = query.filter(ReserveParkingSpot.leaving_timestamp.is_(None))
+    return _booking_filters(query, start, end, lot_ids)
+
+
+def booking_count(start=None, end=None, lot_ids=None):
+    query = db.session.query(func.count(ReserveParkingSpot.id))
+    if lot_ids:
+        query = query.join(ParkingSpot, ReserveParkingSpot.spot_id == ParkingSpot.id)
+    return _booking_filters(query, start, end, lot_ids).scalar()
+
+
+def bookings_by_lot(start_day=None, end_day=None, lot_ids=None):
+    """Booking count and revenue per lot.
+
+    Completed bookings come from the daily_lot_stats rollup and open ones
+    from a GROUP BY over active reservations, so cost does not grow with
+    total history. `start_day`/`end_day` are inclusive dates in
+    APP_TIMEZONE. Returns {lot_id: (bookings, revenue)}.
+    """
+    closed = db.session.query(
+        DailyLotStats.lot_id,
+        func.sum(DailyLotStats.bookings),
+        func.sum(DailyLotStats.revenue)
+    )
+    closed = _rollup_filters(closed, start_day, end_day, lot_ids).group_by(DailyLotStats.lot_id)
+    result = {lot_id: (bookings, revenue) for lot_id, bookings, revenue in closed}
+
+    active = db.session.query(ParkingSpot.lot_id, func.count(ReserveParkingSpot.id))
+    active = _active_filters(active, start_day, end_day, lot_ids).group_by(ParkingSpot.lot_id)
+    for lot_id, count in active:
+        bookings, revenue = result.get(lot_id, (0, 0))
+        result[lot_id] = (bookings + count, revenue)
+    return result
+
+
+def occupancy_by_lot(lot_ids=None):
+    """Lot name and spot status counts per lot, read from the occupancy counters."""
+    query = db.session.query(
+        ParkingLot.id,
+        ParkingLot.prime_location_name,
+        ParkingLot.available_spots,
+        ParkingLot.occupied_spots
+    ).order_by(ParkingLot.id)
+    if lot_ids:
+        query = query.filter(ParkingLot.id.in_(lot_ids))
+    return query.all()
+
+
+def lot_summary(start_day=None, end_day=None, lot_ids=None):
+    bookings = bookings_by_lot(start_day, end_day, lot_ids)
+    lot_stats = []
+    for lot_id, name, available, occupied in occupancy_by_lot(lot_ids):
+        count, revenue = bookings.get(lot_id, (0, 0))
+        lot_stats.append({
+            'lot_id': lot_id,
+            'name': name,
+            'total_bookings': count,
+            'revenue': round(revenue or 0, 2),
+            'available': available,
+            'occupied': occupied
+        })
+    return lot_stats
+
+
+def totals(start_day=None, end_day=None, lot_ids=None):
+    """Network-wide figures for the admin dashboard."""
+    lots = db.session.query(
+        func.count(ParkingLot.id),
+        func.coalesce(func.sum(ParkingLot.available_spots), 0),
+        func.coalesce(func.sum(ParkingLot.occupied_spots), 0)
+    )
+    if lot_ids:
+        lots = lots.filter(ParkingLot.id.in_(lot_ids))
+    total_lots, available, occupied = lots.one()
+
+    closed = db.session.query(
+        func.coalesce(func.sum(DailyLotStats.bookings), 0),
+        func.coalesce(func.sum(DailyLotStats.revenue), 0)
+    )
+    closed_bookings, revenue = _rollup_filters(closed, start_day, end_day, lot_ids).one()
+    active_bookings = _active_filters(
+        db.session.query(func.count(ReserveParkingSpot.id)), start_day, end_day, lot_ids
+    ).scalar()
+
+    return {
+        'total_lots': total_lots,
+        'total_spots': available + occupied,
+        'available_spots': available,
+        'occupied_spots': occupied,
+        'total_bookings': closed_bookings + active_bookings,
+        'total_revenue': round(revenue, 2)
+    }
+
+
+def duration_hours(start, end):
+    """SQL expression for end - start in hours, for the bound dialect."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return (func.julianday(end) - func.julianday(start)) * 24
+    if dialect == 'postgresql':
+        return func.extract('epoch', end - start) / 3600
+    return func.timestampdiff(db.text('SECOND'), start, end) / 3600.0
+
+
+def user_summary(user_id):
+    """Booking totals for one user computed in the database.
+
+    Open bookings contribute their start times instead of hours so the
+    result can be cached and topped up with the elapsed time on read.
+    """
+    closed = ReserveParkingSpot.leaving_timestamp.isnot(None)
+    total_bookings, closed_bookings, total_spent, closed_hours = db.session.query(
+        func.count(ReserveParkingSpot.id),
+        func.count(ReserveParkingSpot.leaving_timestamp),
+        func.coalesce(func.sum(ReserveParkingSpot.parking_cost), 0),
+        func.coalesce(func.sum(db.case(
+            (closed, duration_hours(ReserveParkingSpot.parking_timestamp, ReserveParkingSpot.leaving_timestamp)),
+            else_=0
+        )), 0)
+    ).filter(ReserveParkingSpot.user_id == user_id).one()
+
+    active_since = [ts for (ts,) in db.session.query(ReserveParkingSpot.parking_timestamp).filter(
+        ReserveParkingSpot.user_id == user_id,
+        ReserveParkingSpot.leaving_timestamp.is_(None)
+    )]
+
+    lot_usage = db.session.query(
+        ParkingLot.prime_location_name,
+        func.count(ReserveParkingSpot.id)
+    ).join(ParkingSpot, ReserveParkingSpot.spot_id == ParkingSpot.id).join(
+        ParkingLot, ParkingSpot.lot_id == ParkingLot.id
+    ).filter(ReserveParkingSpot.user_id == user_id).group_by(
+        ParkingLot.id, ParkingLot.prime_location_name
+    )
+
+    usage = {}
+    for name, count in lot_usage:
+        usage[name] = usage.get(name, 0) + count
+
+    return {
+        'total_bookings': total_bookings,
+        'completed_bookings': closed_bookings,
+        'total_spent': float(total_spent),
+        'closed_hours': float(closed_hours),
+        'active_since': active_since,
+        'lot_usage': usage
+    }
+
+
+def _upsert_daily(lot_id, day, bookings, revenue, occupied_hours):
+    values = {
+        'lot_id': lot_id,
+        'day': day,
+        'bookings': bookings,
+        'revenue': revenue,
+        'occupied_hours': occupied_hours
+    }
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        stmt = insert(DailyLotStats).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['lot_id', 'day'],
+            set_={
+                'bookings': DailyLotStats.bookings + stmt.excluded.bookings,
+                'revenue': DailyLotStats.revenue + stmt.excluded.revenue,
+                'occupied_hours': DailyLotStats.occupied_hours + stmt.excluded.occupied_hours
+            }
+        )
+        db.session.execute(stmt)
+        return
+
+    row = DailyLotStats.query.filter_by(lot_id=lot_id, day=day).with_for_update().first()
+    if row is None:
+        db.session.add(DailyLotStats(**values))
+    else:
+        row.bookings = DailyLotStats.bookings + bookings
+        row.revenue = DailyLotStats.revenue + revenue
+        row.occupied_hours = DailyLotStats.occupied_hours + occupied_hours
+
+
+def record_closed_booking(reservation, lot_id):
+    """Add a just-released booking to the rollup; runs in the caller's transaction."""
+    hours = (reservation.leaving_timestamp - reservation.parking_timestamp).total_seconds() / 3600
+    _upsert_daily(
+        lot_id,
+        local_day(reservation.parking_timestamp, app_timezone()),
+        1,
+        reservation.parking_cost or 0,
+        hours
+    )
+
+
+def _accumulate(buckets, query, tz, batch_size):
+    for lot_id, parked, left, cost in query.yield_per(batch_size):
+        bucket = buckets[(lot_id, local_day(parked, tz))]
+        bucket[0] += 1
+        bucket[1] += cost or 0
+        bucket[2] += (left - parked).total_seconds() / 3600
+
+
+def _lock_rollup(lot_ids=None):
+    """Hold off record_closed_booking for `lot_ids` (all lots if None) until commit."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        if lot_ids:
+            # Releases update their lot's counters before touching the rollup
+            db.session.execute(
+                db.select(ParkingLot.id).where(ParkingLot.id.in_(lot_ids)).order_by(ParkingLot.id).with_for_update()
+            )
+        else:
+            db.session.execute(db.text('LOCK TABLE daily_lot_stats IN EXCLUSIVE MODE'))
+    # On SQLite the DELETE that follows takes the database write lock
+
+
+def rebuild_daily_stats(lot_ids=None, since=None, batch_size=1000):
+    """Recompute daily_lot_stats from completed reservations.
+
+    With `since` (naive UTC) only the days from its local day onwards
+    are rebuilt.
+
+    Streams reservations in batches and accumulates per (lot, day) in
+    memory, which is bounded by lots x days rather than by bookings.
+    Bookings closed more than SETTLE_MARGIN ago are read first without
+    any lock. Only then is the rollup locked, and the brief swap re-reads
+    just the recent releases, so a release committed mid-rebuild is
+    counted once and releases never wait on the history scan. Returns
+    the number of rollup rows written.
+    """
+    tz = app_timezone()
+    query = db.session.query(
+        ParkingSpot.lot_id,
+        ReserveParkingSpot.parking_timestamp,
+        ReserveParkingSpot.leaving_timestamp,
+        ReserveParkingSpot.parking_cost
+    ).join(ParkingSpot, ReserveParkingSpot.spot_id == ParkingSpot.id).filter(
+        ReserveParkingSpot.leaving_timestamp.isnot(None)
+    )
+    if lot_ids:
+        query = query.filter(ParkingSpot.lot_id.in_(lot_ids))
+    first_day = local_day(since, tz) if since is not None else None
+    if first_day is not None:
+        query = query.filter(ReserveParkingSpot.parking_timestamp >= local_day_bounds(first_day, tz)[0])
+
+    buckets = defaultdict(lambda: [0, 0.0, 0.0])
+    settled = datetime.utcnow() - SETTLE_MARGIN
+    _accumulate(buckets, query.filter(ReserveParkingSpot.leaving_timestamp < settled), tz, batch_size)
+
+    _lock_rollup(lot_ids)
+    stale = DailyLotStats.query
+    if lot_ids:
+        stale = stale.filter(DailyLotStats.lot_id.in_(lot_ids))
+    if first_day is not None:
+        stale = stale.filter(DailyLotStats.day >= first_day)
+    stale.delete(synchronize_session=False)
+    _accumulate(buckets, query.filter(ReserveParkingSpot.leaving_timestamp >= settled), tz, batch_size)
+
+    if buckets:
+        db.session.execute(db.insert(DailyLotStats), [
+            {'lot_id': lot_id, 'day': day, 'bookings': b, 'revenue': r, 'occupied_hours': h}
+            for (lot_id, day), (b, r, h) in buckets.items()
+        ])
+    db.session.commit()
+    return len(buckets)
+
+
+def backfill_daily_stats():
+    """Build the rollup if it is empty but closed bookings exist.
+
+    Migration 0003 creates daily_lot_stats empty, so an upgraded database
+    reports no revenue until this runs. Returns the rows written, or None
+    if there was nothing to do.
+    """
+    if db.session.query(DailyLotStats.id).first() is not None:
+        return None
+    if db.session.query(ReserveParkingSpot.id).filter(ReserveParkingSpot.leaving_timestamp.isnot(None)).first() is None:
+        return None
+    return rebuild_daily_stats()
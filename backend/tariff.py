@@ -0,0 +1,253 @@
+import json
+import threading
+from bisect import bisect_right
+from datetime import datetime, timezone
+
+from sqlalchemy import update
+
+from models import db, ParkingSpot, Payment, ReserveParkingSpot
+
+try:
+    import numpy as np
+except ImportError:  # Bulk repricing falls back to a per-booking loop
+    np = None
+
+DAY = 24 * 3600
+EPOCH = datetime(1970, 1, 1)
+
+
+def _clock_seconds(value):
+    """'HH:MM' as seconds after midnight. Raises ValueError."""
+    hours, minutes = (int(part) for part in str(value).split(':'))
+    if not (0 <= hours <= 24 and 0 <= minutes < 60) or hours * 60 + minutes > 24 * 60:
+        raise ValueError(f'Invalid time of day: {value}')
+    return (hours * 60 + minutes) * 60
+
+
+def parse_rules(value):
+    """Tariff rules from a request (dict, JSON string or empty). Raises ValueError."""
+    if value in (None, '', {}):
+        return None
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValueError('tariff must be a JSON object')
+    if not isinstance(value, dict):
+        raise ValueError('tariff must be a JSON object')
+    # Compiling checks every field
+    Tariff(value, 0)
+    return value
+
+
+class Tariff:
+    """A lot's pricing rules compiled into breakpoint tables.
+
+    Rules (all optional) look like::
+
+        {"tiers": [{"hours": 1, "rate": 40}, {"hours": 3, "rate": 30}],
+         "periods": [{"from": "22:00", "to": "07:00", "multiplier": 0.5}],
+         "daily_cap": 300}
+
+    Time of day turns a stay into billable hours: each hour inside a
+    period counts `multiplier` hours, in APP_TIMEZONE. Tiers then price
+    billable hours, `rate` per hour until `hours` billable hours into the
+    day, and the lot's price after the last tier. Tiers and the cap start
+    over every 24 hours of a stay. With no rules this is hours x price.
+
+    Both tables are piecewise linear, so the cost of any stay is two
+    bisects plus arithmetic.
+    """
+
+    def __init__(self, rules, price):
+        rules = rules or {}
+        # Billable hours -> cost: tier starts, cost at each start, rate after it
+        self.tier_starts = [0.0]
+        self.tier_costs = [0.0]
+        self.tier_rates = []
+        for tier in rules.get('tiers') or []:
+            try:
+                hours, rate = float(tier['hours']), float(tier['rate'])
+            except (KeyError, TypeError, ValueError):
+                raise ValueError('Each tier needs numeric hours and rate')
+            if hours <= self.tier_starts[-1] or rate < 0:
+                raise ValueError('Tier hours must increase and rates cannot be negative')
+            self.tier_rates.append(rate)
+            self.tier_costs.append(self.tier_costs[-1] + (hours - self.tier_starts[-1]) * rate)
+            self.tier_starts.append(hours)
+        self.tier_rates.append(float(price))
+
+        # Seconds after local midnight -> billable hours since midnight.
+        # Later periods override earlier ones where they overlap.
+        periods = []
+        for period in rules.get('periods') or []:
+            try:
+                period_start, period_end = _clock_seconds(period['from']), _clock_seconds(period['to'])
+                multiplier = float(period['multiplier'])
+            except (KeyError, TypeError, ValueError):
+                raise ValueError('Each period needs from/to as HH:MM and a numeric multiplier')
+            if multiplier < 0 or period_start % DAY == period_end % DAY:
+                raise ValueError('Periods must be non-empty with a non-negative multiplier')
+            periods.append((period_start % DAY, period_end % DAY, multiplier))
+        self.clock = sorted({0} | {edge for start, end, _ in periods for edge in (start, end)})
+        self.clock_rates = []
+        for edge in self.clock:
+            rate = 1.0
+            for period_start, period_end, multiplier in periods:
+                inside = period_start <= edge < period_end if period_start < period_end else (edge >= period_start or edge < period_end)
+                if inside:
+                    rate = multiplier
+            self.clock_rates.append(rate)
+        self.clock_hours = [0.0]
+        for index, edge in enumerate(self.clock):
+            following = self.clock[index + 1] if index + 1 < len(self.clock) else DAY
+            self.clock_hours.append(self.clock_hours[-1] + (following - edge) / 3600 * self.clock_rates[index])
+        self.day_hours = self.clock_hours.pop()
+
+        cap = rules.get('daily_cap')
+        try:
+            self.daily_cap = float(cap) if cap not in (None, '') else None
+        except (TypeError, ValueError):
+            raise ValueError('daily_cap must be a number')
+        if self.daily_cap is not None and self.daily_cap < 0:
+            raise ValueError('daily_cap cannot be negative')
+        self.day_cost = self._capped(self._tier_cost(self.day_hours))
+
+    def _tier_cost(self, hours):
+        index = bisect_right(self.tier_starts, hours) - 1
+        return self.tier_costs[index] + (hours - self.tier_starts[index]) * self.tier_rates[index]
+
+    def _capped(self, cost):
+        return cost if self.daily_cap is None else min(cost, self.daily_cap)
+
+    def _hours_since_midnight(self, seconds):
+        """Billable hours from local midnight to `seconds` (0..DAY) after it."""
+        index = bisect_right(self.clock, seconds) - 1
+        return self.clock_hours[index] + (seconds - self.clock[index]) / 3600 * self.clock_rates[index]
+
+    def _billable_hours(self, clock_start, seconds):
+        """Billable hours in a stay shorter than a day starting `clock_start` after midnight."""
+        end = clock_start + seconds
+        if end <= DAY:
+            return self._hours_since_midnight(end) - self._hours_since_midnight(clock_start)
+        return self.day_hours - self._hours_since_midnight(clock_start) + self._hours_since_midnight(end - DAY)
+
+    def cost(self, start, end, tz=timezone.utc):
+        """Cost of a stay between two naive-UTC datetimes, rounded to paise."""
+        seconds = (end - start).total_seconds()
+        if seconds <= 0:
+            return 0.0
+        days, rest = divmod(seconds, DAY)
+        return round(days * self.day_cost + self._capped(self._tier_cost(
+            self._billable_hours(_local_clock(start, tz), rest)
+        )), 2)
+
+    def costs(self, starts, ends, tz=timezone.utc):
+        """cost() for many stays at once; NumPy-vectorised when available."""
+        if np is None or not starts:
+            return [self.cost(start, end, tz) for start, end in zip(starts, ends)]
+
+        epoch = np.fromiter(((start - EPOCH).total_seconds() for start in starts), float, len(starts))
+        seconds = np.fromiter(((end - EPOCH).total_seconds() for end in ends), float, len(ends)) - epoch
+        # UTC offsets only change on the hour, so look each hour up once
+        hours_since_epoch, hour_index = np.unique(epoch // 3600, return_inverse=True)
+        offsets = np.array([
+            datetime.fromtimestamp(hour * 3600, tz).utcoffset().total_seconds()
+            for hour in hours_since_epoch.tolist()
+        ])
+        clock_start = (epoch + offsets[hour_index]) % DAY
+        days, rest = np.divmod(np.maximum(seconds, 0), DAY)
+
+        clock = np.array(self.clock, dtype=float)
+        clock_hours = np.array(self.clock_hours)
+        clock_rates = np.array(self.clock_rates)
+
+        def since_midnight(at):
+            index = np.searchsorted(clock, at, side='right') - 1
+            return clock_hours[index] + (at - clock[index]) / 3600 * clock_rates[index]
+
+        end = clock_start + rest
+        wraps = end > DAY
+        hours = np.where(
+            wraps,
+            self.day_hours - since_midnight(clock_start) + since_midnight(np.where(wraps, end - DAY, 0)),
+            since_midnight(np.minimum(end, DAY)) - since_midnight(clock_start)
+        )
+
+        tier_starts = np.array(self.tier_starts)
+        index = np.searchsorted(tier_starts, hours, side='right') - 1
+        partial = np.array(self.tier_costs)[index] + (hours - tier_starts[index]) * np.array(self.tier_rates)[index]
+        if self.daily_cap is not None:
+            partial = np.minimum(partial, self.daily_cap)
+        total = np.where(seconds > 0, days * self.day_cost + partial, 0.0)
+        return [round(cost, 2) for cost in total.tolist()]
+
+
+def _local_clock(moment, tz):
+    """Seconds after local midnight in `tz` of a naive-UTC datetime."""
+    local = moment.replace(tzinfo=timezone.utc).astimezone(tz)
+    return local.hour * 3600 + local.minute * 60 + local.second + local.microsecond / 1e6
+
+
+class TariffCache:
+    """Compiled Tariffs per lot, recompiled when the lot's rules or price change.
+
+    Entries are checked against the lot row being priced, so a worker
+    that missed an edit elsewhere still prices with the current rules.
+    """
+
+    def __init__(self):
+        self._tariffs = {}
+        self._lock = threading.Lock()
+
+    def get(self, lot):
+        key = (lot.tariff, lot.price)
+        cached = self._tariffs.get(lot.id)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        compiled = Tariff(json.loads(lot.tariff) if lot.tariff else None, lot.price)
+        with self._lock:
+            self._tariffs[lot.id] = (key, compiled)
+        return compiled
+
+    def invalidate(self, lot_id):
+        with self._lock:
+            self._tariffs.pop(lot_id, None)
+
+
+def reprice_bookings(tariff, lot_id, tz=timezone.utc, since=None, batch_size=1000):
+    """Recompute parking_cost of `lot_id`'s closed, unpaid bookings with `tariff`.
+
+    Bookings are read and priced a batch at a time and written back with
+    one executemany per batch. Returns the ids of the users whose bookings
+    changed; the caller rebuilds the daily rollup and commits.
+    """
+    paid = db.session.query(Payment.booking_id).filter(Payment.booking_id.isnot(None))
+    query = db.session.query(
+        ReserveParkingSpot.id,
+        ReserveParkingSpot.user_id,
+        ReserveParkingSpot.parking_timestamp,
+        ReserveParkingSpot.leaving_timestamp,
+        ReserveParkingSpot.parking_cost
+    ).join(ParkingSpot, ReserveParkingSpot.spot_id == ParkingSpot.id).filter(
+        ParkingSpot.lot_id == lot_id,
+        ReserveParkingSpot.leaving_timestamp.isnot(None),
+        ReserveParkingSpot.id.notin_(paid)
+    ).order_by(ReserveParkingSpot.id)
+    if since is not None:
+        query = query.filter(ReserveParkingSpot.parking_timestamp >= since)
+
+    users = set()
+    last_id = 0
+    while True:
+        batch = query.filter(ReserveParkingSpot.id > last_id).limit(batch_size).all()
+        if not batch:
+            return users
+        last_id = batch[-1].id
+        costs = tariff.costs([row.parking_timestamp for row in batch], [row.leaving_timestamp for row in batch], tz)
+        changed = [(row, cost) for row, cost in zip(batch, costs) if row.parking_cost != cost]
+        if changed:
+            db.session.execute(update(ReserveParkingSpot), [
+                {'id': row.id, 'parking_cost': cost} for row, cost in changed
+            ])
+            users.update(row.user_id for row, _ in changed)
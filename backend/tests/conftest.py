@@ -0,0 +1,98 @@
+import itertools
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+import redis
+from sqlalchemy import event
+
+# The app reads its configuration at import, so point it at a scratch database first
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='parking-tests-'), 'test.db')
+os.environ.setdefault('CACHE_TYPE', 'SimpleCache')
+# Redis db 0 is the Celery broker and the app's cache; tests get a db of their
+# own, emptied first so versions and cached lots from an earlier run can't leak in
+os.environ['REDIS_URL'] = os.environ.get('TEST_REDIS_URL', 'redis://localhost:6379/15')
+try:
+    redis.Redis.from_url(os.environ['REDIS_URL'], socket_connect_timeout=1).flushdb()
+except redis.ConnectionError:
+    pass  # The app falls back to the database; tests that need Redis skip
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+from app import app as flask_app  # noqa: E402
+from models import db, init_db  # noqa: E402
+
+with flask_app.app_context():
+    init_db()
+
+_names = itertools.count(1)
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        yield flask_app
+        db.session.remove()
+
+
+@pytest.fixture
+def redis_client(app):
+    """The app's Redis client, on the test db."""
+    try:
+        app_module.redis_client.ping()
+    except redis.ConnectionError:
+        pytest.skip('Redis is not running')
+    return app_module.redis_client
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_headers(client):
+    response = client.post('/api/auth/login', json={'username': 'admin', 'password': 'admin123', 'role': 'admin'})
+    return {'Authorization': 'Bearer ' + response.get_json()['access_token']}
+
+
+@pytest.fixture
+def make_user(client):
+    """Register a fresh user; returns (user id, auth headers)."""
+    def make():
+        name = f'user{next(_names)}'
+        body = client.post('/api/auth/register', json={
+            'username': name, 'password': 'secret', 'email': f'{name}@example.com', 'vehicle_number': name.upper()
+        }).get_json()
+        return body['user']['id'], {'Authorization': 'Bearer ' + body['access_token']}
+    return make
+
+
+@pytest.fixture
+def make_lot(client, admin_headers):
+    """Create a lot with `spots` spots through the admin API; returns its JSON."""
+    def make(spots, price=10, **fields):
+        response = client.post('/api/admin/parking-lots', headers=admin_headers, json={
+            'prime_location_name': f'Lot {next(_names)}', 'price': price, 'number_of_spots': spots, **fields
+        })
+        assert response.status_code == 201, response.get_json()
+        return response.get_json()
+    return make
+
+
+@pytest.fixture
+def count_queries(app):
+    """Context manager collecting the SQL statements run inside it."""
+    @contextmanager
+    def counting():
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+    return counting
@@ -0,0 +1,73 @@
+import pytest
+import redis
+
+from blocklist import TokenBlocklist
+
+
+class FlakyRedis:
+    """Stands in for a Redis client; every command fails while `down` is set."""
+
+    def __init__(self):
+        self.down = False
+        self.calls = 0
+        self.keys = {}
+
+    def _command(self):
+        self.calls += 1
+        if self.down:
+            raise redis.ConnectionError('Redis is down')
+
+    def exists(self, key):
+        self._command()
+        return int(key in self.keys)
+
+    def setex(self, key, seconds, value):
+        self._command()
+        self.keys[key] = value
+
+
+def test_revoke_skips_redis_while_the_breaker_is_open():
+    client = FlakyRedis()
+    blocklist = TokenBlocklist(client, failure_threshold=2, reset_timeout=60)
+    client.down = True
+    assert not blocklist.revoke('a', 60)
+    assert not blocklist.revoke('b', 60)
+    assert blocklist.breaker.state == 'open'
+
+    calls = client.calls
+    assert not blocklist.revoke('c', 60)
+    assert client.calls == calls
+    assert blocklist.stats()['short_circuited'] == 1
+    # Still honoured locally
+    assert blocklist.is_revoked('c')
+
+
+def test_revoke_is_the_half_open_trial_call():
+    client = FlakyRedis()
+    blocklist = TokenBlocklist(client, failure_threshold=1, reset_timeout=0)
+    client.down = True
+    assert not blocklist.revoke('a', 60)
+    client.down = False
+
+    assert blocklist.revoke('b', 60)
+    assert blocklist.breaker.state == 'closed'
+    assert client.keys == {'blocklist:b': 'revoked'}
+
+
+def test_unexpected_error_in_the_trial_call_does_not_wedge_the_breaker():
+    client = FlakyRedis()
+    blocklist = TokenBlocklist(client, failure_threshold=1, reset_timeout=0)
+    client.down = True
+    assert not blocklist.revoke('a', 60)
+    client.down = False
+
+    # The half-open trial dies on something that isn't a Redis error
+    client.exists = lambda key: 1 / 0
+    with pytest.raises(ZeroDivisionError):
+        blocklist.is_revoked('b')
+    assert blocklist.breaker.state == 'half-open'
+
+    # The next call is let through as a fresh trial
+    del client.exists
+    assert not blocklist.is_revoked('c')
+    assert blocklist.breaker.state == 'closed'
@@ -0,0 +1,104 @@
+import itertools
+
+import pytest
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from etags import ChangeVersions
+from test_serialization import add_closed_bookings
+
+_keys = itertools.count(1)
+
+
+@pytest.fixture
+def versions(redis_client):
+    """ChangeVersions with an epoch key of its own, and a fresh counter key."""
+    n = next(_keys)
+    return ChangeVersions(redis_client, epoch_key=f'test-versions:{n}:epoch'), f'test-versions:{n}:counter'
+
+
+def test_tag_moves_only_when_a_counter_is_bumped(versions):
+    change_versions, key = versions
+    tag = change_versions.tag('thing', [key])
+    assert tag.startswith('thing-') and tag.endswith('-0')
+    assert change_versions.tag('thing', [key]) == tag
+    assert change_versions.bump([key])
+    assert change_versions.tag('thing', [key]) not in (None, tag)
+
+
+def test_counters_reset_with_redis_do_not_repeat_old_tags(versions, redis_client):
+    change_versions, key = versions
+    change_versions.bump([key])
+    before = change_versions.tag('thing', [key])
+    # As after a flush: counters and epoch are gone
+    redis_client.delete(key, change_versions.epoch_key)
+    change_versions.bump([key])
+    assert change_versions.tag('thing', [key]) != before
+
+
+def test_no_tag_while_redis_is_down():
+    down = redis.Redis(port=1, socket_connect_timeout=0.05, retry=Retry(NoBackoff(), 0))
+    change_versions = ChangeVersions(down, failure_threshold=1)
+    assert change_versions.tag('thing', ['key']) is None
+    assert not change_versions.bump(['key'])
+    assert change_versions.breaker.state == 'open'
+
+
+def test_lot_detail_revalidates_until_the_lot_changes(client, admin_headers, make_lot):
+    lot = make_lot(2)
+    first = client.get(f"/api/parking-lots/{lot['id']}")
+    tag = first.headers['ETag']
+    assert tag.startswith('W/')
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    repeat = client.get(f"/api/parking-lots/{lot['id']}", headers={'If-None-Match': tag})
+    assert (repeat.status_code, repeat.data) == (304, b'')
+    assert repeat.headers['ETag'] == tag
+
+    client.put(f"/api/admin/parking-lots/{lot['id']}", headers=admin_headers, json={'price': 25})
+    changed = client.get(f"/api/parking-lots/{lot['id']}", headers={'If-None-Match': tag})
+    assert changed.status_code == 200
+    assert changed.get_json()['price'] == 25
+
+
+def test_errors_are_not_tagged(client):
+    response = client.get('/api/parking-lots/999999')
+    assert response.status_code == 404
+    assert 'ETag' not in response.headers
+
+
+def test_history_is_tagged_private(client, make_user):
+    _, headers = make_user()
+    assert history(client, headers).headers['Cache-Control'] == 'private, no-cache'
+
+
+def history(client, headers, query='', etag=None):
+    if etag:
+        headers = {**headers, 'If-None-Match': etag}
+    return client.get(f'/api/user/bookings/history{query}', headers=headers)
+
+
+def test_history_pages_have_their_own_etags(client, make_user, make_lot):
+    user_id, headers = make_user()
+    add_closed_bookings(user_id, [make_lot(2)], 3)
+
+    first = history(client, headers, '?limit=2')
+    cursor = first.get_json()['next_cursor']
+    second = history(client, headers, f'?limit=2&cursor={cursor}')
+    assert first.headers['ETag'] != second.headers['ETag']
+    assert history(client, headers).headers['ETag'] not in (first.headers['ETag'], second.headers['ETag'])
+
+    # Another page's tag doesn't make this one a 304
+    response = history(client, headers, f'?limit=2&cursor={cursor}', etag=first.headers['ETag'])
+    assert response.status_code == 200
+    assert [b['id'] for b in response.get_json()['items']] == [b['id'] for b in second.get_json()['items']]
+
+
+def test_history_etag_ignores_argument_order(client, make_user, make_lot):
+    user_id, headers = make_user()
+    add_closed_bookings(user_id, [make_lot(2)], 3)
+    cursor = history(client, headers, '?limit=2').get_json()['next_cursor']
+
+    tag = history(client, headers, f'?limit=2&cursor={cursor}').headers['ETag']
+    assert history(client, headers, f'?cursor={cursor}&limit=2', etag=tag).status_code == 304
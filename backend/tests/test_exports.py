@@ -0,0 +1,142 @@
+import csv
+import gzip
+import io
+import json
+from functools import partial
+
+import pytest
+
+import app as app_module
+import exports
+from models import db, ExportJob, ReserveParkingSpot
+from test_serialization import add_closed_bookings
+
+
+@pytest.fixture
+def fingerprint():
+    return app_module.export_fingerprint
+
+
+def closed_booking(client, make_user, lot):
+    user_id, headers = make_user()
+    booking = client.post('/api/user/bookings', headers=headers, json={'lot_id': lot['id']}).get_json()['booking']
+    assert client.post(f"/api/user/bookings/{booking['id']}/release", headers=headers).status_code == 200
+    return user_id, booking['id']
+
+
+def test_fingerprint_is_stable_without_changes(client, make_user, make_lot, fingerprint):
+    user_id, _ = closed_booking(client, make_user, make_lot(2))
+    assert fingerprint(user_id, 'user') == fingerprint(user_id, 'user')
+    assert fingerprint(user_id, 'all') == fingerprint(user_id, 'all')
+
+
+def test_fingerprint_follows_new_and_released_bookings(client, make_user, make_lot, fingerprint):
+    lot = make_lot(2)
+    user_id, headers = make_user()
+    seen = {fingerprint(user_id, 'user')}
+    booking = client.post('/api/user/bookings', headers=headers, json={'lot_id': lot['id']}).get_json()['booking']
+    seen.add(fingerprint(user_id, 'user'))
+    client.post(f"/api/user/bookings/{booking['id']}/release", headers=headers)
+    seen.add(fingerprint(user_id, 'user'))
+    assert len(seen) == 3
+
+
+def test_fingerprint_follows_lot_renames(client, admin_headers, make_user, make_lot, fingerprint):
+    lot = make_lot(2)
+    user_id, _ = closed_booking(client, make_user, lot)
+    before = fingerprint(user_id, 'user'), fingerprint(user_id, 'all')
+
+    response = client.put(f"/api/admin/parking-lots/{lot['id']}", headers=admin_headers,
+                          json={'prime_location_name': 'Renamed Lot'})
+    assert response.status_code == 200
+
+    after = fingerprint(user_id, 'user'), fingerprint(user_id, 'all')
+    assert before[0] != after[0]
+    assert before[1] != after[1]
+
+
+def test_fingerprint_is_one_query_however_long_the_history(make_user, make_lot, count_queries, fingerprint):
+    lots = [make_lot(3)]
+    few, _ = make_user()
+    many, _ = make_user()
+    add_closed_bookings(few, lots, 2)
+    add_closed_bookings(many, lots, 60)
+
+    for user_id in (few, many):
+        with count_queries() as statements:
+            fingerprint(user_id, 'user')
+        assert len(statements) == 1
+
+
+def test_export_rows_are_read_in_batches_without_an_open_cursor(make_user, make_lot, count_queries):
+    user_id, _ = make_user()
+    add_closed_bookings(user_id, [make_lot(2)], 5)
+    expected = [booking_id for (booking_id,) in db.session.query(ReserveParkingSpot.id).filter_by(
+        user_id=user_id).order_by(ReserveParkingSpot.id)]
+
+    seen = []
+    with count_queries() as statements:
+        for row in exports.iter_booking_rows(user_id, batch_size=2):
+            seen.append(row[0])
+            # Safe at any point, as between progress reports
+            db.session.commit()
+
+    assert seen == expected
+    assert len([s for s in statements if s.lstrip().startswith('SELECT')]) == 3
+
+
+def test_export_job_reports_progress_through_to_the_total(app, make_user, make_lot, monkeypatch):
+    user_id, _ = make_user()
+    add_closed_bookings(user_id, [make_lot(2)], 5)
+    job = ExportJob(user_id=user_id, scope='user', format='jsonl')
+    db.session.add(job)
+    db.session.commit()
+    reported = []
+    report = exports._report_progress
+    monkeypatch.setattr(exports, '_report_progress', lambda job_id, rows: reported.append(rows) or report(job_id, rows))
+    monkeypatch.setattr(exports, 'iter_booking_rows', partial(exports.iter_booking_rows, batch_size=2))
+    monkeypatch.setattr(exports, 'track_progress', partial(exports.track_progress, every=2))
+
+    job = exports.run_export_job(job)
+
+    assert reported == [2, 4, 5]
+    assert (job.status, job.progress_rows, job.total_rows) == ('completed', 5, 5)
+    with open(job.file_path) as f:
+        assert len(f.readlines()) == 5
+
+
+def test_formats_endpoint_hides_parquet_without_pyarrow(client, monkeypatch):
+    monkeypatch.setattr(exports, 'pq', None)
+    assert client.get('/api/export/formats').get_json() == {'formats': ['csv', 'csv.gz', 'jsonl']}
+    monkeypatch.setattr(exports, 'pq', object())
+    assert 'parquet' in client.get('/api/export/formats').get_json()['formats']
+
+
+def test_stream_export_sends_the_whole_history_in_each_row_format(client, make_user, make_lot):
+    user_id, headers = make_user()
+    add_closed_bookings(user_id, [make_lot(2)], 3)
+    add_closed_bookings(make_user()[0], [make_lot(1)], 2)
+    expected = [booking_id for (booking_id,) in db.session.query(ReserveParkingSpot.id).filter_by(
+        user_id=user_id).order_by(ReserveParkingSpot.id)]
+
+    response = client.get('/api/user/export/stream?format=csv', headers=headers)
+    assert response.mimetype == 'text/csv'
+    assert 'parking_history.csv' in response.headers['Content-Disposition']
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0][0] == 'Booking ID'
+    assert [int(row[0]) for row in rows[1:]] == expected
+
+    response = client.get('/api/user/export/stream?format=csv.gz', headers=headers)
+    assert response.mimetype == 'application/gzip'
+    assert gzip.decompress(response.get_data()).decode() == client.get(
+        '/api/user/export/stream?format=csv', headers=headers).get_data(as_text=True)
+
+    response = client.get('/api/user/export/stream?format=jsonl', headers=headers)
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line['booking_id'] for line in lines] == expected
+
+
+def test_stream_export_rejects_file_only_formats(client, make_user):
+    _, headers = make_user()
+    assert client.get('/api/user/export/stream?format=parquet', headers=headers).status_code == 400
+    assert client.get('/api/user/export/stream?format=xlsx', headers=headers).status_code == 400
@@ -0,0 +1,90 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from models import db
+
+
+@contextmanager
+def query_plans():
+    """Collect the EXPLAIN QUERY PLAN of every SELECT run inside it, as one string each."""
+    queries = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            queries.append((statement, parameters))
+    event.listen(db.engine, 'before_cursor_execute', record)
+    plans = []
+    try:
+        yield plans
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    with db.engine.connect() as conn:
+        for statement, parameters in queries:
+            rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+            plans.append(' | '.join(row[-1] for row in rows))
+
+
+def assert_uses(plans, index):
+    assert any(f'USING INDEX {index} ' in plan or f'USING COVERING INDEX {index} ' in plan for plan in plans), \
+        f'{index} not used by any of:\n' + '\n'.join(plans)
+
+
+@pytest.fixture(autouse=True)
+def sqlite_only(app):
+    if db.engine.dialect.name != 'sqlite':
+        pytest.skip('EXPLAIN QUERY PLAN output is SQLite-specific')
+
+
+def test_booking_uses_active_booking_and_free_spot_indexes(client, make_user, make_lot):
+    lot = make_lot(5)
+    _, headers = make_user()
+    with query_plans() as plans:
+        response = client.post('/api/user/bookings', headers=headers, json={'lot_id': lot['id']})
+    assert response.status_code == 201
+    assert_uses(plans, 'ix_reserve_user_leaving_ts')
+    assert_uses(plans, 'ix_parking_spots_lot_status')
+
+
+def test_history_pages_by_user_and_parking_time(client, make_user, make_lot):
+    lot = make_lot(1)
+    _, headers = make_user()
+    booking = client.post('/api/user/bookings', headers=headers, json={'lot_id': lot['id']}).get_json()['booking']
+    client.post(f"/api/user/bookings/{booking['id']}/release", headers=headers)
+    with query_plans() as plans:
+        assert client.get('/api/user/bookings/history', headers=headers).status_code == 200
+    assert_uses(plans, 'ix_reserve_user_parking_ts')
+
+
+def test_admin_spot_list_joins_active_bookings_by_spot(client, admin_headers, make_lot):
+    lot = make_lot(3)
+    with query_plans() as plans:
+        assert client.get(f"/api/admin/parking-lots/{lot['id']}/spots", headers=admin_headers).status_code == 200
+    assert_uses(plans, 'ix_parking_spots_lot_status')
+    assert_uses(plans, 'ix_reserve_spot_leaving_ts')
+
+
+def test_registration_checks_email_by_index(client):
+    with query_plans() as plans:
+        client.post('/api/auth/register', json={
+            'username': 'indexcheck', 'password': 'secret', 'email': 'indexcheck@example.com'
+        })
+    assert_uses(plans, 'ix_users_email')
+
+
+def test_payments_are_listed_by_user_index(client, make_user):
+    _, headers = make_user()
+    with query_plans() as plans:
+        assert client.get('/api/user/payments', headers=headers).status_code == 200
+    assert_uses(plans, 'ix_payments_user_id')
+
+
+def test_availability_finds_conflicts_by_lot_and_window(client, make_lot):
+    lot = make_lot(3)
+    start = (datetime.utcnow() + timedelta(days=1)).replace(microsecond=0)
+    window = f'start={start.isoformat()}&end={(start + timedelta(hours=2)).isoformat()}'
+    with query_plans() as plans:
+        response = client.get(f"/api/parking-lots/{lot['id']}/availability?{window}")
+    assert response.get_json()['free_spots'] == 3
+    assert_uses(plans, 'ix_advance_reservations_lot_window')
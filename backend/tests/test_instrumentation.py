@@ -0,0 +1,98 @@
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+from instrumentation import Instrumentation
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """A bare app with instrumentation on and a view running n queries."""
+    def make(**config):
+        app = Flask(__name__)
+        app.config.update({
+            'INSTRUMENTATION_SLOW_MS': 500,
+            'INSTRUMENTATION_PROFILE_RATE': 0,
+            'INSTRUMENTATION_PROFILER': 'cprofile',
+            'INSTRUMENTATION_PROFILE_DIR': str(tmp_path / 'profiles'),
+            'METRICS_TOKEN': None,
+            **config
+        })
+        engine = create_engine('sqlite://')
+
+        @app.route('/queries/<int:n>')
+        def queries(n):
+            with engine.connect() as conn:
+                for _ in range(n):
+                    conn.execute(text('SELECT 1'))
+            return 'ok'
+
+        @app.route('/boom')
+        def boom():
+            raise RuntimeError('boom')
+
+        instrumentation = Instrumentation()
+        instrumentation.add_source('widgets', lambda: {'count': 3, 'healthy': True, 'state': 'closed', 'note': None})
+        instrumentation.init_app(app, engine)
+        return app, instrumentation
+    return make
+
+
+def test_server_timing_reports_the_request_queries(make_app):
+    app, _ = make_app()
+    response = app.test_client().get('/queries/3')
+    assert 'desc="3 queries"' in response.headers['Server-Timing']
+    assert response.headers['Server-Timing'].startswith('app;dur=')
+
+
+def test_metrics_render_route_histograms_and_sources(make_app):
+    app, _ = make_app()
+    client = app.test_client()
+    client.get('/queries/2')
+    client.get('/queries/2')
+    client.get('/queries/30')
+
+    lines = client.get('/api/metrics').get_data(as_text=True).splitlines()
+    labels = 'method="GET",route="/queries/<int:n>"'
+    assert f'parking_http_request_duration_seconds_count{{{labels}}} 3' in lines
+    assert f'parking_http_request_db_queries_bucket{{{labels},le="2"}} 2' in lines
+    assert f'parking_http_request_db_queries_bucket{{{labels},le="50"}} 3' in lines
+    assert f'parking_http_request_db_queries_sum{{{labels}}} 34.0' in lines
+    assert 'parking_widgets_count 3' in lines
+    assert 'parking_widgets_healthy 1' in lines
+    assert 'parking_widgets_state{value="closed"} 1' in lines
+    assert not any(line.startswith('parking_widgets_note') for line in lines)
+
+
+def test_metrics_token_is_required_when_set(make_app):
+    app, _ = make_app(METRICS_TOKEN='s3cret')
+    client = app.test_client()
+    assert client.get('/api/metrics').status_code == 401
+    assert client.get('/api/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/api/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code == 200
+
+
+def test_slow_sampled_requests_keep_a_profile(make_app, tmp_path):
+    app, _ = make_app(INSTRUMENTATION_PROFILE_RATE=1, INSTRUMENTATION_SLOW_MS=0)
+    app.test_client().get('/queries/1')
+
+    profiles = [path.name for path in (tmp_path / 'profiles').iterdir()]
+    assert len(profiles) == 1
+    assert '-GET-queries_int_n-' in profiles[0] and profiles[0].endswith('.prof')
+
+
+def test_a_view_that_raises_gives_the_profiler_back(make_app, tmp_path):
+    app, instrumentation = make_app(INSTRUMENTATION_PROFILE_RATE=1, INSTRUMENTATION_SLOW_MS=0,
+                                    PROPAGATE_EXCEPTIONS=True)
+    with pytest.raises(RuntimeError):
+        app.test_client().get('/boom')
+
+    assert instrumentation._profiling.acquire(blocking=False)
+    instrumentation._profiling.release()
+    assert not (tmp_path / 'profiles').exists()
+
+
+def test_fast_requests_leave_no_profile(make_app, tmp_path):
+    app, _ = make_app(INSTRUMENTATION_PROFILE_RATE=1, INSTRUMENTATION_SLOW_MS=60000)
+    app.test_client().get('/queries/1')
+    assert not (tmp_path / 'profiles').exists()
@@ -0,0 +1,87 @@
+import itertools
+import time
+
+import pytest
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from lot_cache import LotCache
+from models import db, ParkingLot
+
+_prefixes = itertools.count(1)
+
+
+@pytest.fixture
+def make_cache(redis_client):
+    """LotCaches sharing a key prefix and channel of their own, like two worker processes."""
+    prefix = f'test-lots-{next(_prefixes)}:'
+    return lambda: LotCache(redis_client, prefix=prefix, channel=prefix + 'invalidate', local_ttl=60)
+
+
+def rename(lot_id, name):
+    db.session.get(ParkingLot, lot_id).prime_location_name = name
+    db.session.commit()
+
+
+def wait_for(condition, timeout=3):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_second_process_reads_the_lot_from_redis(make_lot, make_cache):
+    lot = make_lot(2)
+    first, second = make_cache(), make_cache()
+
+    assert first.get_lot(lot['id'])['prime_location_name'] == lot['prime_location_name']
+    assert second.get_lot(lot['id'])['prime_location_name'] == lot['prime_location_name']
+    first.get_lot(lot['id'])
+
+    assert (first.stats()['db_loads'], first.stats()['local_hits']) == (1, 1)
+    assert (second.stats()['db_loads'], second.stats()['redis_hits']) == (0, 1)
+
+
+def test_invalidation_reaches_every_process(make_lot, make_cache, redis_client):
+    lot = make_lot(2)
+    first, second = make_cache(), make_cache()
+    first.get_lot(lot['id'])
+    second.get_lot(lot['id'])
+    assert wait_for(lambda: redis_client.pubsub_numsub(first.channel)[0][1] == 2)
+
+    rename(lot['id'], 'Renamed')
+    # Still the cached copy until the change is announced
+    assert second.get_lot(lot['id'])['prime_location_name'] == lot['prime_location_name']
+    first.invalidate([lot['id']])
+
+    assert first.get_lot(lot['id'])['prime_location_name'] == 'Renamed'
+    assert wait_for(lambda: second.get_lot(lot['id'])['prime_location_name'] == 'Renamed')
+
+
+def test_listing_follows_created_and_edited_lots(client, admin_headers, make_lot):
+    before = client.get('/api/parking-lots').get_json()
+    lot = make_lot(2)
+    listed = client.get('/api/parking-lots').get_json()
+    assert [l['id'] for l in listed] == [l['id'] for l in before] + [lot['id']]
+
+    response = client.put(f"/api/admin/parking-lots/{lot['id']}", headers=admin_headers,
+                          json={'prime_location_name': 'Edited Lot'})
+    assert response.status_code == 200
+    assert client.get(f"/api/parking-lots/{lot['id']}").get_json()['prime_location_name'] == 'Edited Lot'
+
+
+def test_falls_back_to_the_database_while_redis_is_down(app, make_lot):
+    lots = [make_lot(1), make_lot(1)]
+    down = redis.Redis(port=1, socket_connect_timeout=0.05, retry=Retry(NoBackoff(), 0))
+    cache = LotCache(down, failure_threshold=1)
+
+    assert [cache.get_lot(lot['id'])['id'] for lot in lots] == [lot['id'] for lot in lots]
+    stats = cache.stats()
+    assert stats['db_loads'] == 2
+    assert stats['breaker_state'] == 'open'
+    # Once open, Redis isn't tried at all
+    assert stats['errors'] == 1
+    assert stats['short_circuited'] >= 1
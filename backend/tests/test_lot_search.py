@@ -0,0 +1,89 @@
+import uuid
+
+import pytest
+
+from lot_search import LotSearchIndex
+from models import db, ParkingLot
+
+
+@pytest.fixture
+def tag():
+    """A word no other lot contains, to keep each test's lots apart."""
+    return 'k' + uuid.uuid4().hex[:10]
+
+
+@pytest.fixture
+def index(app):
+    def build():
+        lot_index = LotSearchIndex()
+        lot_index.rebuild(1)
+        return lot_index
+    return build
+
+
+def test_every_word_must_prefix_match_and_name_hits_rank_first(make_lot, index, tag):
+    in_address = make_lot(1, prime_location_name=f'{tag} Depot', address='Station Road')
+    in_name = make_lot(1, prime_location_name=f'{tag} Station Plaza', address='Ring Road')
+    make_lot(1, prime_location_name=f'{tag} Mall', address='Ring Road')
+
+    lot_index = index()
+    assert lot_index.search(f'{tag} stat') == [in_name['id'], in_address['id']]
+    assert lot_index.search(f'{tag.upper()} PLAZA') == [in_name['id']]
+    assert lot_index.search(f'{tag} nowhere') == []
+
+
+def test_pin_code_matches_exactly_or_by_district_closest_first(make_lot, index, tag):
+    exact = make_lot(1, prime_location_name=tag, pin_code='987650')
+    far = make_lot(1, prime_location_name=tag, pin_code='987999')
+    near = make_lot(1, prime_location_name=tag, pin_code='987655')
+    make_lot(1, prime_location_name=tag, pin_code='986650')
+
+    lot_index = index()
+    assert lot_index.search(tag, pin_code='987650') == [exact['id']]
+    assert lot_index.search(tag, pin_code='987650', nearby=True) == [exact['id'], near['id'], far['id']]
+
+
+def test_price_range_includes_both_bounds(make_lot, index, tag):
+    cheap, mid, dear = (make_lot(1, price=price, prime_location_name=tag) for price in (10, 20, 30))
+    lot_index = index()
+    assert lot_index.search(tag, min_price=10, max_price=20) == [cheap['id'], mid['id']]
+    assert lot_index.search(tag, min_price=20) == [mid['id'], dear['id']]
+    assert lot_index.search(tag, max_price=9.99) == []
+
+
+def test_changes_are_patched_in_or_left_for_a_rebuild(make_lot, index, tag):
+    lot = make_lot(1, prime_location_name=tag)
+    lot_index = index()
+    row = db.session.get(ParkingLot, lot['id'])
+    row.prime_location_name = f'{tag} Renamed'
+    db.session.commit()
+
+    # The next version: patched in place
+    lot_index.apply({'index': 2}, [row])
+    assert lot_index.version == 2
+    assert lot_index.search(f'{tag} renamed') == [lot['id']]
+
+    # A version was skipped: stale until the next sync rebuilds it
+    lot_index.apply({'index': 4}, removed_ids=[lot['id']])
+    assert lot_index.version is None
+    assert lot_index.search(tag) == [lot['id']]
+    lot_index.sync(4)
+    assert lot_index.version == 4
+
+
+def test_search_endpoint_filters_availability_and_pages(client, make_user, make_lot, tag):
+    full = make_lot(1, prime_location_name=tag)
+    free = [make_lot(2, prime_location_name=tag) for _ in range(3)]
+    _, headers = make_user()
+    assert client.post('/api/user/bookings', headers=headers, json={'lot_id': full['id']}).status_code == 201
+
+    first = client.get(f'/api/parking-lots/search?q={tag}&available=1&limit=2').get_json()
+    second = client.get(f"/api/parking-lots/search?q={tag}&available=1&limit=2&cursor={first['next_cursor']}").get_json()
+    assert [lot['id'] for lot in first['items'] + second['items']] == [lot['id'] for lot in free]
+    assert second['next_cursor'] is None
+    assert len(client.get(f'/api/parking-lots/search?q={tag}').get_json()['items']) == 4
+
+
+def test_search_endpoint_rejects_bad_prices(client):
+    response = client.get('/api/parking-lots/search?min_price=cheap')
+    assert response.status_code == 400
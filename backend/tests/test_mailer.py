@@ -0,0 +1,147 @@
+import itertools
+import socketserver
+import threading
+
+import pytest
+
+import celery_app
+import mailer
+from models import db, EmailDelivery, User
+
+_periods = itertools.count(1)
+
+
+class SMTPSession(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: recipients in `server.refuse` get a 550."""
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.server.sessions += 1
+        self.reply('220 localhost SMTP stand-in')
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().rstrip('\r\n')
+            if not line:
+                return
+            verb = line.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb in ('MAIL', 'RSET'):
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                address = line.split(':', 1)[1].strip().strip('<>')
+                if address in self.server.refuse:
+                    self.reply('550 No such user here')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                self.server.delivered.extend(recipients)
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPSession)
+        self.sessions = 0
+        self.delivered = []
+        self.refuse = set()
+
+
+@pytest.fixture
+def smtp_server(app, monkeypatch):
+    server = SMTPStandIn()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setitem(app.config, 'MAIL_SERVER', '127.0.0.1')
+    monkeypatch.setitem(app.config, 'MAIL_PORT', server.server_address[1])
+    monkeypatch.setitem(app.config, 'MAIL_USE_TLS', False)
+    monkeypatch.setitem(app.config, 'MAIL_REQUIRE_AUTH', False)
+    monkeypatch.setitem(app.config, 'MAIL_USERNAME', None)
+    yield server
+    for pool in mailer._pools.values():
+        pool.close_all()
+    mailer._pools.clear()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def retries(monkeypatch):
+    """(user_id, countdown) of every per-recipient retry the batch queues."""
+    queued = []
+    monkeypatch.setattr(celery_app.send_reminder, 'apply_async',
+                        lambda args, countdown: queued.append((args[0], countdown)))
+    return queued
+
+
+def recipients(count, make_user):
+    user_ids = [make_user()[0] for _ in range(count)]
+    emails = [email for (email,) in db.session.query(User.email).filter(User.id.in_(user_ids)).order_by(User.id)]
+    return user_ids, emails
+
+
+def statuses(user_ids, period):
+    db.session.expire_all()
+    return dict(db.session.query(EmailDelivery.user_id, EmailDelivery.status).filter(
+        EmailDelivery.user_id.in_(user_ids), EmailDelivery.period == period
+    ))
+
+
+def test_batch_sends_over_one_pooled_session(app, smtp_server, retries, make_user):
+    user_ids, emails = recipients(3, make_user)
+    period = f'test-{next(_periods)}'
+
+    celery_app.send_reminder_batch(user_ids, period, [])
+
+    assert smtp_server.delivered == emails
+    assert smtp_server.sessions == 1
+    assert retries == []
+    assert set(statuses(user_ids, period).values()) == {'sent'}
+
+
+def test_refused_recipient_is_retried_alone_with_backoff(app, smtp_server, retries, make_user):
+    user_ids, emails = recipients(3, make_user)
+    period = f'test-{next(_periods)}'
+    smtp_server.refuse.add(emails[1])
+
+    celery_app.send_reminder_batch(user_ids, period, [])
+
+    assert smtp_server.delivered == [emails[0], emails[2]]
+    # The refusal left the session usable, so the rest of the batch shared it
+    assert smtp_server.sessions == 1
+    assert retries == [(user_ids[1], app.config['MAIL_RETRY_BACKOFF'])]
+    assert statuses(user_ids, period) == {user_ids[0]: 'sent', user_ids[1]: 'failed', user_ids[2]: 'sent'}
+
+    # The retry sends to that recipient only
+    smtp_server.refuse.clear()
+    celery_app.send_reminder(user_ids[1], period, [])
+    assert smtp_server.delivered == [emails[0], emails[2], emails[1]]
+    assert set(statuses(user_ids, period).values()) == {'sent'}
+
+
+def test_sent_deliveries_are_not_sent_again(app, smtp_server, retries, make_user):
+    user_ids, emails = recipients(2, make_user)
+    period = f'test-{next(_periods)}'
+    celery_app.send_reminder_batch(user_ids, period, [])
+
+    celery_app.send_reminder_batch(user_ids, period, [])
+    user = db.session.get(User, user_ids[0])
+    assert mailer.deliver(user, celery_app.REMINDER_KIND, period, lambda u: mailer.reminder_message(u, [])) == (False, None)
+
+    assert smtp_server.delivered == emails
+    assert retries == []
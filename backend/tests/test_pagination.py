@@ -0,0 +1,31 @@
+import pytest
+
+from pagination import encode_cursor
+
+
+def test_users_page_through_with_the_cursor(client, admin_headers, make_user):
+    for _ in range(3):
+        make_user()
+    first = client.get('/api/admin/users?limit=2', headers=admin_headers).get_json()
+    second = client.get(f"/api/admin/users?limit=2&cursor={first['next_cursor']}", headers=admin_headers).get_json()
+    first_ids = [user['id'] for user in first['items']]
+    second_ids = [user['id'] for user in second['items']]
+    assert len(first_ids) == 2
+    assert min(second_ids) > max(first_ids)
+
+
+@pytest.mark.parametrize('cursor', [
+    encode_cursor({'a': 1}),
+    encode_cursor('abc'),
+    encode_cursor(),
+    encode_cursor(None),
+    'not-a-cursor',
+])
+def test_users_reject_malformed_cursors(client, admin_headers, cursor):
+    response = client.get(f'/api/admin/users?cursor={cursor}', headers=admin_headers)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid limit or cursor'}
+
+
+def test_users_reject_a_bad_limit(client, admin_headers):
+    assert client.get('/api/admin/users?limit=0', headers=admin_headers).status_code == 400
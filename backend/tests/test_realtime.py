@@ -0,0 +1,104 @@
+import itertools
+import json
+import time
+
+import pytest
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from realtime import AvailabilityStream
+
+_channels = itertools.count(1)
+
+
+@pytest.fixture
+def stream(redis_client):
+    return AvailabilityStream(redis_client, channel=f'test-events-{next(_channels)}', heartbeat=0.2)
+
+
+def subscribed(redis_client, channel, count=1, timeout=3):
+    deadline = time.monotonic() + timeout
+    while redis_client.pubsub_numsub(channel)[0][1] < count:
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def next_event(events):
+    """The next event line from a client's stream, skipping keepalives."""
+    for line in events:
+        if not line.startswith(':'):
+            return line
+
+
+def test_published_events_reach_connected_clients(stream, redis_client):
+    events = stream.events()
+    assert next(events) == 'retry: 5000\n\n'
+    assert subscribed(redis_client, stream.channel)
+
+    assert stream.publish({'type': 'availability', 'lot_id': 7, 'available_spots': 3})
+    line = next_event(events)
+    assert line.startswith('event: availability\ndata: ')
+    assert json.loads(line.split('data: ', 1)[1]) == {'type': 'availability', 'lot_id': 7, 'available_spots': 3}
+    events.close()
+
+
+def test_clients_only_get_the_lots_they_follow(stream, redis_client):
+    events = stream.events({2})
+    next(events)
+    assert subscribed(redis_client, stream.channel)
+
+    stream.publish({'type': 'availability', 'lot_id': 1}, {'type': 'lot-deleted', 'lot_id': 2})
+    assert next_event(events).startswith('event: lot-deleted\n')
+    events.close()
+
+
+def test_idle_clients_get_keepalives(stream):
+    events = stream.events()
+    next(events)
+    assert next(events) == ': keepalive\n\n'
+    events.close()
+
+
+def test_a_client_that_falls_behind_gets_one_resync(redis_client):
+    stream = AvailabilityStream(redis_client, channel=f'test-events-{next(_channels)}', heartbeat=0.2, queue_size=2)
+    events = stream.events()
+    next(events)
+    for lot_id in range(3):
+        stream._broadcast({'type': 'availability', 'lot_id': lot_id})
+
+    assert next_event(events) == 'event: resync\ndata: {"type": "resync"}\n\n'
+    assert next(events) == ': keepalive\n\n'
+    events.close()
+
+
+def test_publish_gives_up_while_redis_is_down():
+    down = redis.Redis(port=1, socket_connect_timeout=0.05, retry=Retry(NoBackoff(), 0))
+    stream = AvailabilityStream(down, failure_threshold=1)
+    assert not stream.publish({'type': 'resync'})
+    assert stream.breaker.state == 'open'
+    assert not stream.publish({'type': 'resync'})
+
+
+def test_booking_publishes_the_lot_counters(app, client, make_user, make_lot, redis_client):
+    lot = make_lot(3)
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(app.config['AVAILABILITY_CHANNEL'])
+    # Reads the subscription's confirmation, so it is active before the booking
+    pubsub.get_message(timeout=1)
+    try:
+        _, headers = make_user()
+        assert client.post('/api/user/bookings', headers=headers, json={'lot_id': lot['id']}).status_code == 201
+        deadline = time.monotonic() + 2
+        message = None
+        while message is None and time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=0.1)
+    finally:
+        pubsub.close()
+
+    assert json.loads(message['data']) == {
+        'type': 'availability', 'lot_id': lot['id'],
+        'available_spots': 2, 'occupied_spots': 1, 'number_of_spots': 3
+    }
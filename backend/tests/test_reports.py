@@ -0,0 +1,82 @@
+import itertools
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import celery_app
+import mailer
+from models import db, ParkingSpot, ReserveParkingSpot, User
+from reports import iter_monthly_summaries, month_bounds
+
+# A month of its own per test, well before any other test's bookings
+_months = itertools.count(1)
+
+
+@pytest.fixture
+def bookers(make_user, make_lot):
+    """Seven users with one closed booking each in a fresh month; returns (period, their ids)."""
+    month = next(_months)
+    lot = make_lot(7)
+    spot_ids = [spot_id for (spot_id,) in db.session.query(ParkingSpot.id).filter_by(lot_id=lot['id'])]
+    user_ids = []
+    for index, spot_id in enumerate(spot_ids):
+        user_id, _ = make_user()
+        parked = datetime(2000 + month // 12, month % 12 + 1, 2) + timedelta(days=index)
+        booking = ReserveParkingSpot(spot_id=spot_id, user_id=user_id, parking_timestamp=parked)
+        booking.leaving_timestamp = parked + timedelta(hours=2)
+        booking.parking_cost = 20.0
+        db.session.add(booking)
+        user_ids.append(user_id)
+    db.session.commit()
+    return parked.strftime('%Y-%m'), user_ids
+
+
+def test_summaries_resume_after_a_user(bookers):
+    period, user_ids = bookers
+    assert [s['user_id'] for s in iter_monthly_summaries(period)] == user_ids
+    assert [s['user_id'] for s in iter_monthly_summaries(period, after_user=user_ids[3])] == user_ids[4:]
+
+
+def test_monthly_reports_are_queued_in_waves(app, bookers, monkeypatch):
+    period, user_ids = bookers
+    recipients = []
+    monkeypatch.setattr(mailer, 'send_message', lambda message: recipients.append(message['To']))
+    monkeypatch.setitem(app.config, 'MAIL_REQUIRE_AUTH', False)
+    monkeypatch.setitem(app.config, 'MAIL_BATCH_SIZE', 2)
+    monkeypatch.setitem(app.config, 'MAIL_BATCHES_PER_WAVE', 2)
+    monkeypatch.setattr(celery_app.celery.conf, 'task_always_eager', True)
+    waves = []
+    queue_wave = celery_app.send_monthly_reports.run
+    monkeypatch.setattr(celery_app.send_monthly_reports, 'run', lambda *args: waves.append(args) or queue_wave(*args))
+
+    result = celery_app.send_monthly_reports.delay(period).get()
+
+    assert result.startswith(f'Queued 2 report batches for {period}')
+    # 7 users in batches of 2 is 4 batches: two waves of two, then an empty one that reports the total
+    assert [wave[1:] for wave in waves[1:]] == [(user_ids[3], 4), (user_ids[6], 7)]
+    emails = [email for (email,) in db.session.query(User.email).filter(User.id.in_(user_ids))]
+    assert sorted(recipients) == sorted(emails)
+
+
+def test_month_bounds_follow_the_app_timezone():
+    assert month_bounds('2026-03', ZoneInfo('UTC')) == (datetime(2026, 3, 1), datetime(2026, 4, 1))
+    assert month_bounds('2026-12', ZoneInfo('Asia/Kolkata')) == (datetime(2026, 11, 30, 18, 30), datetime(2026, 12, 31, 18, 30))
+    # London moves to summer time during March
+    assert month_bounds('2026-03', ZoneInfo('Europe/London')) == (datetime(2026, 3, 1), datetime(2026, 3, 31, 23))
+
+
+def test_a_booking_counts_towards_its_local_month(app, make_user, make_lot, monkeypatch):
+    monkeypatch.setitem(app.config, 'APP_TIMEZONE', 'Asia/Kolkata')
+    lot = make_lot(1)
+    user_id, _ = make_user()
+    spot_id = db.session.query(ParkingSpot.id).filter_by(lot_id=lot['id']).scalar()
+    # 01:30 on 1 March 1990 in India, still February in UTC
+    booking = ReserveParkingSpot(spot_id=spot_id, user_id=user_id, parking_timestamp=datetime(1990, 2, 28, 20))
+    booking.leaving_timestamp = datetime(1990, 2, 28, 21)
+    booking.parking_cost = 10.0
+    db.session.add(booking)
+    db.session.commit()
+
+    assert [s['user_id'] for s in iter_monthly_summaries('1990-02')] == []
+    assert [s['user_id'] for s in iter_monthly_summaries('1990-03')] == [user_id]
@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from reservations import SpotIntervals
+
+
+T = datetime(2026, 3, 2)
+
+
+def at(hour):
+    return T + timedelta(hours=hour)
+
+
+def window(hours_ahead, hours=2):
+    start = (datetime.utcnow() + timedelta(hours=hours_ahead)).replace(microsecond=0)
+    return start.isoformat(), (start + timedelta(hours=hours)).isoformat()
+
+
+@pytest.mark.parametrize('payload, error', [
+    ({'lot_id': None}, 'lot_id, start_time and end_time are required'),
+    ({'end_time': ''}, 'lot_id, start_time and end_time are required'),
+    ({'lot_id': 'abc'}, 'lot_id must be an integer'),
+    ({'start_time': 'tomorrow'}, 'start_time and end_time must be ISO 8601 date-times'),
+    ({'end_time': 17}, 'start_time and end_time must be ISO 8601 date-times'),
+    ({'end_time': window(24, hours=-1)[1]}, 'end_time must be after start_time'),
+    ({'end_time': window(24, hours=48)[1]}, 'Reservations can be at most 24 hours long'),
+])
+def test_create_rejects_bad_input_with_field_messages(client, make_user, make_lot, payload, error):
+    _, headers = make_user()
+    start, end = window(24)
+    body = {'lot_id': make_lot(1)['id'], 'start_time': start, 'end_time': end, **payload}
+    body = {field: value for field, value in body.items() if value is not None}
+    response = client.post('/api/user/reservations', headers=headers, json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': error}
+
+
+@pytest.mark.parametrize('query, error', [
+    ('', 'start and end are required'),
+    ('start=soon&end=later', 'start and end must be ISO 8601 date-times'),
+])
+def test_availability_rejects_bad_input_with_field_messages(client, make_lot, query, error):
+    response = client.get(f"/api/parking-lots/{make_lot(1)['id']}/availability?{query}")
+    assert response.status_code == 400
+    assert response.get_json() == {'error': error}
+
+
+def reserve(client, headers, lot, hours_ahead, hours=2):
+    start, end = window(hours_ahead, hours)
+    return client.post('/api/user/reservations', headers=headers,
+                       json={'lot_id': lot['id'], 'start_time': start, 'end_time': end})
+
+
+def test_spot_intervals_treat_touching_windows_as_free():
+    spans = SpotIntervals()
+    spans.add(at(14), at(16))
+    spans.add(at(10), at(12))
+    # Between two windows, bounded by both
+    assert spans.gap(at(12), at(14)) == (at(12), at(14))
+    # Touching one window from either side
+    assert spans.gap(at(8), at(10)) == (None, at(10))
+    assert spans.gap(at(16), at(18)) == (at(16), None)
+
+
+@pytest.mark.parametrize('start, end', [(9, 11), (11, 13), (10, 12), (9, 17), (13, 15), (11.5, 11.75)])
+def test_spot_intervals_reject_any_overlap(start, end):
+    spans = SpotIntervals()
+    spans.add(at(10), at(12))
+    spans.add(at(14), at(16))
+    assert spans.gap(at(start), at(end)) is None
+
+
+def test_overlapping_reservation_for_the_last_spot_is_409(client, make_user, make_lot):
+    lot = make_lot(1)
+    assert reserve(client, make_user()[1], lot, 24).status_code == 201
+
+    response = reserve(client, make_user()[1], lot, 25)
+    assert response.status_code == 409
+    # Starting as the first one ends is fine
+    assert reserve(client, make_user()[1], lot, 26).status_code == 201
+    start, end = window(24, 3)
+    availability = client.get(f"/api/parking-lots/{lot['id']}/availability?start={start}&end={end}").get_json()
+    assert availability['free_spots'] == 0
+
+
+def test_reservations_take_the_tightest_free_spot(client, make_user, make_lot):
+    lot = make_lot(3)
+    first = reserve(client, make_user()[1], lot, 24).get_json()
+    # Right after the first: the same spot fits best, leaving the others wholly free
+    assert reserve(client, make_user()[1], lot, 26).get_json()['spot_id'] == first['spot_id']
+
+
+def test_walk_in_falls_back_to_a_spot_reserved_after_the_buffer(client, make_user, make_lot):
+    lot = make_lot(2)
+    soon = reserve(client, make_user()[1], lot, 0.5).get_json()
+    # Overlaps the first, so every spot is reserved, but starts after the two-hour buffer
+    later = reserve(client, make_user()[1], lot, 2.25).get_json()
+
+    response = client.post('/api/user/bookings', headers=make_user()[1], json={'lot_id': lot['id']})
+    assert response.status_code == 201
+    assert response.get_json()['spot']['id'] == later['spot_id'] != soon['spot_id']
+
+
+def test_walk_in_is_refused_when_every_spot_is_reserved_within_the_buffer(client, make_user, make_lot):
+    lot = make_lot(2)
+    assert reserve(client, make_user()[1], lot, 0.5).status_code == 201
+    assert reserve(client, make_user()[1], lot, 1).status_code == 201
+
+    response = client.post('/api/user/bookings', headers=make_user()[1], json={'lot_id': lot['id']})
+    assert response.status_code == 400
+
+
+def test_check_in_turns_the_reservation_into_a_booking(client, make_user, make_lot):
+    lot = make_lot(2)
+    _, headers = make_user()
+    reservation = reserve(client, headers, lot, 0.1).get_json()
+
+    response = client.post(f"/api/user/reservations/{reservation['id']}/check-in", headers=headers)
+    assert response.status_code == 201
+    body = response.get_json()
+    assert body['reservation']['status'] == 'checked_in'
+    assert body['reservation']['booking_id'] == body['booking']['id']
+    assert body['spot']['id'] == reservation['spot_id']
+    assert body['spot']['status'] == 'O'
+    # It no longer counts as upcoming, and it can't be checked into twice
+    assert client.get('/api/user/reservations', headers=headers).get_json() == []
+    assert client.post(f"/api/user/reservations/{reservation['id']}/check-in", headers=headers).status_code == 404
+    release = client.post(f"/api/user/bookings/{body['booking']['id']}/release", headers=headers)
+    assert release.status_code == 200
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+from models import db, ParkingSpot, ReserveParkingSpot, serialize_reservations
+
+
+def add_closed_bookings(user_id, lots, count):
+    """Spread `count` finished bookings for `user_id` over the given lots' spots."""
+    spot_ids = [spot_id for (spot_id,) in db.session.query(ParkingSpot.id).filter(
+        ParkingSpot.lot_id.in_([lot['id'] for lot in lots])
+    )]
+    start = datetime.utcnow() - timedelta(days=30)
+    for index in range(count):
+        booking = ReserveParkingSpot(
+            spot_id=spot_ids[index % len(spot_ids)],
+            user_id=user_id,
+            parking_timestamp=start + timedelta(hours=index)
+        )
+        booking.leaving_timestamp = booking.parking_timestamp + timedelta(minutes=30)
+        booking.parking_cost = 5.0
+        db.session.add(booking)
+    db.session.commit()
+
+
+def serializer_queries(count_queries, user_id):
+    db.session.expire_all()
+    bookings = ReserveParkingSpot.query.filter_by(user_id=user_id).all()
+    with count_queries() as statements:
+        rows = serialize_reservations(bookings)
+    assert len(rows) == len(bookings)
+    assert all(row['lot_name'] for row in rows)
+    return len(statements)
+
+
+def test_serializer_query_count_does_not_grow_with_rows(make_user, make_lot, count_queries):
+    lots = [make_lot(3) for _ in range(4)]
+    few, _ = make_user()
+    many, _ = make_user()
+    add_closed_bookings(few, lots[:1], 2)
+    add_closed_bookings(many, lots, 60)
+
+    assert serializer_queries(count_queries, few) == serializer_queries(count_queries, many) == 1
+
+
+def test_history_endpoint_query_count_does_not_grow_with_rows(client, make_user, make_lot, count_queries):
+    lots = [make_lot(3) for _ in range(4)]
+    few, few_headers = make_user()
+    many, many_headers = make_user()
+    add_closed_bookings(few, lots[:1], 2)
+    add_closed_bookings(many, lots, 60)
+
+    counts = []
+    for headers, expected in ((few_headers, 2), (many_headers, 60)):
+        db.session.expire_all()
+        with count_queries() as statements:
+            response = client.get('/api/user/bookings/history?limit=100', headers=headers)
+        assert response.status_code == 200
+        assert len(response.get_json()['items']) == expected
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
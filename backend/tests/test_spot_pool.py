@@ -0,0 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import spot_pool
+from models import db, ParkingLot, ParkingSpot, ReserveParkingSpot
+
+
+def assert_counters_match(lot_id):
+    db.session.expire_all()
+    lot = db.session.get(ParkingLot, lot_id)
+    statuses = [status for (status,) in db.session.query(ParkingSpot.status).filter_by(lot_id=lot_id)]
+    assert (lot.available_spots, lot.occupied_spots) == (statuses.count('A'), statuses.count('O'))
+    return lot
+
+
+def run_parallel(app, calls, workers=16):
+    """Run each zero-argument call on its own thread and app context."""
+    def run(call):
+        with app.app_context():
+            try:
+                return call()
+            finally:
+                db.session.remove()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run, calls))
+
+
+def test_parallel_bookings_never_share_a_spot(app, make_user, make_lot):
+    lot = make_lot(20)
+    users = [make_user() for _ in range(60)]
+
+    def book(headers):
+        client = app.test_client()
+        return lambda: client.post('/api/user/bookings', headers=headers, json={'lot_id': lot['id']})
+    responses = run_parallel(app, [book(headers) for _, headers in users])
+
+    booked = [response.get_json()['spot']['id'] for response in responses if response.status_code == 201]
+    assert len(booked) == 20
+    assert len(set(booked)) == 20
+    assert all(response.status_code == 400 for response in responses if response.status_code != 201)
+    lot_row = assert_counters_match(lot['id'])
+    assert lot_row.available_spots == 0
+
+
+def test_parallel_releases_of_one_booking_free_the_spot_once(app, client, make_user, make_lot):
+    lot = make_lot(2)
+    _, headers = make_user()
+    booking = client.post('/api/user/bookings', headers=headers, json={'lot_id': lot['id']}).get_json()['booking']
+
+    def release():
+        return app.test_client().post(f"/api/user/bookings/{booking['id']}/release", headers=headers).status_code
+    statuses = run_parallel(app, [release] * 8)
+
+    assert statuses.count(200) == 1
+    assert set(statuses) <= {200, 404, 409}
+    lot_row = assert_counters_match(lot['id'])
+    assert (lot_row.available_spots, lot_row.occupied_spots) == (2, 0)
+
+
+def test_late_duplicate_release_does_not_free_a_rebooked_spot(app, client, make_user, make_lot):
+    lot = make_lot(1)
+    _, first_headers = make_user()
+    _, second_headers = make_user()
+    first = client.post('/api/user/bookings', headers=first_headers, json={'lot_id': lot['id']}).get_json()['booking']
+    assert client.post(f"/api/user/bookings/{first['id']}/release", headers=first_headers).status_code == 200
+    second = client.post('/api/user/bookings', headers=second_headers, json={'lot_id': lot['id']})
+    assert second.status_code == 201
+
+    # A second release of the first booking that read it before it was closed
+    db.session.expire_all()
+    stale = db.session.get(ReserveParkingSpot, first['id'])
+    closed_at = (stale.leaving_timestamp, stale.parking_cost)
+    spot = db.session.get(ParkingSpot, stale.spot_id)
+    assert not spot_pool.release_spot(stale, spot, datetime.utcnow(), 999.0)
+    db.session.commit()
+
+    db.session.expire_all()
+    assert db.session.get(ParkingSpot, spot.id).status == 'O'
+    closed = db.session.get(ReserveParkingSpot, first['id'])
+    assert (closed.leaving_timestamp, closed.parking_cost) == closed_at
+    assert_counters_match(lot['id'])
+
+
+def test_allocation_restricted_to_candidates_uses_every_candidate(app, make_lot):
+    lot = make_lot(50)
+    spot_ids = [spot_id for (spot_id,) in db.session.query(ParkingSpot.id).filter_by(lot_id=lot['id']).order_by(ParkingSpot.id)]
+    # Every spot is reserved later on, so allocation falls through to the fallback list
+    allowed = spot_ids[::-1]
+
+    claimed = []
+    for _ in range(len(spot_ids)):
+        spot = spot_pool.allocate_spot(lot['id'], 'KA01', avoid=spot_ids, fallback=allowed)
+        assert spot is not None
+        claimed.append(spot.id)
+        db.session.commit()
+    assert claimed == allowed
+    assert spot_pool.allocate_spot(lot['id'], 'KA01', avoid=spot_ids, fallback=allowed) is None
+    assert_counters_match(lot['id'])
+
+
+def test_parallel_allocation_from_one_candidate_list(app, make_lot):
+    lot = make_lot(50)
+    spot_ids = [spot_id for (spot_id,) in db.session.query(ParkingSpot.id).filter_by(lot_id=lot['id'])]
+
+    def allocate():
+        spot = spot_pool.allocate_spot(lot['id'], 'KA01', avoid=spot_ids, fallback=spot_ids)
+        db.session.commit()
+        return spot and spot.id
+    claimed = run_parallel(app, [allocate] * 40)
+
+    assert None not in claimed
+    assert len(set(claimed)) == 40
+    lot_row = assert_counters_match(lot['id'])
+    assert lot_row.available_spots == 10
@@ -0,0 +1,104 @@
+import threading
+
+from sqlalchemy import event
+
+from models import db, init_db, DailyLotStats, ParkingSpot, ReserveParkingSpot
+from stats import rebuild_daily_stats
+from test_serialization import add_closed_bookings
+
+
+def book_all(client, make_user, lot, count):
+    """Park `count` new users in `lot`; returns [(booking id, headers)]."""
+    bookings = []
+    for _ in range(count):
+        _, headers = make_user()
+        response = client.post('/api/user/bookings', headers=headers, json={'lot_id': lot['id']})
+        assert response.status_code == 201
+        bookings.append((response.get_json()['booking']['id'], headers))
+    return bookings
+
+
+def rollup_totals(lot_id):
+    db.session.expire_all()
+    bookings, revenue = db.session.query(
+        db.func.coalesce(db.func.sum(DailyLotStats.bookings), 0),
+        db.func.coalesce(db.func.sum(DailyLotStats.revenue), 0)
+    ).filter(DailyLotStats.lot_id == lot_id).one()
+    return bookings, round(revenue, 2)
+
+
+def closed_totals(lot_id):
+    costs = [cost or 0 for (cost,) in db.session.query(ReserveParkingSpot.parking_cost).join(
+        ParkingSpot, ReserveParkingSpot.spot_id == ParkingSpot.id
+    ).filter(ParkingSpot.lot_id == lot_id, ReserveParkingSpot.leaving_timestamp.isnot(None))]
+    return len(costs), round(sum(costs), 2)
+
+
+def test_release_during_rebuild_is_counted_once_and_not_blocked(app, client, make_user, make_lot):
+    lot = make_lot(3, price=120)
+    bookings = book_all(client, make_user, lot, 3)
+    assert client.post(f'/api/user/bookings/{bookings[0][0]}/release', headers=bookings[0][1]).status_code == 200
+    # Settled history, read before the rollup is locked
+    add_closed_bookings(make_user()[0], [lot], 5)
+
+    # Release another booking while the rebuild is scanning the history
+    statuses = []
+    finished_during_scan = []
+    late_id, late_headers = bookings[1]
+    releaser = threading.Thread(target=lambda: statuses.append(
+        app.test_client().post(f'/api/user/bookings/{late_id}/release', headers=late_headers).status_code
+    ))
+
+    def release_mid_read(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().startswith('SELECT') and 'reserve_parking_spots' in statement and releaser.ident is None:
+            releaser.start()
+            releaser.join(timeout=5)
+            finished_during_scan.append(not releaser.is_alive())
+
+    event.listen(db.engine, 'after_cursor_execute', release_mid_read)
+    try:
+        rebuild_daily_stats([lot['id']])
+    finally:
+        event.remove(db.engine, 'after_cursor_execute', release_mid_read)
+    releaser.join()
+
+    # The release finished during the scan rather than waiting for the rebuild
+    assert finished_during_scan == [True]
+    assert statuses == [200]
+    assert rollup_totals(lot['id']) == closed_totals(lot['id'])
+    assert rollup_totals(lot['id'])[0] == 7
+
+
+def test_init_db_backfills_an_empty_rollup(app, client, make_user, make_lot):
+    lot = make_lot(3, price=60)
+    for booking_id, headers in book_all(client, make_user, lot, 3):
+        assert client.post(f'/api/user/bookings/{booking_id}/release', headers=headers).status_code == 200
+    # What an upgraded database looks like right after migration 0003
+    DailyLotStats.query.delete()
+    db.session.commit()
+
+    init_db()
+
+    assert rollup_totals(lot['id']) == closed_totals(lot['id'])
+    assert rollup_totals(lot['id'])[0] == 3
+
+
+def test_user_summary_is_cached_per_user_until_their_bookings_change(client, make_user, make_lot):
+    lot = make_lot(2, price=60)
+    user_id, headers = make_user()
+    _, other_headers = make_user()
+    response = client.post('/api/user/bookings', headers=headers, json={'lot_id': lot['id']})
+    booking_id = response.get_json()['booking']['id']
+
+    summary = client.get('/api/user/stats/summary', headers=headers).get_json()
+    assert (summary['total_bookings'], summary['active_bookings']) == (1, 1)
+    assert client.get('/api/user/stats/summary', headers=other_headers).get_json()['total_bookings'] == 0
+
+    # Written behind the app's back: the cached summary doesn't see it
+    add_closed_bookings(user_id, [lot], 2)
+    assert client.get('/api/user/stats/summary', headers=headers).get_json()['total_bookings'] == 1
+
+    # A release goes through the app and drops that user's cached summary
+    assert client.post(f'/api/user/bookings/{booking_id}/release', headers=headers).status_code == 200
+    summary = client.get('/api/user/stats/summary', headers=headers).get_json()
+    assert (summary['total_bookings'], summary['active_bookings'], summary['completed_bookings']) == (3, 0, 3)
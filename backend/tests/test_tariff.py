@@ -0,0 +1,139 @@
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import celery_app
+import tariff
+from models import db, DailyLotStats, ParkingLot, ParkingSpot, ReserveParkingSpot
+from tariff import Tariff, parse_rules, reprice_bookings
+
+START = datetime(2026, 3, 2, 8, 0)
+
+
+def stay(tariff_, hours, start=START, tz=timezone.utc):
+    return tariff_.cost(start, start + timedelta(hours=hours), tz)
+
+
+def test_flat_price_without_rules():
+    assert stay(Tariff(None, 25), 2.5) == 62.5
+    assert stay(Tariff(None, 25), 0) == 0.0
+
+
+def test_tier_boundaries():
+    tiered = Tariff({'tiers': [{'hours': 1, 'rate': 40}, {'hours': 3, 'rate': 30}]}, 20)
+    assert stay(tiered, 0.5) == 20
+    assert stay(tiered, 1) == 40
+    assert stay(tiered, 2) == 70
+    assert stay(tiered, 3) == 100
+    # After the last tier the lot's price applies
+    assert stay(tiered, 4) == 120
+
+
+def test_period_rates_apply_by_local_time():
+    night = Tariff({'periods': [{'from': '22:00', 'to': '07:00', 'multiplier': 0.5}]}, 10)
+    evening = datetime(2026, 3, 2, 21, 0)
+    assert stay(night, 1, evening) == 10
+    assert stay(night, 2, evening) == 15
+    # Through the night into the morning: 1h full, 9h half, 1h full
+    assert stay(night, 11, evening) == 65
+    # 21:00 UTC is 02:30 the next morning in India, inside the period
+    assert stay(night, 1, evening, ZoneInfo('Asia/Kolkata')) == 5
+
+
+def test_daily_cap_resets_every_24_hours():
+    capped = Tariff({'daily_cap': 100}, 30)
+    assert stay(capped, 3) == 90
+    assert stay(capped, 5) == 100
+    assert stay(capped, 26) == 160
+
+
+def test_invalid_rules_are_rejected():
+    with pytest.raises(ValueError):
+        parse_rules({'tiers': [{'hours': 2, 'rate': 10}, {'hours': 1, 'rate': 5}]})
+    with pytest.raises(ValueError):
+        parse_rules({'periods': [{'from': '25:00', 'to': '07:00', 'multiplier': 1}]})
+    with pytest.raises(ValueError):
+        parse_rules('{"daily_cap": -1}')
+
+
+@pytest.mark.parametrize('tz', [timezone.utc, ZoneInfo('Asia/Kolkata'), ZoneInfo('Europe/London')])
+def test_bulk_costs_match_scalar_cost(tz):
+    rules = {
+        'tiers': [{'hours': 1, 'rate': 40}, {'hours': 3, 'rate': 30}],
+        'periods': [{'from': '22:00', 'to': '06:00', 'multiplier': 0.5}, {'from': '12:00', 'to': '14:00', 'multiplier': 1.5}],
+        'daily_cap': 250
+    }
+    compiled = Tariff(rules, 20)
+    rng = random.Random(7)
+    # Spans the March DST change in London
+    starts = [datetime(2026, 3, 20) + timedelta(minutes=rng.randrange(0, 20 * 24 * 60)) for _ in range(500)]
+    ends = [start + timedelta(minutes=rng.randrange(0, 3 * 24 * 60)) for start in starts]
+    assert compiled.costs(starts, ends, tz) == [compiled.cost(s, e, tz) for s, e in zip(starts, ends)]
+
+
+def test_bulk_costs_without_numpy(monkeypatch):
+    compiled = Tariff({'daily_cap': 100}, 30)
+    monkeypatch.setattr(tariff, 'np', None)
+    assert compiled.costs([START], [START + timedelta(hours=5)]) == [100]
+
+
+def add_closed_bookings(user_id, lot_id, hours, start):
+    """One closed booking per entry of `hours`, a day apart from `start`."""
+    spot_id = db.session.query(ParkingSpot.id).filter_by(lot_id=lot_id).first()[0]
+    ids = []
+    for index, length in enumerate(hours):
+        parked = start + timedelta(days=index)
+        booking = ReserveParkingSpot(spot_id=spot_id, user_id=user_id, parking_timestamp=parked)
+        booking.leaving_timestamp = parked + timedelta(hours=length)
+        booking.parking_cost = 1.0
+        db.session.add(booking)
+        db.session.flush()
+        ids.append(booking.id)
+    db.session.commit()
+    return ids
+
+
+def costs_of(ids):
+    db.session.expire_all()
+    return [db.session.get(ReserveParkingSpot, booking_id).parking_cost for booking_id in ids]
+
+
+def test_reprice_bookings_updates_changed_costs(app, make_user, make_lot):
+    lot = make_lot(1, price=10)
+    user_id, _ = make_user()
+    ids = add_closed_bookings(user_id, lot['id'], [1, 2, 3], datetime(2026, 1, 5, 9))
+
+    users = reprice_bookings(Tariff(None, 10), lot['id'], timezone.utc)
+    db.session.commit()
+
+    assert costs_of(ids) == [10, 20, 30]
+    assert users == {user_id}
+    # Nothing left to change the second time
+    assert reprice_bookings(Tariff(None, 10), lot['id'], timezone.utc) == set()
+
+
+def test_reprice_task_updates_costs_and_rollup_from_since(app, client, admin_headers, make_user, make_lot):
+    lot = make_lot(1, price=10)
+    ids = add_closed_bookings(make_user()[0], lot['id'], [1, 2, 3], datetime(2026, 1, 5, 9))
+    celery_app.reprice_lot_bookings(lot['id'])
+
+    response = client.put(f"/api/admin/parking-lots/{lot['id']}", headers=admin_headers,
+                          json={'price': 50, 'tariff': {'daily_cap': 60}})
+    assert response.status_code == 200
+    # Marks the first day's rollup row, which a rebuild from the second day must leave alone
+    DailyLotStats.query.filter_by(lot_id=lot['id'], day=datetime(2026, 1, 5).date()).update({'revenue': 999})
+    db.session.commit()
+    # Only bookings parked from the second day on are repriced
+    celery_app.reprice_lot_bookings(lot['id'], datetime(2026, 1, 6).isoformat())
+
+    assert costs_of(ids) == [10, 60, 60]
+    rollup = dict(db.session.query(DailyLotStats.day, DailyLotStats.revenue).filter_by(lot_id=lot['id']))
+    assert rollup == {
+        datetime(2026, 1, 5).date(): 999,
+        datetime(2026, 1, 6).date(): 60,
+        datetime(2026, 1, 7).date(): 60
+    }
+    assert json.loads(db.session.get(ParkingLot, lot['id']).tariff) == {'daily_cap': 60}
@@ -1,6 +1,11 @@
+// Last ETag and body per GET url, replayed when the server answers 304
+const etagCache = new Map()
+const ETAG_CACHE_SIZE = 100
+
 // Fetch API wrapper with automatic token management
 async function fetchWithAuth(url, options = {}) {
   const token = localStorage.getItem('access_token')
+  const method = (options.method || 'GET').toUpperCase()
   
   const headers = {
     'Content-Type': 'application/json',
@@ -11,6 +16,11 @@ async function fetchWithAuth(url, options = {}) {
     headers.Authorization = `Bearer ${token}`
   }
   
+  const cached = method === 'GET' ? etagCache.get(url) : undefined
+  if (cached) {
+    headers['If-None-Match'] = cached.etag
+  }
+  
   let response = await fetch(url, { ...options, headers })
   
   // Handle token refresh on 401
@@ -45,9 +55,42 @@ async function fetchWithAuth(url, options = {}) {
     }
   }
   
+  return method === 'GET' ? withEtagCache(url, response) : response
+}
+
+// Turn a 304 back into the cached 200 and remember new ETagged responses
+async function withEtagCache(url, response) {
+  const cached = etagCache.get(url)
+  if (response.status === 304 && cached) {
+    return new Response(cached.body, { status: 200, headers: cached.headers })
+  }
+  
+  const etag = response.headers.get('ETag')
+  if (!response.ok || !etag) {
+    etagCache.delete(url)
+    return response
+  }
+  
+  etagCache.delete(url)
+  etagCache.set(url, {
+    etag,
+    body: await response.clone().text(),
+    headers: { 'Content-Type': response.headers.get('Content-Type') || 'application/json', ETag: etag }
+  })
+  if (etagCache.size > ETAG_CACHE_SIZE) {
+    etagCache.delete(etagCache.keys().next().value)
+  }
   return response
 }
 
+// Append non-empty params as a query string
+function withQuery(url, params = {}) {
+  const query = new URLSearchParams(
+    Object.entries(params).filter(([, value]) => value !== undefined && value !== null && value !== '')
+  ).toString()
+  return query ? `${url}?${query}` : url
+}
+
 // Helper to handle JSON responses
 async function handleResponse(response) {
   if (!response.ok) {
@@ -67,6 +110,7 @@ async function handleResponse(response) {
 // Auth API
 export const authApi = {
   login: async (username, password, role = 'user') => {
+    etagCache.clear()
     const response = await fetch('/api/auth/login', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
@@ -85,6 +129,7 @@ export const authApi = {
   },
   
   logout: async () => {
+    etagCache.clear()
     const response = await fetchWithAuth('/api/auth/logout', { method: 'POST' })
     return handleResponse(response)
   },
@@ -101,13 +146,13 @@ export const authApi = {
 
 // Admin API
 export const adminApi = {
-  getDashboard: async () => {
-    const response = await fetchWithAuth('/api/admin/dashboard')
+  getDashboard: async (filters = {}) => {
+    const response = await fetchWithAuth(withQuery('/api/admin/dashboard', filters))
     return handleResponse(response)
   },
   
-  getUsers: async () => {
-    const response = await fetchWithAuth('/api/admin/users')
+  getUsers: async ({ limit, cursor } = {}) => {
+    const response = await fetchWithAuth(withQuery('/api/admin/users', { limit, cursor }))
     return handleResponse(response)
   },
   
@@ -142,13 +187,41 @@ export const adminApi = {
     return handleResponse(response)
   },
   
+  // Recompute closed, unpaid bookings with the lot's current tariff
+  repriceParkingLot: async (id, since) => {
+    const response = await fetchWithAuth(`/api/admin/parking-lots/${id}/reprice`, {
+      method: 'POST',
+      body: JSON.stringify(since ? { since } : {})
+    })
+    return handleResponse(response)
+  },
+  
   getLotSpots: async (id) => {
     const response = await fetchWithAuth(`/api/admin/parking-lots/${id}/spots`)
     return handleResponse(response)
   },
   
-  getStatsSummary: async () => {
-    const response = await fetchWithAuth('/api/admin/stats/summary')
+  getStatsSummary: async (filters = {}) => {
+    const response = await fetchWithAuth(withQuery('/api/admin/stats/summary', filters))
+    return handleResponse(response)
+  },
+  
+  // Every reservation across all users, for offline analysis
+  triggerExport: async (format = 'csv') => {
+    const response = await fetchWithAuth('/api/admin/export', {
+      method: 'POST',
+      body: JSON.stringify({ format })
+    })
+    return handleResponse(response)
+  },
+  
+  getExportStatus: async (jobId, { wait, status, rows } = {}) => {
+    const response = await fetchWithAuth(withQuery(`/api/admin/export/${jobId}`, { wait, status, rows }))
+    return handleResponse(response)
+  },
+  
+  downloadExport: async (jobId) => {
+    const response = await fetchWithAuth(`/api/admin/export/${jobId}/download`)
     return handleResponse(response)
   }
 }
@@ -188,8 +261,8 @@ export const userApi = {
     return handleResponse(response)
   },
   
-  getBookingHistory: async () => {
-    const response = await fetchWithAuth('/api/user/bookings/history')
+  getBookingHistory: async ({ limit, cursor } = {}) => {
+    const response = await fetchWithAuth(withQuery('/api/user/bookings/history', { limit, cursor }))
     return handleResponse(response)
   },
   
@@ -198,13 +271,17 @@ export const userApi = {
     return handleResponse(response)
   },
   
-  triggerExport: async () => {
-    const response = await fetchWithAuth('/api/user/export', { method: 'POST' })
+  triggerExport: async (format = 'csv') => {
+    const response = await fetchWithAuth('/api/user/export', {
+      method: 'POST',
+      body: JSON.stringify({ format })
+    })
     return handleResponse(response)
   },
   
-  getExportStatus: async (jobId) => {
-    const response = await fetchWithAuth(`/api/user/export/${jobId}`)
+  // With `wait`, the server holds the request until status/rows change
+  getExportStatus: async (jobId, { wait, status, rows } = {}) => {
+    const response = await fetchWithAuth(withQuery(`/api/user/export/${jobId}`, { wait, status, rows }))
     return handleResponse(response)
   },
   
@@ -224,13 +301,53 @@ export const userApi = {
   getPaymentHistory: async () => {
     const response = await fetchWithAuth('/api/user/payments/history')
     return handleResponse(response)
+  },
+  
+  // { lot_id, start_time, end_time, vehicle_number } with ISO 8601 times
+  createReservation: async (data) => {
+    const response = await fetchWithAuth('/api/user/reservations', {
+      method: 'POST',
+      body: JSON.stringify(data)
+    })
+    return handleResponse(response)
+  },
+  
+  getReservations: async () => {
+    const response = await fetchWithAuth('/api/user/reservations')
+    return handleResponse(response)
+  },
+  
+  cancelReservation: async (reservationId) => {
+    const response = await fetchWithAuth(`/api/user/reservations/${reservationId}/cancel`, {
+      method: 'POST'
+    })
+    return handleResponse(response)
+  },
+  
+  checkInReservation: async (reservationId) => {
+    const response = await fetchWithAuth(`/api/user/reservations/${reservationId}/check-in`, {
+      method: 'POST'
+    })
+    return handleResponse(response)
   }
 }
 
 // Shared API
 export const sharedApi = {
   getParkingLots: async () => {
-    const response = await fetch('/api/parking-lots')
+    const response = await fetchWithAuth('/api/parking-lots')
+    return handleResponse(response)
+  },
+  
+  // { q, pin_code, nearby, min_price, max_price, available, limit, cursor }
+  searchParkingLots: async (params = {}) => {
+    const response = await fetchWithAuth(withQuery('/api/parking-lots/search', params))
+    return handleResponse(response)
+  },
+  
+  // Free spots in a lot for the whole start..end window
+  getLotAvailability: async (lotId, start, end) => {
+    const response = await fetchWithAuth(withQuery(`/api/parking-lots/${lotId}/availability`, { start, end }))
     return handleResponse(response)
   },
   
@@ -239,3 +356,107 @@ export const sharedApi = {
     return handleResponse(response)
   }
 }
+
+const LOT_EVENT_TYPES = ['availability', 'lot', 'lot-deleted', 'resync']
+
+// Follow live lot events. `handlers` maps event types to callbacks; 'resync'
+// means events may have been missed (including while the connection was
+// down) and the lot list should be refetched. Returns a function that
+// closes the stream.
+export function subscribeAvailability(handlers, { lotIds = [] } = {}) {
+  const query = new URLSearchParams(lotIds.map(id => ['lot_id', id])).toString()
+  const source = new EventSource(query ? `/api/stream/availability?${query}` : '/api/stream/availability')
+  for (const type of LOT_EVENT_TYPES) {
+    if (handlers[type]) {
+      source.addEventListener(type, (event) => handlers[type](JSON.parse(event.data)))
+    }
+  }
+  
+  let dropped = false
+  source.onerror = () => { dropped = true }
+  source.onopen = () => {
+    if (dropped && handlers.resync) {
+      handlers.resync({ type: 'resync' })
+    }
+    dropped = false
+  }
+  return () => source.close()
+}
+
+// Apply one 'availability', 'lot' or 'lot-deleted' event to a list of lots
+export function applyLotEvent(lots, event) {
+  switch (event.type) {
+    case 'availability':
+      return lots.map(lot => lot.id === event.lot_id ? {
+        ...lot,
+        available_spots: event.available_spots,
+        occupied_spots: event.occupied_spots,
+        number_of_spots: event.number_of_spots
+      } : lot)
+    case 'lot':
+      return lots.some(lot => lot.id === event.lot_id)
+        ? lots.map(lot => lot.id === event.lot_id ? { ...lot, ...event.lot } : lot)
+        : [...lots, event.lot]
+    case 'lot-deleted':
+      return lots.filter(lot => lot.id !== event.lot_id)
+    default:
+      return lots
+  }
+}
+
+export const EXPORT_FORMATS = [
+  { value: 'csv', label: 'CSV', extension: '.csv' },
+  { value: 'csv.gz', label: 'CSV (gzip)', extension: '.csv.gz' },
+  { value: 'jsonl', label: 'JSON Lines', extension: '.jsonl' },
+  { value: 'parquet', label: 'Parquet', extension: '.parquet' }
+]
+
+// What every server can write; Parquet needs pyarrow installed on the server
+export const DEFAULT_EXPORT_FORMATS = EXPORT_FORMATS.filter(f => f.value !== 'parquet')
+
+let exportFormatsRequest = null
+
+// The EXPORT_FORMATS this server supports, asked for once per page load
+export function getExportFormats() {
+  if (!exportFormatsRequest) {
+    exportFormatsRequest = fetchWithAuth('/api/export/formats')
+      .then(handleResponse)
+      .then(({ formats }) => EXPORT_FORMATS.filter(f => formats.includes(f.value)))
+      .catch(() => {
+        exportFormatsRequest = null
+        return DEFAULT_EXPORT_FORMATS
+      })
+  }
+  return exportFormatsRequest
+}
+
+// Queue an export through `api` (userApi or adminApi), long-poll it until it
+// finishes and save the file. Each status request returns as soon as the job
+// moves on, so there is no fixed polling interval.
+export async function runExport(api, { format = 'csv', filename = 'export', onProgress } = {}) {
+  let { job } = await api.triggerExport(format)
+  const deadline = Date.now() + 30 * 60 * 1000
+  while (job.status === 'pending' || job.status === 'running') {
+    if (Date.now() > deadline) {
+      throw new Error('Export timeout')
+    }
+    job = await api.getExportStatus(job.id, {
+      wait: 25,
+      status: job.status,
+      rows: job.progress_rows
+    })
+    if (onProgress) onProgress(job.progress)
+  }
+  if (job.status !== 'completed') {
+    throw new Error('Export failed')
+  }
+  
+  const blob = await api.downloadExport(job.id)
+  const { extension } = EXPORT_FORMATS.find(f => f.value === format)
+  const url = window.URL.createObjectURL(blob)
+  const a = document.createElement('a')
+  a.href = url
+  a.download = filename + extension
+  a.click()
+  window.URL.revokeObjectURL(url)
+}